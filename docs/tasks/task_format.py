@@ -33,6 +33,7 @@ class Task(TypedDict):
     blockers: NotRequired[List[str]] # ["{task_id}.{feature_id}","{task_id}"]
     rejection: NotRequired[str]
     featureIdToDisplayIndex: Dict[str,int]
+    revision: NotRequired[int] # bumped on every write, used to merge concurrent writers
 
 class ProjectRequirement(TypedDict):
     id: int
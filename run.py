@@ -4,69 +4,107 @@ import shutil
 import subprocess
 import tempfile
 import traceback
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
 
+from scripts.workspace_cache import cached_workspace, is_git_repo, sync_worktree
+
 IGNORE_PATTERNS = shutil.ignore_patterns('venv', '__pycache__', '*.pyc', '.idea')
+WORKSPACE_MODES = ['copy', 'worktree']
+
+
+@contextmanager
+def copied_workspace(project_root: Path):
+    """A fresh temporary copy of the whole repository, removed afterwards."""
+    with tempfile.TemporaryDirectory() as temp_dir_str:
+        workspace_path = Path(temp_dir_str) / "workspace"
+        print(f"Copying repository from '{project_root}' to temporary workspace: '{workspace_path}'")
+        shutil.copytree(project_root, workspace_path, ignore=IGNORE_PATTERNS)
+        yield workspace_path
+
+
+@contextmanager
+def worktree_workspace(project_root: Path, project_dir: str | None):
+    """
+    A cached git worktree of the repository (see scripts/workspace_cache.py), so startup cost scales with
+    local changes instead of repository size. A child project that is its own git repository gets a
+    worktree of that repository inside the workspace.
+    """
+    with cached_workspace(project_root) as workspace_path:
+        if project_dir:
+            child_source = (project_root / project_dir).resolve()
+            if is_git_repo(child_source):
+                sync_worktree(child_source, workspace_path / project_dir)
+        yield workspace_path
 
 def main():
     """
     Main launcher for the AI agent. It must be run from the project's root directory.
-    This creates a temporary copy and executes scripts/run_local_agent.py in it.
+    This creates an isolated workspace (a temporary copy, or with --workspace worktree a cached git worktree)
+    and executes scripts/run_local_agent.py in it.
     """
     parser = argparse.ArgumentParser(description="Launcher for the autonomous AI agent.")
     parser.add_argument("--model", type=str, default="gpt-4-turbo-preview", help="LLM model name.")
-    parser.add_argument("--agent", type=str, required=False, choices=['developer', 'tester', 'planner', 'contexter', 'speccer'], help="Agent persona.")
+    parser.add_argument("--agent", type=str, required=False, choices=['developer', 'tester', 'planner', 'contexter', 'speccer', 'pipeline'], help="Agent persona, or 'pipeline' to run contexter, planner, tester and developer over the task at once.")
     parser.add_argument("--task", type=str, required=False, help="Specify a task ID to work on.")
     parser.add_argument("--project-dir", type=str, help="Optional: Target child project directory.")
+    parser.add_argument("--workspace", type=str, default="copy", choices=WORKSPACE_MODES, help="Optional: 'copy' the repository to a temporary directory (default) or reuse a cached git 'worktree'.")
     args = parser.parse_args()
 
     project_root = Path(__file__).resolve().parent
 
-    with tempfile.TemporaryDirectory() as temp_dir_str:
-        temp_dir = Path(temp_dir_str)
-        workspace_path = temp_dir / "workspace"
-
-        print(f"Copying repository from '{project_root}' to temporary workspace: '{workspace_path}'")
+    if args.workspace == "worktree":
+        workspace = worktree_workspace(project_root, args.project_dir)
+    else:
+        workspace = copied_workspace(project_root)
 
+    with ExitStack() as stack:
         try:
-            shutil.copytree(project_root, workspace_path, ignore=IGNORE_PATTERNS)
+            workspace_path = stack.enter_context(workspace)
         except Exception as e:
-            print(f"FATAL: Failed to copy repository to temporary directory: {e}")
+            print(f"FATAL: Failed to prepare the agent workspace: {e}")
             print("\n--- Full Stack Trace ---")
             traceback.print_exc()
             print("------------------------\n")
             return
+        run_orchestrator(workspace_path, args)
 
-        orchestrator_script_path = workspace_path / "scripts" / "run_local_agent.py"
-
-        command = [
-            "python3",
-            str(orchestrator_script_path),
-        ]
-        
-        if args.agent:
-            command.extend(["--agent", args.agent])
-        if args.model:
-            command.extend(["--model", args.model])
-        if args.task:
-            command.extend(["--task", str(args.task)])
-        if args.project_dir:
-            project_dir = workspace_path / args.project_dir
-            command.extend(["--project-dir", str(project_dir)])
-
-        print(f"Executing orchestrator: {' '.join(command)}")
+    if args.workspace == "worktree":
+        print("\n--- Agent run finished. Cached workspace kept for the next run. ---")
+    else:
+        print("\n--- Agent run finished. Temporary directory cleaned up. ---")
 
-        try:
-            subprocess.run(command, cwd=workspace_path, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"\n--- An error occurred while running the agent orchestrator: {e} ---")
-            print("\n--- Full Stack Trace ---")
-            traceback.print_exc()
-            print("------------------------\n")
-        except KeyboardInterrupt:
-            print("\n--- Agent run interrupted by user. ---")
 
-    print("\n--- Agent run finished. Temporary directory cleaned up. ---")
+def run_orchestrator(workspace_path: Path, args: argparse.Namespace):
+    """Executes scripts/run_local_agent.py inside the prepared workspace."""
+    orchestrator_script_path = workspace_path / "scripts" / "run_local_agent.py"
+
+    command = [
+        "python3",
+        str(orchestrator_script_path),
+    ]
+    
+    if args.agent:
+        command.extend(["--agent", args.agent])
+    if args.model:
+        command.extend(["--model", args.model])
+    if args.task:
+        command.extend(["--task", str(args.task)])
+    if args.project_dir:
+        project_dir = workspace_path / args.project_dir
+        command.extend(["--project-dir", str(project_dir)])
+
+    print(f"Executing orchestrator: {' '.join(command)}")
+
+    try:
+        subprocess.run(command, cwd=workspace_path, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"\n--- An error occurred while running the agent orchestrator: {e} ---")
+        print("\n--- Full Stack Trace ---")
+        traceback.print_exc()
+        print("------------------------\n")
+    except KeyboardInterrupt:
+        print("\n--- Agent run interrupted by user. ---")
 
 if __name__ == "__main__":
     main()
@@ -42,6 +42,9 @@ yarn.lock
 *~
 .DS_Store
 
+# TheFactory working data (indexes, caches)
+.thefactory/
+
 # Temporary files
 *.tmp
 *.bak
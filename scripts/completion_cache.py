@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# off: no caching. record: serve hits from the cache and store every new completion.
+# replay: serve only from the cache; a miss is an error (offline, fully reproducible runs).
+CACHE_MODES = ("off", "record", "replay")
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "thefactory" / "completions"
+DEFAULT_MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Eviction trims the cache to this fraction of its limit, so it does not run on every write.
+EVICTION_TARGET_RATIO = 0.9
+
+
+class CacheMiss(RuntimeError):
+    """Raised in replay mode when a request has no recorded completion."""
+
+
+class CompletionCache:
+    """
+    Content-addressed, on-disk cache of LLM completions.
+
+    Entries are keyed on the sha256 of (model, messages, response_format) and stored as
+    <cache_dir>/<key[:2]>/<key>.json. Hits refresh the entry's mtime, and when the cache grows past
+    `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str | Path, mode: str = "record", max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown completion cache mode '{mode}'. Expected one of {CACHE_MODES}.")
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, Any]], response_format: Any = None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "response_format": response_format},
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            if self.mode == "replay":
+                raise CacheMiss(f"No recorded completion for this request (key {key}) in {self.cache_dir}; strict replay mode is on.")
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        if self.mode != "record":
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{key[:8]}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += path.stat().st_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def report(self) -> str:
+        return f"Completion cache ({self.mode}, {self.cache_dir}): {self.hits} hits / {self.misses} misses."
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, st.st_size, st.st_mtime_ns
+
+    def _evict(self):
+        target = int(self.max_bytes * EVICTION_TARGET_RATIO)
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                path.unlink()
+                size -= entry_size
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+
+_CACHE: Optional[CompletionCache] = None
+_CACHE_CONFIG = None
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """
+    The process-wide cache configured through FACTORY_LLM_CACHE (off | record | replay),
+    FACTORY_LLM_CACHE_DIR and FACTORY_LLM_CACHE_MAX_BYTES, or None when caching is off.
+    """
+    global _CACHE, _CACHE_CONFIG
+    config = (
+        os.getenv("FACTORY_LLM_CACHE", "off"),
+        os.getenv("FACTORY_LLM_CACHE_DIR", str(DEFAULT_CACHE_DIR)),
+        int(os.getenv("FACTORY_LLM_CACHE_MAX_BYTES", DEFAULT_MAX_CACHE_BYTES)),
+    )
+    if config != _CACHE_CONFIG:
+        mode, cache_dir, max_bytes = config
+        _CACHE = None if mode == "off" else CompletionCache(cache_dir, mode, max_bytes)
+        _CACHE_CONFIG = config
+    return _CACHE
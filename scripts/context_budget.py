@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Lazy-safe import for litellm's tokenizer-aware counter
+try:
+    from litellm import token_counter
+except Exception:
+    token_counter = None
+
+from scripts.llm_client import message_text
+
+DEFAULT_MAX_CONTEXT_TOKENS = 120_000
+# The newest messages are never compacted, so the agent always sees its latest results in full.
+KEEP_RECENT_MESSAGES = 6
+# How much of each old tool result survives compaction.
+COMPACTED_RESULT_CHARS = 300
+TOOL_RESULTS_HEADER = "--- TOOL RESULTS ---\n"
+UNCHANGED_READ_MARKER = "[Unchanged since it was last read in this conversation; see the earlier read_files result.]"
+
+
+def get_max_context_tokens() -> int:
+    """Token ceiling for one agent conversation (FACTORY_MAX_CONTEXT_TOKENS, also --max-context-tokens)."""
+    try:
+        return int(os.getenv("FACTORY_MAX_CONTEXT_TOKENS", DEFAULT_MAX_CONTEXT_TOKENS))
+    except ValueError:
+        return DEFAULT_MAX_CONTEXT_TOKENS
+
+
+def count_tokens(model: str, text: str) -> int:
+    if token_counter is not None:
+        try:
+            return token_counter(model=model, text=text)
+        except Exception:
+            pass
+    # Rough fallback: ~4 characters per token
+    return len(text) // 4 + 1
+
+
+class _TrackedMessage:
+    __slots__ = ("content", "tokens", "original_tokens", "parts", "compacted")
+
+    def __init__(self, content: str, tokens: int, original_tokens: int, parts: Optional[List[Tuple[str, str]]] = None):
+        self.content = content
+        self.tokens = tokens
+        self.original_tokens = original_tokens
+        self.parts = parts
+        self.compacted = False
+
+
+class ContextBudgeter:
+    """
+    Keeps an agent conversation under a token ceiling.
+
+    - Counts tokens per message once (cached until the message changes).
+    - Dedupes read_files payloads: a file whose content is identical to what an earlier, still intact
+      message already delivered is replaced by a short marker.
+    - When the conversation exceeds the ceiling, the oldest tool results (then the oldest assistant turns)
+      outside the recent window are compacted to a short head plus a note on what was omitted.
+    The first `pinned` messages (the prompt) are never touched. report() summarises the savings.
+    """
+
+    def __init__(self, model: str, max_tokens: Optional[int] = None, keep_recent: int = KEEP_RECENT_MESSAGES, pinned: int = 1):
+        self.model = model
+        self.max_tokens = max_tokens or get_max_context_tokens()
+        self.keep_recent = keep_recent
+        self.pinned = pinned
+        self._tracked: Dict[int, _TrackedMessage] = {}
+        # path -> (content hash, index of the message that delivered it)
+        self._delivered_reads: Dict[str, Tuple[str, int]] = {}
+        self.turns = 0
+        self.sent_tokens = 0
+        self.uncompacted_tokens = 0
+        self.peak_tokens = 0
+        self.dedupe_saved_tokens = 0
+
+    # --- Building tool results ---
+
+    def dedupe_read_files(self, result: str, message_index: int) -> str:
+        """Replaces file contents already delivered by an intact earlier message with a marker."""
+        try:
+            files = json.loads(result)
+        except (TypeError, json.JSONDecodeError):
+            return result
+        if not isinstance(files, dict):
+            return result
+
+        changed = False
+        for path, content in files.items():
+            if not isinstance(content, str):
+                continue
+            digest = hashlib.sha1(content.encode("utf-8", errors="ignore")).hexdigest()
+            previous = self._delivered_reads.get(path)
+            if previous and previous[0] == digest and previous[1] != message_index:
+                files[path] = UNCHANGED_READ_MARKER
+                changed = True
+            else:
+                self._delivered_reads[path] = (digest, message_index)
+        return json.dumps(files, indent=0) if changed else result
+
+    def tool_results_message(self, message_index: int, outputs: List[Tuple[str, str]], original_text: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Builds the user message carrying a turn's tool results. `outputs` is [(tool_name, output)], in call
+        order; `original_text` is the un-deduped rendering, used to account for dedupe savings.
+        """
+        content = TOOL_RESULTS_HEADER + "\n".join(output for _, output in outputs)
+        tokens = count_tokens(self.model, content)
+        original_tokens = count_tokens(self.model, TOOL_RESULTS_HEADER + original_text) if original_text else tokens
+        self.dedupe_saved_tokens += max(0, original_tokens - tokens)
+        self._tracked[message_index] = _TrackedMessage(content, tokens, original_tokens, parts=list(outputs))
+        return {"role": "user", "content": content}
+
+    # --- Budget enforcement ---
+
+    def fit(self, messages: List[Dict[str, Any]]) -> int:
+        """Compacts `messages` in place until they fit the ceiling (or nothing is left to compact). Returns the token total."""
+        total = sum(self._track(i, m).tokens for i, m in enumerate(messages))
+        uncompacted = sum(self._tracked[i].original_tokens for i in range(len(messages)))
+
+        compactable_end = max(self.pinned, len(messages) - self.keep_recent)
+        for roles in (("user",), ("assistant",)):
+            i = self.pinned
+            while total > self.max_tokens and i < compactable_end:
+                message = messages[i]
+                tracked = self._tracked[i]
+                if message.get("role") in roles and not tracked.compacted:
+                    total -= self._compact(i, message)
+                i += 1
+
+        if total > self.max_tokens:
+            print(f"Warning: Conversation uses {total} tokens, above the {self.max_tokens} token budget, with nothing left to compact.")
+
+        self.turns += 1
+        self.sent_tokens += total
+        self.uncompacted_tokens += uncompacted
+        self.peak_tokens = max(self.peak_tokens, total)
+        return total
+
+    def report(self) -> str:
+        saved = self.uncompacted_tokens - self.sent_tokens
+        pct = (100.0 * saved / self.uncompacted_tokens) if self.uncompacted_tokens else 0.0
+        return (
+            f"Context budget: sent {self.sent_tokens} prompt tokens over {self.turns} turns "
+            f"({self.uncompacted_tokens} without compaction/dedupe, {saved} saved, {pct:.1f}%). "
+            f"Peak {self.peak_tokens}/{self.max_tokens} tokens; read_files dedupe saved {self.dedupe_saved_tokens}."
+        )
+
+    def _track(self, index: int, message: Dict[str, Any]) -> _TrackedMessage:
+        content = message_text(message)
+        tracked = self._tracked.get(index)
+        if tracked is None:
+            tokens = count_tokens(self.model, content)
+            tracked = _TrackedMessage(content, tokens, tokens)
+            self._tracked[index] = tracked
+        elif tracked.content != content:
+            tracked.content = content
+            tracked.tokens = count_tokens(self.model, content)
+        return tracked
+
+    def _compact(self, index: int, message: Dict[str, Any]) -> int:
+        """Compacts one message in place and returns the number of tokens saved."""
+        tracked = self._tracked[index]
+        if tracked.parts is not None:
+            content = TOOL_RESULTS_HEADER + "\n".join(_compact_text(output, f"result of {name}") for name, output in tracked.parts)
+        else:
+            content = _compact_text(tracked.content, "earlier response")
+        if len(content) >= len(tracked.content):
+            tracked.compacted = True
+            return 0
+
+        message["content"] = content
+        before = tracked.tokens
+        tracked.content = content
+        tracked.tokens = count_tokens(self.model, content)
+        tracked.compacted = True
+        # Reads delivered by this message are gone: the next identical read must be delivered in full.
+        self._delivered_reads = {path: entry for path, entry in self._delivered_reads.items() if entry[1] != index}
+        return before - tracked.tokens
+
+
+def _compact_text(text: str, what: str) -> str:
+    if len(text) <= COMPACTED_RESULT_CHARS:
+        return text
+    omitted = len(text) - COMPACTED_RESULT_CHARS
+    return f"{text[:COMPACTED_RESULT_CHARS]}\n[... {omitted} more characters of this {what} were dropped to stay within the context budget; repeat the call if you need them ...]"
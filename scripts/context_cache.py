@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+# (mtime_ns, size) of a path, or None when it does not exist
+Stamp = Optional[Tuple[int, int]]
+
+
+def _stamp(path: Path) -> Stamp:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _digest(value: Any) -> str:
+    if isinstance(value, list):
+        value = "\n".join(str(v) for v in value)
+    return hashlib.sha1(str(value).encode("utf-8", errors="surrogateescape")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("resolved", "stamp", "digest", "fragment")
+
+    def __init__(self, resolved: Path, stamp: Stamp, digest: str, fragment: str):
+        self.resolved = resolved
+        self.stamp = stamp
+        self.digest = digest
+        self.fragment = fragment
+
+
+class ContextCache:
+    """
+    Rendered prompt context for one project root, kept for the orchestrator's lifetime.
+
+    render() produces exactly what read_context_files() would, but from per-path JSON fragments: a path is
+    only re-read when it was invalidated (write_file/rename_file/delete_file report the paths they touch)
+    or its mtime/size changed, and only re-encoded when its content hash changed. Features that share
+    context files therefore cost one stat per file instead of a read and an encode.
+    read_text() does the same for whole files outside the project, like the agent docs.
+    """
+
+    def __init__(self, root: str | Path, read_path: Callable[[str], Tuple[Any, int]]):
+        self.root = Path(root).resolve()
+        self._read_path = read_path
+        self._entries: Dict[str, _Entry] = {}
+        self._texts: Dict[Path, Tuple[Stamp, str]] = {}
+        self._lock = threading.Lock()
+
+    def render(self, paths: Iterable[str]) -> str:
+        """The read_context_files() JSON for `paths`, assembled from cached fragments."""
+        fragments = [self._fragment(path) for path in dict.fromkeys(str(p) for p in paths)]
+        return "{\n" + ",\n".join(fragments) + "\n}" if fragments else "{}"
+
+    def read_text(self, path: str | Path) -> str:
+        path = Path(path)
+        stamp = _stamp(path)
+        with self._lock:
+            cached = self._texts.get(path)
+        if cached is not None and stamp is not None and cached[0] == stamp:
+            return cached[1]
+        text = path.read_text()
+        with self._lock:
+            self._texts[path] = (stamp, text)
+        return text
+
+    def invalidate(self, paths: Iterable[str | Path]):
+        """Forgets the given paths (relative to the root), anything under them, and their parents' own listings."""
+        targets, parents = set(), set()
+        for path in paths:
+            resolved = (self.root / path).resolve()
+            targets.add(resolved)
+            parents.add(resolved.parent)
+        with self._lock:
+            for key in [k for k, e in self._entries.items()
+                        if e.resolved in targets or e.resolved in parents or any(p in targets for p in e.resolved.parents)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._texts.clear()
+
+    def _fragment(self, path: str) -> str:
+        resolved = (self.root / path).resolve()
+        stamp = _stamp(resolved)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry.stamp == stamp:
+            return entry.fragment
+
+        value, _ = self._read_path(path)
+        digest = _digest(value)
+        if entry is not None and entry.digest == digest:
+            fragment = entry.fragment
+        else:
+            # Same layout as json.dumps(content, indent=0) gives each member of the dict
+            fragment = f"{json.dumps(path)}: {json.dumps(value, indent=0)}"
+        with self._lock:
+            self._entries[path] = _Entry(resolved, stamp, digest, fragment)
+        return fragment
@@ -0,0 +1,109 @@
+"""
+Runs a test script exactly like `python <test>` while recording which files it imports, opens for reading,
+lists or stats. Used by scripts/outcome_cache.py:
+
+    python scripts/dep_tracer.py <root> <deps_out.json> <test.py>
+
+The result is written to <deps_out.json> as {"deps": {path: kind}, "uncacheable": reason or null}, even if
+the test fails; the test's exit code is passed through. Paths under <root> are relative, others absolute;
+kind is "file" or "dir". Files of the standard library are left out, as the cache is keyed on the Python
+version. A test that starts other programs (whose reads are not seen) or reads something other than a
+regular file or directory (a device, a pipe) is uncacheable. scripts/worker_pool.py calls run_traced() in
+forked workers.
+"""
+import json
+import os
+import runpy
+import stat
+import sys
+import sysconfig
+
+IGNORED_PARTS = {".git", ".thefactory", "__pycache__"}
+# Audit events of starting another program
+PROCESS_EVENTS = {"subprocess.Popen", "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.startfile"}
+STDLIB_DIRS = tuple(
+    os.path.realpath(path) + os.sep
+    for path in {sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["platstdlib"]}
+)
+
+
+def run_traced(root: str, deps_path: str, test_path: str, args=()):
+    """Runs the test in this interpreter and writes its dependencies. Raises whatever the test raises, including SystemExit."""
+    root = os.path.realpath(root) + os.sep
+    accessed = {}
+    uncacheable = []
+    tracing = [True]
+
+    def record(path, kind):
+        if not tracing[0] or isinstance(path, int):
+            return
+        try:
+            path = os.path.realpath(os.fsdecode(path))
+        except (TypeError, ValueError):
+            return
+        if not path.startswith(STDLIB_DIRS) and accessed.get(path) != "file":
+            accessed[path] = kind
+
+    def audit_hook(event, args):
+        if event in PROCESS_EVENTS:
+            if tracing[0] and not uncacheable:
+                uncacheable.append(f"started another program ({event})")
+        elif event == "open":
+            path, mode, flags = args
+            if mode is not None and any(c in mode for c in "wax+"):
+                return
+            if mode is None and flags & (os.O_WRONLY | os.O_RDWR):
+                return
+            record(path, "file")
+        elif event in ("os.listdir", "os.scandir") and args and args[0] is not None:
+            record(args[0], "dir")
+
+    original_stat = os.stat
+
+    def traced_stat(path, *args, **kwargs):
+        # os.path.exists() & co. are not audited, but a test may depend on a file existing or not
+        record(path, "file")
+        return original_stat(path, *args, **kwargs)
+
+    sys.addaudithook(audit_hook)
+    os.stat = traced_stat
+    sys.argv = [test_path] + list(args)
+    sys.path[0] = os.path.dirname(os.path.abspath(test_path))
+    record(test_path, "file")
+
+    try:
+        runpy.run_path(test_path, run_name="__main__")
+    finally:
+        tracing[0] = False
+        os.stat = original_stat
+        for module in list(sys.modules.values()):
+            module_file = getattr(module, "__file__", None)
+            if module_file:
+                tracing[0] = True
+                record(module_file, "file")
+                tracing[0] = False
+        deps = {}
+        for path, kind in accessed.items():
+            if path == root[:-1]:
+                continue  # listed by the import system for every test; new files there are picked up by their users
+            if path.startswith(root):
+                if not IGNORED_PARTS.intersection(path[len(root):].split(os.sep)):
+                    deps[os.path.relpath(path, root)] = kind
+                continue
+            deps[path] = kind
+            try:
+                mode = os.stat(path).st_mode
+            except OSError:
+                continue  # a path that does not exist (any more) is fingerprinted as missing
+            if not (stat.S_ISREG(mode) or stat.S_ISDIR(mode)) and not uncacheable:
+                uncacheable.append(f"read {path}, which is not a regular file")
+        with open(deps_path, "w", encoding="utf-8") as f:
+            json.dump({"deps": deps, "uncacheable": uncacheable[0] if uncacheable else None}, f, indent=0, sort_keys=True)
+
+
+def main():
+    run_traced(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:])
+
+
+if __name__ == "__main__":
+    main()
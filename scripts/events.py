@@ -0,0 +1,217 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+TIMING_EVENT = "run/timing"
+USAGE_EVENT = "run/usage"
+# Phases are reported in this order; spans of other phases follow alphabetically.
+PHASES = ("task", "feature", "llm", "tool", "git", "test")
+PERCENTILES = (50, 90, 99)
+# (task id, feature id) that spans are attributed to; per thread/async context, so concurrent agents stay apart
+_OWNER: ContextVar = ContextVar("factory_event_owner", default=(None, None))
+
+
+def _iso_now() -> str:
+    """Wall-clock time like JavaScript's Date.toISOString(), as the Node CLI writes it."""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of `values` (0 for none)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(-(-p * len(ordered) // 100))))
+    return ordered[rank - 1]
+
+
+class EventEmitter:
+    """
+    Structured run events as JSON lines, in the RunEvent shape the Node CLI streams ({type, ts, runId, payload}).
+
+    - span(phase, name) times a block (an LLM turn, a tool call, a git command, a test run) and emits a
+      run/timing event with its duration and the task/feature it ran for; LLM turns also emit run/usage with
+      their token counts. Durations and `monoMs` (time since the emitter started) use the monotonic clock.
+    - Events are appended to `path` if one is given (FACTORY_EVENTS_FILE); worker processes of the same run
+      share FACTORY_RUN_ID and may append to the same file. Timings are kept in memory either way, for
+      summary().
+    """
+
+    def __init__(self, path: Optional[str] = None, run_id: Optional[str] = None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._timings: List[Dict[str, Any]] = []
+        self._file = None
+        if path:
+            try:
+                self._file = open(path, "a", encoding="utf-8")
+            except OSError as e:
+                print(f"Warning: Could not open event log {path}; events will not be written. Error: {e}")
+
+    def emit(self, event_type: str, **payload: Any):
+        payload.setdefault("monoMs", round((time.monotonic() - self._start) * 1000, 3))
+        event = {"type": event_type, "ts": _iso_now(), "runId": self.run_id, "payload": payload}
+        with self._lock:
+            if event_type == TIMING_EVENT:
+                self._timings.append(payload)
+            if self._file is not None:
+                try:
+                    # One write per line keeps appends from several processes whole
+                    self._file.write(json.dumps(event, default=str) + "\n")
+                    self._file.flush()
+                except (OSError, ValueError) as e:
+                    print(f"Warning: Could not write event {event_type}. Error: {e}")
+
+    @contextmanager
+    def span(self, phase: str, name: Optional[str] = None, **fields: Any) -> Iterator[Dict[str, Any]]:
+        """Times the block and emits a run/timing event; fields added to the yielded dict are included."""
+        task_id, feature_id = _OWNER.get()
+        payload: Dict[str, Any] = {"phase": phase, "name": name, "taskId": task_id, "featureId": feature_id}
+        payload.update(fields)
+        start = time.monotonic()
+        ok = True
+        try:
+            yield payload
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            payload.setdefault("ok", ok)
+            payload["durationMs"] = round((time.monotonic() - start) * 1000, 3)
+            self.emit(TIMING_EVENT, **payload)
+
+    @contextmanager
+    def feature(self, task_id: str, feature_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Attributes the spans inside the block (in this thread or async context) to a feature, or to the task
+        when feature_id is None, and times it.
+        """
+        token = _OWNER.set((task_id, feature_id))
+        try:
+            with self.span("feature" if feature_id else "task", feature_id or task_id) as payload:
+                yield payload
+        finally:
+            _OWNER.reset(token)
+
+    def usage(self, model: str, usage: Dict[str, int], elapsed_ms: float, cached: bool = False):
+        self.emit(
+            USAGE_EVENT,
+            provider=model.split("/", 1)[0] if "/" in model else "",
+            model=model,
+            promptTokens=usage.get("prompt_tokens", 0),
+            completionTokens=usage.get("completion_tokens", 0),
+            cachedTokens=usage.get("cache_read_input_tokens", 0),
+            elapsedMs=round(elapsed_ms, 3),
+            cached=cached,
+            taskId=_OWNER.get()[0],
+            featureId=_OWNER.get()[1],
+        )
+
+    def timings(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._timings)
+
+    def summary(self) -> str:
+        return summarize(self.timings())
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-phase count, total and percentiles (ms), e.g. for the run/complete event."""
+        by_phase: Dict[str, List[float]] = {}
+        for timing in self.timings():
+            by_phase.setdefault(timing.get("phase") or "?", []).append(float(timing.get("durationMs") or 0))
+        return {
+            phase: {"count": len(d), "totalMs": round(sum(d), 3), **{f"p{p}Ms": percentile(d, p) for p in PERCENTILES}}
+            for phase, d in by_phase.items()
+        }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _phase_order(phase: str):
+    return (PHASES.index(phase), "") if phase in PHASES else (len(PHASES), phase)
+
+
+def _stats_row(label: str, durations: List[float]) -> str:
+    cells = [f"{len(durations):>6}", f"{sum(durations) / 1000:>9.1f}s"]
+    cells += [f"{percentile(durations, p):>9.0f}" for p in PERCENTILES]
+    cells.append(f"{max(durations):>9.0f}")
+    return f"  {label:<28}" + "".join(cells)
+
+
+def summarize(timings: Iterable[Dict[str, Any]]) -> str:
+    """Latency percentiles (ms) per phase, then per feature and phase, from run/timing payloads."""
+    by_phase: Dict[str, List[float]] = {}
+    by_feature: Dict[str, Dict[str, List[float]]] = {}
+    for timing in timings:
+        phase, duration = timing.get("phase") or "?", float(timing.get("durationMs") or 0)
+        by_phase.setdefault(phase, []).append(duration)
+        owner = timing.get("taskId")
+        if owner:
+            if timing.get("featureId"):
+                owner = f"{owner}.{timing['featureId']}"
+            by_feature.setdefault(owner, {}).setdefault(phase, []).append(duration)
+    if not by_phase:
+        return "Timing: no events recorded."
+
+    header = f"  {'':<28}{'count':>6}{'total':>10}" + "".join(f"{'p' + str(p) + ' ms':>9}" for p in PERCENTILES) + f"{'max ms':>9}"
+    lines = ["Timing by phase:", header]
+    lines += [_stats_row(phase, by_phase[phase]) for phase in sorted(by_phase, key=_phase_order)]
+    if by_feature:
+        lines += ["Timing by feature:", header]
+        for owner in sorted(by_feature):
+            phases = by_feature[owner]
+            for phase in sorted(phases, key=_phase_order):
+                lines.append(_stats_row(f"{owner} {phase}", phases[phase]))
+    return "\n".join(lines)
+
+
+_EMITTER: Optional[EventEmitter] = None
+_EMITTER_LOCK = threading.Lock()
+
+
+def get_event_emitter() -> EventEmitter:
+    """
+    The process-wide emitter. Events go to FACTORY_EVENTS_FILE if set; the run id is taken from (or exported
+    as) FACTORY_RUN_ID, so worker processes started later report under the same run.
+    """
+    global _EMITTER
+    with _EMITTER_LOCK:
+        if _EMITTER is None:
+            run_id = os.getenv("FACTORY_RUN_ID") or uuid.uuid4().hex
+            os.environ["FACTORY_RUN_ID"] = run_id
+            _EMITTER = EventEmitter(os.getenv("FACTORY_EVENTS_FILE") or None, run_id)
+        return _EMITTER
+
+
+def load_timings(path: str) -> List[Dict[str, Any]]:
+    timings = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get("type") == TIMING_EVENT:
+                timings.append(event.get("payload") or {})
+    return timings
+
+
+if __name__ == "__main__":
+    # Summarizes an event log, including the events of worker processes: python scripts/events.py events.jsonl
+    if len(sys.argv) != 2:
+        print("Usage: python scripts/events.py <events.jsonl>")
+        sys.exit(2)
+    print(summarize(load_timings(sys.argv[1])))
@@ -0,0 +1,19 @@
+from pathlib import Path
+
+# Per-project working data lives under <project_root>/.thefactory (same location the TS library uses).
+DATA_DIR_NAME = ".thefactory"
+
+
+def get_data_dir(root: str | Path, *parts: str) -> Path:
+    """
+    Returns (creating it if needed) <root>/.thefactory[/parts...]. The data directory ignores itself
+    through its own .gitignore, so the agents' `git add .` never commits generated data.
+    """
+    data_dir = Path(root) / DATA_DIR_NAME
+    data_dir.mkdir(parents=True, exist_ok=True)
+    gitignore = data_dir / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
+    target = data_dir.joinpath(*parts)
+    target.mkdir(parents=True, exist_ok=True)
+    return target
@@ -0,0 +1,148 @@
+import queue
+import threading
+from typing import Any, Callable, List, Optional, Sequence
+
+from docs.tasks.task_format import Task, Feature
+from scripts.task_graph import node_key
+import scripts.task_utils as task_utils
+
+PIPELINE_STAGES = ("contexter", "planner", "tester", "developer")
+PENDING_STATUSES = ("-", "~")
+BLOCKED = "?"
+
+# Passed down a stage queue once the stage before it has no more features to hand over.
+_DONE = None
+
+
+class FeaturePipeline:
+    """
+    Runs several agent personas over the features of one task in a single orchestrator run, as a pipeline.
+
+    - Every stage (by default contexter -> planner -> tester -> developer) runs in its own thread with its own
+      queue. A feature is handed to the next stage as soon as the previous one finished it; features that
+      stage blocked ('?') leave the pipeline.
+    - The first stage takes the task's pending features in display order. The developer stage only starts a
+      feature once its blockers are done (see TaskGraph), picking the first ready one in display order.
+    - All stages share the workspace, the task store and `run_feature`'s git manager; commits are serialized
+      by GitManager.lock, and each stage commits only the files its own tools wrote plus the task file (see
+      task_utils.record_changed_paths).
+    """
+
+    def __init__(self, task_id: str, run_feature: Callable[[str, Task, Feature], Any],
+                 stages: Sequence[str] = PIPELINE_STAGES, feature_ids: Optional[List[str]] = None):
+        self.task_id = task_id
+        self.run_feature = run_feature
+        self.stages = list(stages)
+        self.feature_ids = feature_ids
+        self._queues: List["queue.Queue[Optional[str]]"] = [queue.Queue() for _ in self.stages]
+
+    def run(self):
+        seeds = self._initial_features()
+        print(f"Pipeline {' -> '.join(self.stages)} over {len(seeds)} feature(s) of task {self.task_id}.")
+        for feature_id in seeds:
+            self._queues[0].put(feature_id)
+        self._queues[0].put(_DONE)
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(index,), name=f"pipeline-{stage}", daemon=True)
+            for index, stage in enumerate(self.stages)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"Pipeline for task {self.task_id} finished.")
+
+    def _initial_features(self) -> List[str]:
+        task = task_utils.get_task(self.task_id)
+        display = task.get("featureIdToDisplayIndex", {}) or {}
+        features = [f for f in task.get("features", []) if f.get("status") in PENDING_STATUSES]
+        if self.feature_ids is not None:
+            features = [f for f in features if f.get("id") in self.feature_ids]
+        position = {f.get("id"): i for i, f in enumerate(task.get("features", []))}
+
+        def sort_key(f: Feature):
+            display_index = display.get(f.get("id"))
+            return (display_index if isinstance(display_index, int) else 10**9, position[f.get("id")])
+
+        return [f.get("id") for f in sorted(features, key=sort_key)]
+
+    def _run_stage(self, index: int):
+        try:
+            if self.stages[index] == "developer":
+                self._run_blocker_aware_stage(index)
+            else:
+                while True:
+                    feature_id = self._queues[index].get()
+                    if feature_id is _DONE:
+                        break
+                    self._process(index, feature_id)
+        except Exception as e:
+            print(f"Pipeline stage {self.stages[index]} failed: {e}")
+        finally:
+            if index + 1 < len(self.stages):
+                self._queues[index + 1].put(_DONE)
+
+    def _run_blocker_aware_stage(self, index: int):
+        waiting: List[str] = []
+        upstream_done = False
+        while True:
+            while True:
+                try:
+                    item = self._queues[index].get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    upstream_done = True
+                else:
+                    waiting.append(item)
+
+            ready = self._first_ready(waiting)
+            if ready is not None:
+                waiting.remove(ready)
+                self._process(index, ready)
+                continue
+            if upstream_done:
+                if waiting:
+                    print(f"Pipeline: {', '.join(waiting)} still wait for blockers outside this run; leaving them for later.")
+                return
+            item = self._queues[index].get()
+            if item is _DONE:
+                upstream_done = True
+            else:
+                waiting.append(item)
+
+    def _first_ready(self, waiting: List[str]) -> Optional[str]:
+        if not waiting:
+            return None
+        graph = task_utils.get_task_graph()
+        graph.update_task(task_utils.get_task(self.task_id))
+        for feature_id in waiting:
+            key = node_key(self.task_id, feature_id)
+            # '~' is a developer run that was interrupted; it resumes once its blockers are done
+            if graph.is_ready(key) or (graph.status(key) == "~" and not graph.unmet_blockers(key) and key not in graph.cycles()):
+                return feature_id
+        return None
+
+    def _process(self, index: int, feature_id: str):
+        stage = self.stages[index]
+        task = task_utils.get_task(self.task_id)
+        feature = next((f for f in task.get("features", []) if f.get("id") == feature_id), None)
+        if feature is None or feature.get("status") not in PENDING_STATUSES:
+            print(f"Pipeline: skipping {feature_id} at {stage}; it is no longer pending.")
+            return
+        try:
+            # Stages share the working tree: each commits only the files its own tools wrote
+            with task_utils.record_changed_paths():
+                self.run_feature(stage, task, feature)
+        except Exception as e:
+            print(f"Pipeline: {stage} failed on feature {feature_id}: {e}")
+            return
+
+        feature = next((f for f in task_utils.get_task(self.task_id).get("features", []) if f.get("id") == feature_id), None)
+        if feature is None or feature.get("status") == BLOCKED:
+            print(f"Pipeline: {stage} blocked feature {feature_id}; it leaves the pipeline.")
+            return
+        if index + 1 < len(self.stages):
+            print(f"Pipeline: {stage} finished feature {feature_id}; handing it to {self.stages[index + 1]}.")
+            self._queues[index + 1].put(feature_id)
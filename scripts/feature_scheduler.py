@@ -0,0 +1,246 @@
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from docs.tasks.task_format import Task, Feature
+from scripts.factory_paths import get_data_dir
+from scripts.git_manager import GitManager
+import scripts.task_utils as task_utils
+
+RUN_LOCAL_AGENT_PATH = Path(__file__).resolve().parent / "run_local_agent.py"
+POLL_INTERVAL_SECONDS = 0.5
+
+
+class _RunningFeature:
+    __slots__ = ("feature", "branch_name", "worktree_path", "log_path", "process")
+
+    def __init__(self, feature: Feature, branch_name: str, worktree_path: Path, log_path: Path, process: subprocess.Popen):
+        self.feature = feature
+        self.branch_name = branch_name
+        self.worktree_path = worktree_path
+        self.log_path = log_path
+        self.process = process
+
+
+class FeatureScheduler:
+    """
+    Runs the features of one task concurrently, each in its own git worktree and agent process.
+
+    - A feature starts as soon as a worker is free and (for the developer) its blockers are done ('+'),
+      including blockers on other tasks. Of the ready features, the one heading the longest chain of
+      remaining work (see TaskGraph.critical_path) starts first.
+    - Each worker commits on its own `features/<task_id>-<feature_id>` branch, created from `features/<task_id>`.
+    - Finished features are merged back onto `features/<task_id>` in dependency order: a feature is only
+      merged once none of its blockers are still running or waiting to be merged. The feature's record in
+      task.json is taken from the worktree, everything else from the task branch.
+    - The task branch is pushed once, after all features have been merged.
+    """
+
+    def __init__(self, model: str, agent_type: str, task_id: str, project_root: Path, git_manager: GitManager, workers: int):
+        self.model = model
+        self.agent_type = agent_type
+        self.task_id = task_id
+        self.project_root = Path(project_root)
+        self.git_manager = git_manager
+        self.workers = max(1, workers)
+        self.branch_name = f"features/{task_id}"
+        self.task_rel_path = str(task_utils.get_task_store().task_path(task_id).relative_to(self.project_root))
+
+        self._work_dir = Path(tempfile.mkdtemp(prefix=f"factory-{task_id[:8]}-"))
+        self._log_dir = get_data_dir(self.project_root, "logs", task_id)
+        self._started_ids: Set[str] = set()
+        self._running: Dict[str, _RunningFeature] = {}
+        self._unmerged: Dict[str, _RunningFeature] = {}
+
+    def run(self):
+        print(f"Scheduling features of task {self.task_id} on up to {self.workers} workers. Worktrees: {self._work_dir}")
+        if self.agent_type == "developer":
+            graph = task_utils.get_task_graph()
+            critical_path = graph.critical_path(self.task_id)
+            width = graph.width(self.task_id)
+            print(f"Critical path: {len(critical_path)} features; at most {width} can run side by side.")
+            if width and self.workers > width:
+                print(f"Note: more workers ({self.workers}) than the task's dependency graph can keep busy ({width}).")
+        try:
+            while True:
+                self._start_ready_features()
+                if not self._running and not self._unmerged:
+                    break
+                self._collect_finished()
+                self._merge_in_dependency_order()
+                if self._running:
+                    time.sleep(POLL_INTERVAL_SECONDS)
+                elif self._unmerged and not self._has_mergeable():
+                    # Nothing is running and nothing can be merged: the rest waits on blockers outside this run.
+                    print(f"Features {list(self._unmerged)} wait on blockers that are not part of this run. Leaving their branches unmerged.")
+                    break
+        except KeyboardInterrupt:
+            print("\n--- Scheduler interrupted. Stopping workers. ---")
+            for running in self._running.values():
+                running.process.terminate()
+            raise
+        finally:
+            for running in list(self._running.values()) + list(self._unmerged.values()):
+                running.process.wait()
+                self._remove_worktree(running)
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+
+        try:
+            self.git_manager.push(self.branch_name)
+        except Exception as e:
+            print(f"Could not push': {e}")
+
+    # --- Scheduling ---
+
+    def _start_ready_features(self):
+        while len(self._running) < self.workers:
+            task = task_utils.get_task(self.task_id)
+            feature = self._next_feature(task)
+            if not feature:
+                return
+            self._started_ids.add(feature.get("id"))
+            self._start(feature)
+
+    def _next_feature(self, task: Task) -> Optional[Feature]:
+        if self.agent_type != "developer":
+            return task_utils.find_next_available_feature(task, self._started_ids, True)
+        graph = task_utils.get_task_graph()
+        graph.update_task(task)
+        ready = graph.ready(self.task_id, self._started_ids)
+        if not ready:
+            return None
+        # Longest remaining chain first; ready() is in display order, and max() keeps the first on ties
+        priorities = graph.priorities(self.task_id)
+        key = max(ready, key=lambda k: priorities.get(k, 0.0))
+        feature_id = key.split(".", 1)[1]
+        return next((f for f in task.get("features", []) if f.get("id") == feature_id), None)
+
+    def _start(self, feature: Feature):
+        feature_id = feature.get("id")
+        branch_name = f"{self.branch_name}-{feature_id}"
+        worktree_path = self._work_dir / feature_id
+        log_path = self._log_dir / f"{feature_id}.log"
+
+        self.git_manager.add_worktree(worktree_path, branch_name, self.branch_name)
+        command = [
+            sys.executable, str(RUN_LOCAL_AGENT_PATH),
+            "--model", self.model,
+            "--agent", self.agent_type,
+            "--task", self.task_id,
+            "--feature", feature_id,
+            "--project-dir", str(worktree_path),
+            "--worktree",
+        ]
+        with open(log_path, "w") as log_file:
+            process = subprocess.Popen(command, cwd=Path.cwd(), stdout=log_file, stderr=subprocess.STDOUT)
+        print(f"Started feature [{feature_id}] {feature.get('title')} (log: {log_path})")
+        self._running[feature_id] = _RunningFeature(feature, branch_name, worktree_path, log_path, process)
+
+    def _collect_finished(self):
+        for feature_id, running in list(self._running.items()):
+            code = running.process.poll()
+            if code is None:
+                continue
+            del self._running[feature_id]
+            print(f"Feature [{feature_id}] finished with exit code {code}.")
+            self._unmerged[feature_id] = running
+
+    # --- Merging ---
+
+    def _blockers_pending(self, feature: Feature) -> bool:
+        pending = set(self._running) | set(self._unmerged)
+        return any(
+            blocker.split(".")[-1] in pending
+            for blocker in feature.get("blockers", []) or []
+            if isinstance(blocker, str)
+        )
+
+    def _has_mergeable(self) -> bool:
+        return any(not self._blockers_pending(r.feature) for r in self._unmerged.values())
+
+    def _merge_in_dependency_order(self):
+        merged = True
+        while merged:
+            merged = False
+            task = task_utils.get_task(self.task_id)
+            for feature_id in self._display_order(task, list(self._unmerged)):
+                running = self._unmerged[feature_id]
+                if self._blockers_pending(running.feature):
+                    continue
+                del self._unmerged[feature_id]
+                merged_cleanly = self._merge(running)
+                self._remove_worktree(running)
+                if merged_cleanly:
+                    try:
+                        self.git_manager.delete_branch(running.branch_name)
+                    except Exception as e:
+                        print(f"Warning: Could not delete branch '{running.branch_name}'. Error: {e}")
+                merged = True
+                break
+
+    def _display_order(self, task: Task, feature_ids: List[str]) -> List[str]:
+        display = task.get("featureIdToDisplayIndex", {}) or {}
+        return sorted(feature_ids, key=lambda fid: display.get(fid) if isinstance(display.get(fid), int) else 10**9)
+
+    def _merge(self, running: _RunningFeature) -> bool:
+        """Merges a finished feature's branch. Returns False if the merge failed and the branch was left unmerged."""
+        feature_id = running.feature.get("id")
+        worktree_feature = self._worktree_feature(running)
+
+        try:
+            self.git_manager.merge(running.branch_name)
+        except Exception as e:
+            # Only a conflict in task.json alone is resolved below; anything else leaves the branch for review.
+            conflicts = self.git_manager.conflicted_files()
+            if conflicts != [self.task_rel_path]:
+                others = [path for path in conflicts if path != self.task_rel_path]
+                reason = f"Merge conflict in {', '.join(others)}" if others else f"Merge failed: {e}"
+                print(f"Merge of feature [{feature_id}] failed ({reason}); branch '{running.branch_name}' kept for review.")
+                try:
+                    self.git_manager.abort_merge()
+                except Exception as abort_error:
+                    print(f"Warning: Could not abort merge of feature {feature_id}. Error: {abort_error}")
+                # Commits only task.json; the task branch is pushed at the end of run()
+                with task_utils.record_changed_paths():
+                    task_utils.block_feature(self.task_id, feature_id, reason, self.agent_type, self.git_manager, push=False)
+                return False
+
+        # task.json: take the task branch's version and apply only this feature's record from the worktree.
+        self.git_manager.restore_file(self.task_rel_path)
+        task_utils.get_task_store().invalidate(self.task_id)
+        if worktree_feature:
+            task_utils.merge_feature_record(self.task_id, worktree_feature)
+        task_utils.get_task_store().flush()
+
+        try:
+            self.git_manager.stage_files(["."])
+            self.git_manager.commit(f"merge: Feature {feature_id} - {running.feature.get('title', '')}")
+            print(f"Merged feature [{feature_id}] into '{self.branch_name}'.")
+        except Exception as e:
+            print(f"Warning: Git commit failed for merge of feature {feature_id}. Error: {e}")
+        return True
+
+    def _worktree_feature(self, running: _RunningFeature) -> Optional[Feature]:
+        try:
+            with open(running.worktree_path / self.task_rel_path, "r") as f:
+                worktree_task = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read task from worktree of feature {running.feature.get('id')}. Error: {e}")
+            return None
+        for feature in worktree_task.get("features", []):
+            if feature.get("id") == running.feature.get("id"):
+                return feature
+        return None
+
+    def _remove_worktree(self, running: _RunningFeature):
+        if not running.worktree_path.exists():
+            return
+        try:
+            self.git_manager.remove_worktree(running.worktree_path)
+        except Exception as e:
+            print(f"Warning: Could not remove worktree '{running.worktree_path}'. Error: {e}")
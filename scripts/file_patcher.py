@@ -0,0 +1,484 @@
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Leading/trailing context lines a hunk may drop when its full context does not match (like patch's fuzz factor).
+MAX_FUZZ = 2
+# Line comparisons tried in order: exact, ignoring trailing whitespace, ignoring all surrounding whitespace.
+MATCH_MODES = ("exact", "trailing whitespace ignored", "indentation ignored")
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)?(?:,(\d+))? ?(?:\+\d+(?:,\d+)?)? ?@@")
+SEARCH_MARKER = re.compile(r"^<{5,9} ?SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^={5,9}\s*$")
+REPLACE_MARKER = re.compile(r"^>{5,9} ?REPLACE\s*$")
+DEV_NULL = "/dev/null"
+_LINE_BREAK = re.compile(r"(\r?\n)")
+
+# (tag, text): ' ' context, '-' removed, '+' added
+HunkLine = Tuple[str, str]
+
+
+class PatchRejected(ValueError):
+    """A patch or edit that cannot be applied. The message lists every failed hunk or block and why."""
+
+
+class Hunk:
+    __slots__ = ("old_start", "old_count", "lines", "no_eol_old", "no_eol_new")
+
+    def __init__(self, old_start: Optional[int], old_count: Optional[int] = None):
+        self.old_start = old_start
+        # Only as stated in the header; None when omitted (a count of 1)
+        self.old_count = old_count
+        self.lines: List[HunkLine] = []
+        self.no_eol_old = False
+        self.no_eol_new = False
+
+    def header(self) -> str:
+        return f"@@ -{self.old_start if self.old_start is not None else '?'} @@"
+
+
+class FilePatch:
+    __slots__ = ("old_path", "new_path", "hunks")
+
+    def __init__(self, old_path: Optional[str], new_path: Optional[str]):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks: List[Hunk] = []
+
+
+class _Text:
+    """
+    A file split into lines at "\n" and "\r\n" only, keeping each line's own terminator ("" for a last line
+    without one), so mixed newlines and characters like form feeds or U+2028 inside lines survive a patch.
+    Lines a patch adds take the newline of the line they replace or are placed before.
+    """
+
+    def __init__(self, text: str):
+        parts = _LINE_BREAK.split(text)
+        self.lines = parts[0::2]
+        self.endings = parts[1::2] + [""]
+        if self.lines[-1] == "":
+            self.lines.pop()
+            self.endings.pop()
+        crlf = sum(1 for ending in self.endings if ending == "\r\n")
+        self.newline = "\r\n" if crlf * 2 > sum(1 for ending in self.endings if ending) else "\n"
+        self.final_newline = text.endswith("\n")
+
+    def render(self) -> str:
+        if not self.lines:
+            return ""
+        last = len(self.lines) - 1
+        parts = []
+        for i, line in enumerate(self.lines):
+            ending = self.endings[i] or self.newline
+            parts.append(line + (ending if i < last or self.final_newline else ""))
+        return "".join(parts)
+
+
+def _split_lines(text: str) -> List[str]:
+    """Like str.splitlines(), but only "\n" and "\r\n" end a line."""
+    lines = _LINE_BREAK.split(text)[0::2]
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def _normalize(line: str, mode: int) -> str:
+    if mode == 0:
+        return line
+    return line.rstrip() if mode == 1 else line.strip()
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+# --- Parsing ---
+
+
+def _diff_path(raw: str) -> Optional[str]:
+    path = raw.split("\t", 1)[0].strip()
+    if path == DEV_NULL:
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def parse_unified_diff(diff: str) -> List[FilePatch]:
+    """Parses a (possibly multi-file) unified diff. Hunk line counts are not trusted; hunks end at the next header."""
+    patches: List[FilePatch] = []
+    current: Optional[FilePatch] = None
+    hunk: Optional[Hunk] = None
+    lines = _split_lines(diff)
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(_diff_path(line[4:]), _diff_path(lines[i + 1][4:]))
+            patches.append(current)
+            hunk = None
+            i += 2
+            continue
+        header = HUNK_HEADER.match(line)
+        if header and current is not None:
+            hunk = Hunk(int(header.group(1)) if header.group(1) else None, int(header.group(2)) if header.group(2) else None)
+            current.hunks.append(hunk)
+        elif hunk is not None and line.startswith(("diff ", "index ")):
+            hunk = None
+        elif hunk is not None and line.startswith("\\"):
+            # "\ No newline at end of file" applies to the side of the line before it
+            if hunk.lines and hunk.lines[-1][0] in " -":
+                hunk.no_eol_old = True
+            if hunk.lines and hunk.lines[-1][0] in " +":
+                hunk.no_eol_new = True
+        elif hunk is not None and line[:1] in (" ", "-", "+"):
+            hunk.lines.append((line[0], line[1:]))
+        elif hunk is not None and line == "":
+            # Editors and models often strip the single space of blank context lines
+            hunk.lines.append((" ", ""))
+        i += 1
+
+    for patch in patches:
+        for h in patch.hunks:
+            while h.lines and h.lines[-1] == (" ", ""):
+                h.lines.pop()
+    if not patches:
+        raise PatchRejected("No file headers found: a unified diff needs '--- a/<path>' and '+++ b/<path>' lines before its @@ hunks.")
+    return patches
+
+
+def parse_search_replace(blocks: str) -> List[Tuple[str, str]]:
+    """
+    Parses search/replace blocks:
+        <<<<<<< SEARCH
+        exact lines to find
+        =======
+        lines to put in their place
+        >>>>>>> REPLACE
+    """
+    edits = []
+    lines = _split_lines(blocks)
+    i = 0
+    while i < len(lines):
+        if not SEARCH_MARKER.match(lines[i]):
+            i += 1
+            continue
+        start = i
+        search, replace = [], []
+        i += 1
+        while i < len(lines) and not DIVIDER_MARKER.match(lines[i]):
+            search.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and not REPLACE_MARKER.match(lines[i]):
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise PatchRejected(f"Block starting at line {start + 1} is not closed by '=======' and '>>>>>>> REPLACE'.")
+        edits.append(("\n".join(search), "\n".join(replace)))
+        i += 1
+    if not edits:
+        raise PatchRejected("No '<<<<<<< SEARCH' / '=======' / '>>>>>>> REPLACE' blocks found.")
+    return edits
+
+
+# --- Matching ---
+
+
+def _matches(lines: List[str], old: List[str], pos: int, mode: int) -> bool:
+    if pos < 0 or pos + len(old) > len(lines):
+        return False
+    return all(_normalize(lines[pos + k], mode) == _normalize(old[k], mode) for k in range(len(old)))
+
+
+def _nearest_match(lines: List[str], old: List[str], expected: int, min_pos: int, mode: int) -> Optional[int]:
+    """The matching position closest to `expected` (searching outward), not before `min_pos`."""
+    last = len(lines) - len(old)
+    expected = min(max(expected, min_pos), max(last, min_pos))
+    for distance in range(0, max(expected - min_pos, last - expected) + 1):
+        for pos in (expected - distance, expected + distance) if distance else (expected,):
+            if min_pos <= pos <= last and _matches(lines, old, pos, mode):
+                return pos
+    return None
+
+
+def _closest_region(lines: List[str], old: List[str]) -> str:
+    """Describes where `old` comes closest to matching, for reject messages."""
+    if not old or not lines:
+        return "The file is empty." if not lines else ""
+    wanted = [_normalize(line, 2) for line in old]
+    best_pos, best_score = 0, -1
+    for pos in range(0, max(1, len(lines) - len(old) + 1)):
+        score = sum(1 for k, w in enumerate(wanted) if pos + k < len(lines) and _normalize(lines[pos + k], 2) == w)
+        if score > best_score:
+            best_pos, best_score = pos, score
+    if best_score <= 0:
+        return f"None of its lines occur in the file; first expected line: {old[0]!r}."
+    for k, line in enumerate(old):
+        actual = lines[best_pos + k] if best_pos + k < len(lines) else "<end of file>"
+        if _normalize(actual, 2) != _normalize(line, 2):
+            return (f"Closest match starts at line {best_pos + 1} ({best_score}/{len(old)} lines equal); "
+                    f"line {best_pos + k + 1} is {actual!r} but the patch expects {line!r}.")
+    return f"Closest match starts at line {best_pos + 1}."
+
+
+def _reindent(line: str, patch_indent: str, file_indent: str) -> str:
+    """Moves an added line from the patch's indentation to the file's, for indentation-insensitive matches."""
+    if patch_indent == file_indent or not line.strip():
+        return line
+    if line.startswith(patch_indent):
+        return file_indent + line[len(patch_indent):]
+    return line
+
+
+def _indent_shift(lines: List[str], old: List[str], pos: int) -> Tuple[str, str]:
+    for k, line in enumerate(old):
+        if line.strip():
+            return _indent(line), _indent(lines[pos + k])
+    return "", ""
+
+
+def _apply_hunk(doc: _Text, hunk_lines: List[HunkLine], pos: int, mode: int) -> int:
+    """Replaces the matched region; context lines keep the file's own text and newline. Returns the lines now at pos."""
+    lines = doc.lines
+    old = [text for tag, text in hunk_lines if tag != "+"]
+    patch_indent, file_indent = _indent_shift(lines, old, pos) if mode == 2 else ("", "")
+    replacement, endings = [], []
+    removed_ending = None
+    k = pos
+    for tag, text in hunk_lines:
+        if tag == " ":
+            replacement.append(lines[k])
+            endings.append(doc.endings[k])
+            removed_ending = None
+            k += 1
+        elif tag == "-":
+            removed_ending = doc.endings[k]
+            k += 1
+        else:
+            replacement.append(_reindent(text, patch_indent, file_indent))
+            # Like the line it replaces, else the line it is placed before ("": the file's predominant newline)
+            endings.append(removed_ending if removed_ending is not None else doc.endings[k] if k < len(lines) else "")
+    doc.lines = lines[:pos] + replacement + lines[k:]
+    doc.endings = doc.endings[:pos] + endings + doc.endings[k:]
+    return len(replacement)
+
+
+def apply_hunks(text: str, hunks: List[Hunk], label: str) -> Tuple[str, List[str]]:
+    """
+    Applies a file's hunks in order. Each hunk is looked for nearest its stated line (shifted by the drift of
+    earlier hunks), first exactly, then ignoring trailing whitespace, then ignoring indentation, and finally
+    with up to MAX_FUZZ context lines dropped from either end. Returns (new text, notes on inexact matches);
+    raises PatchRejected listing every hunk that could not be placed.
+    """
+    doc = _Text(text)
+    notes, rejects = [], []
+    drift = 0
+    min_pos = 0
+    for number, hunk in enumerate(hunks, 1):
+        if hunk.old_count == 0:
+            # A hunk without old lines (diff -U0 insertions) states the line it goes after
+            expected = (hunk.old_start or 0) + drift
+        else:
+            expected = (hunk.old_start - 1 if hunk.old_start else 0) + drift
+        lead = next((k for k, (tag, _) in enumerate(hunk.lines) if tag != " "), len(hunk.lines))
+        trail = next((k for k, (tag, _) in enumerate(reversed(hunk.lines)) if tag != " "), len(hunk.lines))
+        placed = None
+        for fuzz in range(0, MAX_FUZZ + 1):
+            front, back = min(fuzz, lead), min(fuzz, trail)
+            if fuzz and front + back == 0:
+                break
+            hunk_lines = hunk.lines[front:len(hunk.lines) - back]
+            old = [t for tag, t in hunk_lines if tag != "+"]
+            for mode in range(len(MATCH_MODES)):
+                pos = _nearest_match(doc.lines, old, expected + front, min_pos, mode) if old else min(max(expected, min_pos), len(doc.lines))
+                if pos is not None:
+                    placed = (pos, mode, fuzz, hunk_lines)
+                    break
+            if placed is not None:
+                break
+        if placed is None:
+            old = [t for tag, t in hunk.lines if tag != "+"]
+            rejects.append(f"{label}: hunk {number} ({hunk.header()}) does not match. {_closest_region(doc.lines, old)}")
+            continue
+
+        pos, mode, fuzz, hunk_lines = placed
+        old_len = sum(1 for tag, _ in hunk_lines if tag != "+")
+        new_len = _apply_hunk(doc, hunk_lines, pos, mode)
+        offset = pos - (expected + min(fuzz, lead))
+        details = [d for d, on in ((f"offset {offset:+d} lines", offset), (MATCH_MODES[mode], mode), (f"fuzz {fuzz}", fuzz)) if on]
+        if details:
+            notes.append(f"{label}: hunk {number} applied at line {pos + 1} ({', '.join(details)}).")
+        drift += new_len - old_len + offset
+        min_pos = pos + new_len
+        if pos + new_len >= len(doc.lines):
+            if hunk.no_eol_new:
+                doc.final_newline = False
+            elif hunk.no_eol_old:
+                doc.final_newline = True
+
+    if rejects:
+        raise PatchRejected("\n".join(rejects))
+    if doc.lines and not text:
+        doc.final_newline = not any(h.no_eol_new for h in hunks)
+    return doc.render(), notes
+
+
+def apply_search_replace(text: str, edits: List[Tuple[str, str]], label: str) -> Tuple[str, List[str]]:
+    """
+    Applies search/replace edits in order. Each search block must occur exactly once (as whole lines compared
+    exactly, then ignoring trailing whitespace, then ignoring indentation, in which case the replacement is
+    re-indented; failing that, as an exact piece of text within lines). Raises PatchRejected listing every block that was not found or is ambiguous.
+    """
+    doc = _Text(text)
+    notes, rejects = [], []
+    for number, (search, replace) in enumerate(edits, 1):
+        lines = doc.lines
+        old = _split_lines(search)
+        new = _split_lines(replace)
+        if not old:
+            if lines:
+                rejects.append(f"{label}: block {number} has an empty SEARCH part; only a new or empty file can be written that way.")
+                continue
+            doc.lines, doc.endings = list(new), [""] * len(new)
+            continue
+        placed = None
+        for mode in range(len(MATCH_MODES)):
+            found = [pos for pos in range(0, len(lines) - len(old) + 1) if _matches(lines, old, pos, mode)]
+            if len(found) > 1:
+                rejects.append(f"{label}: block {number} matches {len(found)} places (lines {', '.join(str(p + 1) for p in found[:10])}); "
+                               "add surrounding lines to the SEARCH part so it is unique.")
+                placed = False
+                break
+            if found:
+                placed = (found[0], mode)
+                break
+        if placed is None:
+            # Not a run of whole lines: accept a unique exact occurrence inside the text
+            rendered = doc.render()
+            needle = doc.newline.join(old)
+            count = rendered.count(needle)
+            if count == 1:
+                doc = _Text(rendered.replace(needle, doc.newline.join(new)))
+                continue
+            if count > 1:
+                rejects.append(f"{label}: block {number} occurs {count} times; add surrounding text to the SEARCH part so it is unique.")
+            else:
+                rejects.append(f"{label}: block {number} SEARCH text not found. {_closest_region(lines, old)}")
+        if not placed:
+            continue
+        pos, mode = placed
+        _apply_hunk(doc, [("-", t) for t in old] + [("+", t) for t in new], pos, mode)
+        if mode:
+            notes.append(f"{label}: block {number} matched at line {pos + 1} ({MATCH_MODES[mode]}).")
+
+    if rejects:
+        raise PatchRejected("\n".join(rejects))
+    if doc.lines and not text:
+        doc.final_newline = True
+    return doc.render(), notes
+
+
+def plan_unified_diff(diff: str, read: Callable[[str], Optional[str]]) -> Tuple[Dict[str, Optional[str]], List[str]]:
+    """
+    Applies a unified diff in memory. `read(path)` returns a file's text, or None if it does not exist.
+    Returns ({path: new text, or None to delete}, notes); raises PatchRejected with every reject.
+    """
+    contents: Dict[str, Optional[str]] = {}
+    changes: Dict[str, Optional[str]] = {}
+    notes, rejects = [], []
+
+    def current(path: str) -> Optional[str]:
+        if path not in contents:
+            contents[path] = read(path)
+        return contents[path]
+
+    for patch in parse_unified_diff(diff):
+        label = patch.new_path or patch.old_path
+        if patch.old_path is None and patch.new_path is None:
+            rejects.append("A file patch has /dev/null on both sides.")
+            continue
+        if patch.old_path is None:
+            original = ""
+            if current(patch.new_path) is not None:
+                rejects.append(f"{label}: the patch creates this file, but it already exists.")
+                continue
+        else:
+            original = current(patch.old_path)
+            if original is None:
+                rejects.append(f"{patch.old_path}: file not found.")
+                continue
+        try:
+            updated, hunk_notes = apply_hunks(original, patch.hunks, label)
+        except PatchRejected as e:
+            rejects.append(str(e))
+            continue
+        notes.extend(hunk_notes)
+        if patch.new_path is None:
+            contents[patch.old_path] = changes[patch.old_path] = None
+            continue
+        if patch.old_path is not None and patch.old_path != patch.new_path:
+            contents[patch.old_path] = changes[patch.old_path] = None
+        contents[patch.new_path] = changes[patch.new_path] = updated
+
+    if rejects:
+        raise PatchRejected("\n".join(rejects))
+    return changes, notes
+
+
+def write_files_atomically(changes: Dict[Path, Optional[str]]):
+    """
+    Writes all files (None deletes) or none: every new content goes to a temp file first, then they are
+    renamed into place; if that fails part way, the files already replaced are restored.
+    """
+    staged: List[Tuple[Path, Optional[str]]] = []
+    try:
+        for path, text in changes.items():
+            if text is None:
+                staged.append((path, None))
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".patch", dir=path.parent)
+            staged.append((path, tmp_path))
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            if path.exists():
+                os.chmod(tmp_path, path.stat().st_mode & 0o7777)
+    except OSError:
+        for _, tmp_path in staged:
+            if tmp_path is not None:
+                _unlink(tmp_path)
+        raise
+
+    backups: List[Tuple[Path, Optional[bytes]]] = []
+    try:
+        for path, tmp_path in staged:
+            backups.append((path, path.read_bytes() if path.is_file() else None))
+            if tmp_path is None:
+                if path.exists():
+                    path.unlink()
+            else:
+                os.replace(tmp_path, path)
+    except OSError:
+        for path, original in reversed(backups):
+            try:
+                if original is None:
+                    path.unlink(missing_ok=True)
+                else:
+                    path.write_bytes(original)
+            except OSError as e:
+                print(f"Warning: Could not restore {path} after a failed patch. Error: {e}")
+        for _, tmp_path in staged:
+            if tmp_path is not None:
+                _unlink(tmp_path)
+        raise
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
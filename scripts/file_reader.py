@@ -0,0 +1,75 @@
+import mmap
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Files at least this large are mapped instead of read, so only the requested slice is materialized.
+MMAP_THRESHOLD_BYTES = 1024 * 1024
+# A NUL byte in the first block marks a file as binary.
+BINARY_SNIFF_BYTES = 8192
+# A cut at a byte cap moves back to the last line break if there is one this close to the cap.
+LINE_SNAP_BYTES = 4096
+
+
+def _line_start(buf, line: int) -> int:
+    """Byte position where 1-based `line` starts (len(buf) if the file has fewer lines)."""
+    pos = 0
+    for _ in range(max(0, line - 1)):
+        nl = buf.find(b"\n", pos)
+        if nl < 0:
+            return len(buf)
+        pos = nl + 1
+    return pos
+
+
+def read_text_slice(path: str | Path, start_line: Optional[int] = None, end_line: Optional[int] = None,
+                    offset: Optional[int] = None, length: Optional[int] = None,
+                    max_bytes: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Reads part of a text file and returns (text, bytes read).
+
+    - start_line/end_line select 1-based, inclusive lines; offset/length select bytes. Without either the
+      whole file is read.
+    - With `max_bytes` the slice is cut (at a line break where possible) and a truncation marker says how
+      to read on.
+    - Binary files (NUL bytes near the start) are not decoded; a short description is returned instead.
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            return "", 0
+        f.seek(0)
+        if size >= MMAP_THRESHOLD_BYTES:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+        try:
+            if b"\0" in buf[:BINARY_SNIFF_BYTES]:
+                return f"[Binary file, {size} bytes; not shown.]", 0
+
+            if start_line is not None or end_line is not None:
+                start = _line_start(buf, start_line or 1)
+                end = size if end_line is None else _line_start(buf, end_line + 1)
+            else:
+                start = min(max(0, offset or 0), size)
+                end = size if length is None else min(size, start + max(0, length))
+            # An inverted range reads nothing (and never counts as negative bytes read)
+            end = max(end, start)
+
+            truncated = max_bytes is not None and end - start > max_bytes
+            if truncated:
+                end = start + max_bytes
+                nl = buf.rfind(b"\n", max(start, end - LINE_SNAP_BYTES), end)
+                if nl >= 0:
+                    end = nl + 1
+            text = buf[start:end].decode("utf-8", errors="replace")
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    if truncated:
+        text += (
+            f"\n[... truncated: showing bytes {start}-{end} of {size}. Read on with "
+            f'{{"path": "<this path>", "offset": {end}}} or a start_line/end_line range ...]'
+        )
+    return text, end - start
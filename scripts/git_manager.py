@@ -1,32 +1,97 @@
 import subprocess
 import os
+import threading
 from pathlib import Path
-from typing import List
-from urllib.parse import urlparse
+from typing import Dict, List, Optional
+
+# Optional: stage and commit in-process through libgit2 instead of forking git
+try:
+    import pygit2
+except Exception:
+    pygit2 = None
+
+from scripts.events import get_event_emitter
+
+# Git credential helper that answers with the push credentials from the environment (see GitManager._push_env)
+_CREDENTIAL_HELPER = '!f() { test "$1" = get && echo "username=$GIT_USER_NAME" && echo "password=$GIT_PAT"; }; f'
+
+
+def get_push_every() -> int:
+    """Push after every N-th queued push (FACTORY_PUSH_EVERY, also --push-every). 1 pushes immediately."""
+    try:
+        return max(1, int(os.getenv("FACTORY_PUSH_EVERY", "1")))
+    except ValueError:
+        return 1
+
+
+def get_push_interval() -> Optional[float]:
+    """Seconds between background pushes of queued commits (FACTORY_PUSH_INTERVAL, also --push-interval)."""
+    try:
+        interval = float(os.getenv("FACTORY_PUSH_INTERVAL", "0"))
+    except ValueError:
+        return None
+    return interval if interval > 0 else None
 
 
 class GitManager:
-    """A class to interact with a git repository in its current directory."""
+    """
+    A class to interact with a git repository in its current directory.
+
+    Pushes are batched when `push_every` > 1 or `push_interval` is set: push() only queues the branch, and a
+    background thread pushes once every `push_every` queued pushes or every `push_interval` seconds. Call
+    close() when done to push whatever is still queued. When pygit2 is installed, staging and committing
+    run in-process; failures raise the same RuntimeError as the git command line would.
+    """
 
-    def __init__(self, repo_path: str, branch_name: str | None = None):
+    def __init__(self, repo_path: str, branch_name: str | None = None, push_enabled: bool = True,
+                 push_every: int | None = None, push_interval: float | None = None):
         self.repo_path = Path(repo_path)
         self.branch_name = branch_name
+        # Scheduler-managed worktrees commit locally only; their parent merges and pushes.
+        self.push_enabled = push_enabled
+        self.push_every = push_every or get_push_every()
+        self.push_interval = push_interval if push_interval is not None else get_push_interval()
+
+        # Held around every git operation; callers hold it across stage + commit so concurrent agents in one
+        # workspace never interleave them.
+        self.lock = threading.RLock()
+        self._push_lock = threading.Lock()
+        self._push_wakeup = threading.Condition()
+        self._pending_pushes: Dict[str, str] = {}  # branch -> remote
+        self._queued_since_push = 0
+        self._push_thread: Optional[threading.Thread] = None
+        self._closing = False
+        self._repo = None
 
         if not all([os.getenv("GIT_USER_NAME"), os.getenv("GIT_USER_EMAIL")]):
             print("ERROR: GIT_USER_NAME and GIT_USER_EMAIL must be set in your .env file.")
+            self._env = None
             return
-    
-        self._run_command(["config", "user.name", os.getenv("GIT_USER_NAME")])
-        self._run_command(["config", "user.email", os.getenv("GIT_USER_EMAIL")])
 
-    def _run_command(self, command: List[str]) -> str:
-        try:
-            return subprocess.run(
-                ["git"] + command, cwd=self.repo_path,
-                capture_output=True, text=True, check=True
-            ).stdout.strip()
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Git command failed: {' '.join(command)}\nStderr: {e.stderr}") from e
+        # The identity is passed to every git command instead of being written with two `git config` calls.
+        self._env = dict(os.environ)
+        for role in ("AUTHOR", "COMMITTER"):
+            self._env[f"GIT_{role}_NAME"] = os.getenv("GIT_USER_NAME")
+            self._env[f"GIT_{role}_EMAIL"] = os.getenv("GIT_USER_EMAIL")
+
+        if pygit2 is not None and os.getenv("FACTORY_GIT_BACKEND", "auto") != "cli":
+            try:
+                self._repo = pygit2.Repository(str(self.repo_path))
+            except Exception as e:
+                print(f"Warning: Could not open the repository with pygit2, using the git command line. Error: {e}")
+
+    def _run_command(self, command: List[str], extra_env: Optional[Dict[str, str]] = None) -> str:
+        env = self._env
+        if extra_env:
+            env = {**(env if env is not None else os.environ), **extra_env}
+        with self.lock, get_event_emitter().span("git", command[0]):
+            try:
+                return subprocess.run(
+                    ["git"] + command, cwd=self.repo_path, env=env,
+                    capture_output=True, text=True, check=True
+                ).stdout.strip()
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Git command failed: {' '.join(command)}\nStderr: {e.stderr}") from e
 
     def checkout_branch(self, branch_name: str, new: bool = True):
         """Creates and checks out a new branch from the current HEAD."""
@@ -38,16 +103,180 @@ class GitManager:
         self.branch_name = branch_name
 
     def stage_files(self, files: List[str]):
-        self._run_command(["add"] + files)
+        """Like `git add <files>`; a listed path that no longer exists stages its deletion (nothing if it was never tracked)."""
+        if self._repo is None:
+            existing = [f for f in files if os.path.lexists(self.repo_path / f)]
+            missing = [f for f in files if f not in existing]
+            if existing:
+                self._run_command(["add", "-A", "--"] + existing)
+            if missing:
+                self._run_command(["rm", "--cached", "--ignore-unmatch", "-r", "-q", "--"] + missing)
+            return
+        # An empty pathspec list matches the whole working tree
+        pathspecs = [] if files == ["."] else files
+        try:
+            with self.lock, get_event_emitter().span("git", "add"):
+                self._stage_in_process(pathspecs)
+        except Exception as e:
+            raise RuntimeError(f"Git command failed: add {' '.join(files)}\nStderr: {e}") from e
+
+    def _stage_in_process(self, pathspecs: List[str]):
+        index = self._repo.index
+        index.read()
+        # Like `git add <paths>`: new and modified files are added, deleted ones removed.
+        index.add_all(pathspecs)
+        index.update_all(pathspecs)
+        index.write()
 
     def commit(self, message: str):
-        self._run_command(["commit", "-m", message])
+        if self._repo is None:
+            self._run_command(["commit", "-m", message])
+            return
+        try:
+            with self.lock, get_event_emitter().span("git", "commit"):
+                self._commit_in_process(message)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Git command failed: commit -m {message}\nStderr: {e}") from e
+
+    def _commit_in_process(self, message: str):
+        repo = self._repo
+        index = repo.index
+        index.read()
+        tree = index.write_tree()
+        parents = [] if repo.head_is_unborn else [repo.head.target]
+        merge_head = Path(repo.path) / "MERGE_HEAD"
+        if merge_head.exists():
+            parents += [pygit2.Oid(hex=line.strip()) for line in merge_head.read_text().splitlines() if line.strip()]
+        elif parents and repo[parents[0]].tree_id == tree:
+            raise RuntimeError(f"Git command failed: commit -m {message}\nStderr: nothing to commit, working tree clean")
+
+        signature = pygit2.Signature(os.getenv("GIT_USER_NAME"), os.getenv("GIT_USER_EMAIL"))
+        ref = "HEAD" if not repo.head_is_detached else None
+        oid = repo.create_commit(ref, signature, signature, message, tree, parents)
+        if ref is None:
+            repo.set_head(oid)
+        repo.state_cleanup()
+
+    def current_branch(self) -> str:
+        return self._run_command(["rev-parse", "--abbrev-ref", "HEAD"])
+
+    def add_worktree(self, path: str | Path, branch_name: str, start_point: str):
+        """Creates a new branch from `start_point` checked out in a separate worktree at `path`."""
+        self._run_command(["worktree", "add", "-b", branch_name, str(path), start_point])
+
+    def remove_worktree(self, path: str | Path):
+        self._run_command(["worktree", "remove", "--force", str(path)])
+
+    def delete_branch(self, branch_name: str):
+        self._run_command(["branch", "-D", branch_name])
+
+    def merge(self, branch_name: str, commit: bool = False, message: str | None = None):
+        """Merges `branch_name` into the current branch. With commit=False the merge is left staged."""
+        command = ["merge", "--no-ff"]
+        if commit:
+            command += ["-m", message or f"Merge branch '{branch_name}'"]
+        else:
+            command.append("--no-commit")
+        self._run_command(command + [branch_name])
+
+    def abort_merge(self):
+        self._run_command(["merge", "--abort"])
+
+    def conflicted_files(self) -> List[str]:
+        output = self._run_command(["diff", "--name-only", "--diff-filter=U"])
+        return [line for line in output.splitlines() if line]
+
+    def restore_file(self, path: str, source: str = "HEAD"):
+        """Resets `path` in the index and working tree to its content at `source`."""
+        self._run_command(["checkout", source, "--", path])
 
     def pull(self, branch_name: str | None = None,  remote_name: str = "origin"):
         self._run_command(["pull", remote_name, branch_name if branch_name else self.branch_name])
 
     def push(self, branch_name: str | None = None, remote_name: str = "origin"):
-        """Pushes the specified branch to the remote, using credentials from .env."""
+        """
+        Pushes the specified branch to the remote, using credentials from .env. In batched mode the push is
+        queued and sent by the background thread (see the class docstring).
+        """
+        if not self.push_enabled:
+            print("Push skipped: pushing is disabled for this repository checkout.")
+            return
+
+        branch_name = branch_name if branch_name else self.branch_name
+        if self.push_every <= 1 and not self.push_interval:
+            self._push_now(branch_name, remote_name)
+            return
+
+        with self._push_wakeup:
+            self._pending_pushes[branch_name] = remote_name
+            self._queued_since_push += 1
+            print(f"Queued push of branch '{branch_name}' ({self._queued_since_push}/{self.push_every}).")
+            if self._push_thread is None:
+                self._push_thread = threading.Thread(target=self._push_loop, name="git-push", daemon=True)
+                self._push_thread.start()
+            if self._queued_since_push >= self.push_every:
+                self._push_wakeup.notify()
+
+    def flush_pushes(self):
+        """Pushes every queued branch now. Raises the first push error."""
+        with self._push_wakeup:
+            pending = self._pending_pushes
+            self._pending_pushes = {}
+            self._queued_since_push = 0
+        errors = []
+        for branch_name, remote_name in pending.items():
+            try:
+                self._push_now(branch_name, remote_name)
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """Stops the background pusher and pushes whatever is still queued."""
+        with self._push_wakeup:
+            self._closing = True
+            self._push_wakeup.notify()
+        if self._push_thread is not None:
+            self._push_thread.join()
+            self._push_thread = None
+        self.flush_pushes()
+
+    def _push_loop(self):
+        while True:
+            with self._push_wakeup:
+                if not self._closing and self._queued_since_push < self.push_every:
+                    self._push_wakeup.wait(self.push_interval)
+                if self._closing:
+                    return
+                if not self._pending_pushes:
+                    continue
+            try:
+                self.flush_pushes()
+            except Exception as e:
+                print(f"Could not push': {e}")
+
+    def _push_env(self, remote_name: str, repo_url: str) -> Dict[str, str]:
+        """
+        Config for one push, passed through the environment so nothing is written to the repository's
+        .git/config (shared by its worktrees): the remote pushes to GIT_REPO_URL, and a credential helper
+        answers with GIT_USER_NAME and GIT_PAT from the environment, so the token never appears in a URL,
+        in the config or on a command line.
+        """
+        config = [
+            (f"remote.{remote_name}.pushurl", repo_url),
+            ("credential.helper", ""),  # ignore the user's helpers for this push
+            ("credential.helper", _CREDENTIAL_HELPER),
+        ]
+        env = {"GIT_CONFIG_COUNT": str(len(config)), "GIT_TERMINAL_PROMPT": "0"}
+        for i, (key, value) in enumerate(config):
+            env[f"GIT_CONFIG_KEY_{i}"] = key
+            env[f"GIT_CONFIG_VALUE_{i}"] = value
+        return env
+
+    def _push_now(self, branch_name: str, remote_name: str):
         repo_url = os.getenv("GIT_REPO_URL")
         username = os.getenv("GIT_USER_NAME")
         pat = os.getenv("GIT_PAT")
@@ -55,12 +284,6 @@ class GitManager:
         if not all([repo_url, username, pat]):
             raise ValueError("GIT_REPO_URL, GIT_USER_NAME, and GIT_PAT must be set in .env for push operations.")
 
-        # Construct the authenticated URL
-        parsed_url = urlparse(repo_url)
-        authenticated_url = f"{parsed_url.scheme}://{username}:{pat}@{parsed_url.netloc}{parsed_url.path}"
-        
-        # Set the remote URL to the authenticated one for this push command
-        self._run_command(["remote", "set-url", remote_name, authenticated_url])
-        
-        print(f"Pushing branch '{branch_name if branch_name else self.branch_name}' to remote repository...")
-        self._run_command(["push", "-u", remote_name, branch_name if branch_name else self.branch_name])
\ No newline at end of file
+        with self._push_lock:
+            print(f"Pushing branch '{branch_name}' to remote repository...")
+            self._run_command(["push", "-u", remote_name, branch_name], self._push_env(remote_name, repo_url))
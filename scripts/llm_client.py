@@ -0,0 +1,251 @@
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Lazy-safe import for litellm
+try:
+    from litellm import acompletion, get_supported_openai_params
+except Exception:
+    async def acompletion(*args, **kwargs):
+        raise RuntimeError("litellm is not available in this environment.")
+
+    def get_supported_openai_params(*args, **kwargs):
+        return None
+
+from scripts.completion_cache import get_completion_cache
+from scripts.events import get_event_emitter
+from scripts.rate_limiter import estimate_tokens, get_rate_limiter
+
+RESPONSE_FORMAT = {"type": "json_object"}
+# Providers that only cache prompt prefixes marked with explicit cache_control hints. Others (e.g. OpenAI)
+# cache long stable prefixes automatically.
+CACHE_HINT_MODEL_MARKERS = ("anthropic", "claude")
+
+
+class Completion:
+    """An agent turn's response content and its normalised token usage."""
+    __slots__ = ("content", "prompt_tokens", "completion_tokens", "cached_tokens", "cache_write_tokens")
+
+    def __init__(self, content: str, usage: Any = None):
+        self.content = content
+        self.prompt_tokens = _usage_value(usage, "prompt_tokens")
+        self.completion_tokens = _usage_value(usage, "completion_tokens")
+        details = _usage_value(usage, "prompt_tokens_details", None)
+        # OpenAI reports prompt_tokens_details.cached_tokens, Anthropic cache_read_input_tokens.
+        self.cached_tokens = _usage_value(details, "cached_tokens") or _usage_value(usage, "cache_read_input_tokens")
+        self.cache_write_tokens = _usage_value(usage, "cache_creation_input_tokens")
+
+    def usage(self) -> Dict[str, int]:
+        """Usage in the shape Completion() accepts, e.g. for storing in the completion cache."""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_read_input_tokens": self.cached_tokens,
+            "cache_creation_input_tokens": self.cache_write_tokens,
+        }
+
+
+def _usage_value(usage: Any, key: str, default: Any = 0) -> Any:
+    if usage is None:
+        return default
+    value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+    return default if value is None else value
+
+
+class PromptCacheStats:
+    """Per-run prompt cache accounting: a turn is a hit when the provider served part of its prompt from cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+
+    def record(self, completion: Completion):
+        with self._lock:
+            if completion.cached_tokens:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.prompt_tokens += completion.prompt_tokens
+            self.cached_tokens += completion.cached_tokens
+            self.cache_write_tokens += completion.cache_write_tokens
+
+    def report(self) -> str:
+        turns = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / turns) if turns else 0.0
+        token_rate = (100.0 * self.cached_tokens / self.prompt_tokens) if self.prompt_tokens else 0.0
+        return (
+            f"Prompt cache: {self.hits} hits / {self.misses} misses over {turns} turns ({hit_rate:.1f}%); "
+            f"{self.cached_tokens}/{self.prompt_tokens} prompt tokens served from cache ({token_rate:.1f}%), "
+            f"{self.cache_write_tokens} written to cache."
+        )
+
+
+PROMPT_CACHE_STATS = PromptCacheStats()
+
+
+def supports_cache_hints(model: str) -> bool:
+    return any(marker in model.lower() for marker in CACHE_HINT_MODEL_MARKERS)
+
+
+def cacheable_system_message(model: str, content: str) -> Dict[str, Any]:
+    """System message for a stable prompt prefix, with a prompt-cache breakpoint where the model needs one."""
+    if not supports_cache_hints(model):
+        return {"role": "system", "content": content}
+    return {
+        "role": "system",
+        "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}],
+    }
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """The text of a message whose content is either a string or a list of content blocks."""
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+class ToolCallStreamParser:
+    """
+    Incrementally scans a streamed agent response (see docs/agent_response_example.json) and returns each
+    element of the top-level "tool_calls" array as soon as its closing brace has arrived, so the
+    orchestrator can start executing tools before the completion has finished streaming.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._in_tool_calls = False
+        self._element_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self._buf += text
+        calls = []
+        buf = self._buf
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = buf[self._string_start + 1:self._pos]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_string == "tool_calls":
+                    self._in_tool_calls = True
+                elif ch == "{" and self._depth == 3 and self._in_tool_calls:
+                    self._element_start = self._pos
+            elif ch in "}]":
+                if ch == "}" and self._depth == 3 and self._element_start is not None:
+                    try:
+                        calls.append(json.loads(buf[self._element_start:self._pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._element_start = None
+                elif ch == "]" and self._depth == 2:
+                    self._in_tool_calls = False
+                self._depth -= 1
+            self._pos += 1
+        return calls
+
+
+async def request_completion(model: str, messages: List[Dict[str, Any]], stream: bool = False,
+                             on_tool_call: Callable[[Dict[str, Any]], None] | None = None) -> Completion:
+    """
+    Requests one agent turn and returns its Completion; prompt cache usage is added to PROMPT_CACHE_STATS.
+
+    With stream=True the completion is streamed and `on_tool_call` is invoked with every tool call
+    as soon as it has been fully received. When the completion cache is on (see completion_cache),
+    recorded completions are returned without calling the model.
+    Calls go through the process-wide RateLimiter, which paces them and retries rate-limited, overloaded
+    and timed-out ones (a streamed one only until it has handed out a tool call).
+    """
+    events = get_event_emitter()
+    start = time.monotonic()
+    cache = get_completion_cache()
+    cache_key = None
+    with events.span("llm", model) as span:
+        if cache:
+            cache_key = cache.key(model, messages, RESPONSE_FORMAT)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                completion = Completion(entry["content"], entry.get("usage"))
+                span.update(cached=True, promptTokens=completion.prompt_tokens, completionTokens=completion.completion_tokens)
+                events.usage(model, completion.usage(), (time.monotonic() - start) * 1000, cached=True)
+                return completion
+
+        tool_calls_sent = []
+
+        def forward_tool_call(call: Dict[str, Any]):
+            tool_calls_sent.append(call)
+            if on_tool_call:
+                on_tool_call(call)
+
+        async def request() -> Completion:
+            if stream:
+                return await _stream_completion(model, messages, forward_tool_call)
+            response = await acompletion(model=model, messages=messages, response_format=RESPONSE_FORMAT)
+            return Completion(response.choices[0].message.content, getattr(response, "usage", None))
+
+        completion = await get_rate_limiter().call(
+            model,
+            request,
+            estimated_tokens=estimate_tokens([message_text(m) for m in messages]),
+            used_tokens=lambda c: c.prompt_tokens + c.completion_tokens,
+            # Tools a partial stream already started cannot be taken back, so that turn is not retried
+            can_retry=lambda: not tool_calls_sent,
+        )
+        span.update(cached=False, promptTokens=completion.prompt_tokens, completionTokens=completion.completion_tokens)
+    events.usage(model, completion.usage(), (time.monotonic() - start) * 1000)
+    PROMPT_CACHE_STATS.record(completion)
+
+    if cache:
+        cache.put(cache_key, {"model": model, "content": completion.content, "usage": completion.usage()})
+    return completion
+
+
+@functools.lru_cache(maxsize=None)
+def _stream_options(model: str) -> Dict[str, Any]:
+    """stream_options asking for usage in the last chunk, for providers that accept it (others reject the call)."""
+    try:
+        supported = get_supported_openai_params(model=model) or []
+    except Exception:
+        supported = []
+    return {"stream_options": {"include_usage": True}} if "stream_options" in supported else {}
+
+
+async def _stream_completion(model: str, messages: List[Dict[str, Any]],
+                             on_tool_call: Callable[[Dict[str, Any]], None] | None) -> Completion:
+    parser = ToolCallStreamParser()
+    parts = []
+    usage = None
+    response = await acompletion(model=model, messages=messages, response_format=RESPONSE_FORMAT, stream=True,
+                                 **_stream_options(model))
+    async for chunk in response:
+        usage = getattr(chunk, "usage", None) or usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        parts.append(delta)
+        for call in parser.feed(delta):
+            if on_tool_call:
+                on_tool_call(call)
+    return Completion("".join(parts), usage)
@@ -0,0 +1,204 @@
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from scripts.factory_paths import get_data_dir
+from scripts.worker_pool import WorkerPool
+
+TRACER_PATH = Path(__file__).resolve().parent / "dep_tracer.py"
+MISSING = "missing"
+_DESCRIBE_INTERPRETER = "import sys; print(sys.version.replace(chr(10), ' '), sys.prefix)"
+
+
+def is_test_cache_enabled() -> bool:
+    """FACTORY_TEST_CACHE=0 (also run_tests.py --no-cache) always re-executes tests."""
+    return os.getenv("FACTORY_TEST_CACHE", "1") != "0"
+
+
+@functools.lru_cache(maxsize=None)
+def interpreter_version(python: str) -> Optional[str]:
+    """Version and prefix (venv) of the `python` command, asked once per process; None if it cannot be run."""
+    try:
+        proc = subprocess.run([python, "-c", _DESCRIBE_INTERPRETER], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return proc.stdout.strip() if proc.returncode == 0 and proc.stdout.strip() else None
+
+
+class RunResult:
+    __slots__ = ("returncode", "stdout", "stderr", "duration", "cached")
+
+    def __init__(self, returncode: int, stdout: str, stderr: str, duration: float, cached: bool = False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.cached = cached
+
+
+class OutcomeCache:
+    """
+    Dependency-aware cache of test outcomes for one project root, stored under .thefactory/test_cache/.
+
+    Tests run through scripts/dep_tracer.py, which records the files (inside the root or not) that the test
+    imported, read, listed or checked for. The outcome is stored with a fingerprint of each of those
+    dependencies; as long as none of them changed (checked by mtime/size first, then by content hash), run()
+    returns the stored outcome without executing the test. Timed-out runs are never cached, nor are tests the
+    tracer cannot follow, such as ones that start subprocesses. With a `pool`, tests that do have to run are
+    forked from its warm workers instead of starting a new interpreter. Outcomes are only replayed for the
+    interpreter (version and prefix) that produced them, as reported by that interpreter itself.
+    """
+
+    def __init__(self, root: str | Path, enabled: Optional[bool] = None, pool: Optional[WorkerPool] = None):
+        self.root = Path(root).resolve()
+        self.enabled = is_test_cache_enabled() if enabled is None else enabled
+        self.pool = pool
+        self._dir = get_data_dir(self.root, "test_cache")
+
+    def run(self, test_path: str | Path, timeout: Optional[float] = None, python: str = sys.executable, cwd: str | Path | None = None) -> RunResult:
+        """Runs `test_path` (or returns its cached outcome). Raises subprocess.TimeoutExpired like subprocess.run."""
+        test_path = Path(test_path).resolve()
+        if self.enabled:
+            cached = self.lookup(test_path, self.pool.python if self.pool is not None else python)
+            if cached is not None:
+                return cached
+
+        fd, deps_path = tempfile.mkstemp(prefix="deps-", suffix=".json", dir=self._dir)
+        os.close(fd)
+        try:
+            start = time.monotonic()
+            returncode, stdout, stderr, used_python = self._execute(test_path, deps_path, timeout, python, cwd)
+            result = RunResult(returncode, stdout, stderr, time.monotonic() - start)
+            if self.enabled:
+                self._store(test_path, deps_path, result, used_python)
+            return result
+        finally:
+            try:
+                os.unlink(deps_path)
+            except OSError:
+                pass
+
+    def _execute(self, test_path: Path, deps_path: str, timeout: Optional[float], python: str, cwd: str | Path | None):
+        """Returns (exit code, stdout, stderr, the python command that ran the test)."""
+        if self.pool is not None:
+            try:
+                return (*self.pool.run(self.root, deps_path, test_path, timeout=timeout, cwd=cwd), self.pool.python)
+            except RuntimeError as e:
+                print(f"Warning: Warm test worker failed, running the test in a new interpreter. Error: {e}")
+        proc = subprocess.run(
+            [python, str(TRACER_PATH), str(self.root), deps_path, str(test_path)],
+            capture_output=True, text=True, timeout=timeout, cwd=cwd,
+        )
+        return proc.returncode, proc.stdout, proc.stderr, python
+
+    def lookup(self, test_path: Path, python: str = sys.executable) -> Optional[RunResult]:
+        """The stored outcome of `test_path` if it ran under the same `python` and none of its dependencies changed."""
+        version = interpreter_version(python)
+        if version is None:
+            return None
+        entry = self._load(test_path)
+        if entry is None or entry.get("python") != version:
+            return None
+        deps = entry["deps"]
+        for rel_path, dep in deps.items():
+            if not self._unchanged(rel_path, dep):
+                return None
+        return RunResult(entry["returncode"], entry["stdout"], entry["stderr"], 0.0, cached=True)
+
+    def invalidate(self):
+        for entry_path in self._dir.glob("*.json"):
+            try:
+                entry_path.unlink()
+            except OSError:
+                pass
+
+    def _entry_path(self, test_path: Path) -> Path:
+        return self._dir / f"{hashlib.sha1(str(test_path).encode('utf-8')).hexdigest()}.json"
+
+    def _load(self, test_path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._entry_path(test_path), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return entry
+
+    def _store(self, test_path: Path, deps_path: str, result: RunResult, python: str):
+        version = interpreter_version(python)
+        if version is None:
+            return
+        try:
+            with open(deps_path, "r", encoding="utf-8") as f:
+                traced = json.load(f)
+            kinds: Dict[str, str] = traced["deps"]
+        except (OSError, json.JSONDecodeError, KeyError, TypeError):
+            # The test bypassed the tracer's bookkeeping (e.g. os._exit): not cacheable
+            return
+        if traced.get("uncacheable"):
+            return
+        entry = {
+            "python": version,
+            "returncode": result.returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "deps": {rel_path: self._fingerprint(rel_path, kind) for rel_path, kind in kinds.items()},
+        }
+        entry_path = self._entry_path(test_path)
+        fd, tmp_path = tempfile.mkstemp(prefix=".entry-", suffix=".tmp", dir=self._dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            print(f"Warning: Could not store cached test result for {test_path}. Error: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def _fingerprint(self, rel_path: str, kind: str) -> List[Any]:
+        """[kind, mtime_ns, size, digest]; digest is MISSING when the path does not exist. Absolute paths are outside the root."""
+        full_path = self.root / rel_path
+        try:
+            st = full_path.stat()
+        except OSError:
+            return [kind, 0, 0, MISSING]
+        return [kind, st.st_mtime_ns, st.st_size, _digest(full_path, kind)]
+
+    def _unchanged(self, rel_path: str, dep: List[Any]) -> bool:
+        kind, mtime_ns, size, digest = dep
+        full_path = self.root / rel_path
+        try:
+            st = full_path.stat()
+        except OSError:
+            return digest == MISSING
+        if digest == MISSING:
+            return False
+        if kind == "file" and st.st_mtime_ns == mtime_ns and st.st_size == size:
+            return True
+        return _digest(full_path, kind) == digest
+
+
+def _digest(path: Path, kind: str) -> str:
+    h = hashlib.sha1()
+    try:
+        if path.is_dir():
+            # Listing a directory depends on its entries; stat-ing it only on its existence
+            if kind == "dir":
+                h.update("\n".join(sorted(os.listdir(path))).encode("utf-8", errors="surrogateescape"))
+            else:
+                h.update(b"<dir>")
+        else:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+    except OSError:
+        return MISSING
+    return h.hexdigest()
@@ -0,0 +1,53 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# Add project root (framework root) to sys.path
+framework_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(framework_root))
+
+import scripts.task_utils as task_utils
+
+STATUS_NAMES = {"+": "done", "~": "in progress", "-": "pending", "?": "blocked", "=": "deferred"}
+
+
+def _counts(counts) -> str:
+    return ", ".join(f"{n} {STATUS_NAMES.get(status, status)}" for status, n in sorted(counts.items(), key=lambda c: -c[1])) or "none"
+
+
+def print_status(status):
+    rollup = status["rollup"]
+    print(f"Tasks:    {sum(rollup['tasks'].values())} ({_counts(rollup['tasks'])})")
+    print(f"Features: {sum(rollup['features'].values())} ({_counts(rollup['features'])})")
+
+    if status["requirements"]:
+        print("\nRequirements:")
+        for r in status["requirements"]:
+            missing = f", missing tasks {r['missingTasks']}" if r["missingTasks"] else ""
+            print(f"  [{'x' if r['complete'] else ' '}] {r['id']}: {r['tasksDone']}/{len(r['tasks'])} tasks, "
+                  f"{r['featuresDone']}/{r['featuresTotal']} features done{missing} - {r['description']}")
+
+    if status["blocked"]:
+        print("\nBlocked features:")
+        for b in status["blocked"]:
+            waiting = f" waiting on {', '.join(b['unmetBlockers'])}" if b["unmetBlockers"] else ""
+            print(f"  {b['taskId']}.{b['featureId']} ({STATUS_NAMES.get(b['status'], b['status'])}){waiting} - {b['title']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a project's task/feature status rollup, requirement coverage and blocked features.")
+    parser.add_argument("--project-dir", type=str, help="Target project directory. (default: current directory)")
+    parser.add_argument("--json", action="store_true", help="Print the status as JSON.")
+    args = parser.parse_args()
+
+    task_utils.set_project_root(Path(args.project_dir).resolve() if args.project_dir else Path.cwd())
+    status = task_utils.get_project_status()
+    if args.json:
+        print(json.dumps(status, indent=2))
+    else:
+        print_status(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_MAX_CONCURRENCY = 32
+BASE_BACKOFF_SECONDS = 1.0
+# Longest wait before a retry; a provider asking for a longer retry-after gets no retry
+MAX_BACKOFF_SECONDS = 60.0
+# Random extra wait on top of a retry-after, as a fraction of it, so callers told the same time do not return together
+RETRY_AFTER_JITTER = 0.2
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 15.0
+MAX_BREAKER_COOLDOWN_SECONDS = 240.0
+# Longest single sleep while waiting to be admitted, so waiters notice freed slots
+POLL_SECONDS = 0.25
+CHARS_PER_TOKEN = 4
+
+RATE_LIMITED = "rate_limited"
+OVERLOADED = "overloaded"
+OVERLOAD_STATUSES = (408, 500, 502, 503, 504, 529)
+_OVERLOAD_ERROR_NAMES = ("Timeout", "APIConnectionError", "ServiceUnavailable", "InternalServerError", "Overloaded")
+# Model name markers of providers whose models litellm accepts without a "provider/" prefix
+_PROVIDER_MARKERS = (("claude", "anthropic"), ("gemini", "gemini"), ("gpt", "openai"), ("o1", "openai"), ("o3", "openai"), ("o4", "openai"))
+
+
+class CircuitOpenError(RuntimeError):
+    """An LLM call given up on because its provider's circuit stays open longer than the call's retries would wait."""
+
+
+def provider_of(model: str) -> str:
+    if "/" in model:
+        return model.split("/", 1)[0]
+    lowered = model.lower()
+    return next((provider for marker, provider in _PROVIDER_MARKERS if lowered.startswith(marker)), "default")
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """RATE_LIMITED, OVERLOADED (timeouts, connection errors, 5xx) or None for errors a retry will not fix."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    name = type(error).__name__
+    if status == 429 or "RateLimit" in name:
+        return RATE_LIMITED
+    if status in OVERLOAD_STATUSES or isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return OVERLOADED
+    if any(marker in name for marker in _OVERLOAD_ERROR_NAMES):
+        return OVERLOADED
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The wait a provider asked for in its retry-after-ms or retry-after header (seconds or an HTTP date)."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    if not hasattr(headers, "get"):
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except (TypeError, ValueError):
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """`per_minute` units per minute, refilled continuously, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount: float, now: float) -> float:
+        """Takes `amount` (going into debt if needed) and returns how long to wait until it is covered."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, amount: float, now: float):
+        """Takes (or, if negative, returns) a correction, e.g. actual minus estimated tokens."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level - amount)
+
+
+class _Lane:
+    """The limits of one provider or model: request and token buckets, an AIMD concurrency window and a circuit breaker."""
+
+    def __init__(self, key: str, rpm: Optional[float], tpm: Optional[float], max_concurrency: int):
+        self.key = key
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.window = float(self.max_concurrency)
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self.paused_until = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN_SECONDS
+        self.probing = False
+
+    def admission_wait(self, now: float) -> Optional[float]:
+        """None if a call may start now, else a time to wait before checking again."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if now < self.open_until:
+            return self.open_until - now
+        if self.failures >= BREAKER_THRESHOLD and self.probing:
+            # Half-open: a single probe call is out; the rest wait for its outcome
+            return POLL_SECONDS
+        if self.in_flight >= int(self.window):
+            return POLL_SECONDS
+        return None
+
+    def admit(self, estimated_tokens: int, now: float) -> float:
+        self.in_flight += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.probing = True
+        wait = self.requests.take(1, now) if self.requests else 0.0
+        if self.tokens:
+            wait = max(wait, self.tokens.take(estimated_tokens, now))
+        return wait
+
+    def succeeded(self, token_correction: int, now: float):
+        self.in_flight -= 1
+        if self.tokens and token_correction:
+            self.tokens.adjust(token_correction, now)
+        # Additive increase: about one more concurrent call per window's worth of successes
+        self.window = min(float(self.max_concurrency), self.window + 1.0 / max(self.window, 1.0))
+        if self.failures >= BREAKER_THRESHOLD:
+            print(f"LLM circuit for {self.key} closed again.")
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN_SECONDS
+        self.probing = False
+
+    def failed(self, kind: Optional[str], started: float, pause: float, now: float):
+        """`pause` is how long a rate-limited lane stops admitting calls (the caller's retry delay)."""
+        self.in_flight -= 1
+        self.probing = False
+        if kind is None:
+            return
+        # Multiplicative decrease, once per congestion event: calls started before the last cut do not cut again
+        if started >= self.decreased_at:
+            self.window = max(1.0, self.window / 2)
+            self.decreased_at = now
+        if kind == RATE_LIMITED:
+            self.paused_until = max(self.paused_until, now + pause)
+            return
+        self.failures += 1
+        # Calls that were already out when the circuit opened do not extend it
+        if self.failures >= BREAKER_THRESHOLD and now >= self.open_until:
+            self.open_until = now + self.cooldown
+            print(f"Warning: LLM circuit for {self.key} open for {self.cooldown:.0f}s after {self.failures} failed calls in a row.")
+            self.cooldown = min(MAX_BREAKER_COOLDOWN_SECONDS, self.cooldown * 2)
+
+
+class RateLimiter:
+    """
+    Paces LLM calls of all agents in this process, per provider and per model.
+
+    - limits maps a provider ("openai") or model ("openai/gpt-4o") to {"rpm", "tpm", "concurrency"}; a call
+      counts against both its provider's and its model's entry. Requests and (estimated, then actual)
+      tokens are drawn from token buckets, so calls queue up instead of running into the provider's limit.
+    - Concurrency per lane is AIMD: it grows by one per window of successful calls up to "concurrency"
+      (default DEFAULT_MAX_CONCURRENCY) and halves on a 429 or an overload.
+    - Rate-limited, overloaded and timed-out calls are retried up to `max_retries` times. A retry-after
+      header is honoured, plus jitter, up to MAX_BACKOFF_SECONDS; a call asked to wait longer is not retried.
+      Otherwise backoff is exponential with jitter. A 429 pauses its lanes for everyone, not just the caller.
+    - After BREAKER_THRESHOLD consecutive overload failures a lane's circuit opens: calls wait out a
+      cooldown (doubling while the provider stays down), then a single probe call decides whether it closes.
+      A call whose retries would not outlast the remaining cooldown fails at once with CircuitOpenError.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.limits = limits or {}
+        self.max_retries = max(0, max_retries)
+        self._lanes: Dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = {RATE_LIMITED: 0, OVERLOADED: 0}
+        self.waited_seconds = 0.0
+
+    def _lanes_for(self, model: str) -> List[_Lane]:
+        keys = [provider_of(model)]
+        if model != keys[0]:
+            keys.append(model)
+        lanes = []
+        for key in keys:
+            lane = self._lanes.get(key)
+            if lane is None:
+                limit = self.limits.get(key) or {}
+                lane = _Lane(key, limit.get("rpm"), limit.get("tpm"), int(limit.get("concurrency") or DEFAULT_MAX_CONCURRENCY))
+                self._lanes[key] = lane
+            lanes.append(lane)
+        return lanes
+
+    async def call(self, model: str, request: Callable[[], Awaitable[T]], estimated_tokens: int = 0,
+                   used_tokens: Callable[[T], int] = lambda result: 0,
+                   can_retry: Callable[[], bool] = lambda: True) -> T:
+        """
+        Awaits `request()` once admitted, retrying it as described above. `used_tokens` gives a result's
+        actual token count; `can_retry` is asked before each retry (e.g. False once a streamed response
+        has already been acted on).
+        """
+        with self._lock:
+            self.calls += 1
+        attempt = 0
+        while True:
+            lanes, started = await self._acquire(model, estimated_tokens, self._retry_budget(attempt))
+            try:
+                result = await request()
+            except BaseException as e:
+                # Also on cancellation, so the lanes' in-flight counts stay right
+                kind = classify_error(e) if isinstance(e, Exception) else None
+                retry_after = retry_after_seconds(e)
+                delay = self._retry_delay(attempt, retry_after)
+                now = time.monotonic()
+                with self._lock:
+                    for lane in lanes:
+                        lane.failed(kind, started, delay, now)
+                if kind is None or attempt >= self.max_retries or not can_retry():
+                    raise
+                if retry_after is not None and retry_after > MAX_BACKOFF_SECONDS:
+                    print(f"Warning: {model} asked to retry after {retry_after:.0f}s, longer than the {MAX_BACKOFF_SECONDS:.0f}s limit; giving up.")
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.retries[kind] += 1
+                print(f"Warning: {model} call {kind.replace('_', ' ')} ({type(e).__name__}); retry {attempt}/{self.max_retries} in {delay:.1f}s.")
+                await self._sleep(delay)
+                continue
+            now = time.monotonic()
+            used = used_tokens(result)
+            correction = used - estimated_tokens if used else 0
+            with self._lock:
+                for lane in lanes:
+                    lane.succeeded(correction, now)
+            return result
+
+    def _retry_budget(self, attempt: int) -> float:
+        """The most time the retries left after `attempt` can spend backing off."""
+        return sum(min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** a) for a in range(attempt, self.max_retries))
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(MAX_BACKOFF_SECONDS, retry_after + random.uniform(0, retry_after * RETRY_AFTER_JITTER + 0.1))
+        backoff = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt)
+        # "Equal jitter": at least half the backoff, so retries still spread out under load
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    async def _acquire(self, model: str, estimated_tokens: int, budget: float) -> Tuple[List[_Lane], float]:
+        """Waits until every lane of `model` admits the call. Raises CircuitOpenError if one stays open beyond `budget` seconds."""
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                lanes = self._lanes_for(model)
+                open_for = max(lane.open_until - now for lane in lanes)
+                if open_for > budget:
+                    raise CircuitOpenError(f"LLM circuit for {model} is open for another {open_for:.0f}s, "
+                                           f"longer than the {budget:.0f}s its retries would wait.")
+                waits = [w for w in (lane.admission_wait(now) for lane in lanes) if w is not None]
+                if not waits:
+                    pace = max(lane.admit(estimated_tokens, now) for lane in lanes)
+                    break
+            await self._sleep(min(max(waits), POLL_SECONDS))
+        if pace > 0:
+            try:
+                await self._sleep(pace)
+            except BaseException:
+                now = time.monotonic()
+                with self._lock:
+                    for lane in lanes:
+                        lane.failed(None, now, 0.0, now)
+                raise
+        return lanes, time.monotonic()
+
+    async def _sleep(self, seconds: float):
+        with self._lock:
+            self.waited_seconds += seconds
+        await asyncio.sleep(seconds)
+
+    def report(self) -> str:
+        with self._lock:
+            windows = ", ".join(f"{lane.key} {lane.window:.1f}" for lane in self._lanes.values())
+            return (
+                f"LLM rate limiter: {self.calls} calls, {self.retries[RATE_LIMITED]} retries after rate limits, "
+                f"{self.retries[OVERLOADED]} after overloads/timeouts; {self.waited_seconds:.1f}s spent waiting. "
+                f"Concurrency windows: {windows or 'none'}."
+            )
+
+
+def load_limits(value: Optional[str]) -> Dict[str, Dict[str, float]]:
+    """FACTORY_LLM_LIMITS: a JSON object, or the path of a JSON file holding one."""
+    if not value:
+        return {}
+    try:
+        if not value.lstrip().startswith("{"):
+            with open(value, "r", encoding="utf-8") as f:
+                value = f.read()
+        limits = json.loads(value)
+        if not isinstance(limits, dict):
+            raise ValueError("expected a JSON object")
+        return {key: limit for key, limit in limits.items() if isinstance(limit, dict)}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read LLM limits from FACTORY_LLM_LIMITS; calls are not paced. Error: {e}")
+        return {}
+
+
+_RATE_LIMITER: Optional[RateLimiter] = None
+_RATE_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The process-wide limiter, configured from FACTORY_LLM_LIMITS and FACTORY_LLM_MAX_RETRIES."""
+    global _RATE_LIMITER
+    with _RATE_LIMITER_LOCK:
+        if _RATE_LIMITER is None:
+            _RATE_LIMITER = RateLimiter(
+                load_limits(os.getenv("FACTORY_LLM_LIMITS")),
+                int(os.getenv("FACTORY_LLM_MAX_RETRIES", str(DEFAULT_MAX_RETRIES))),
+            )
+        return _RATE_LIMITER
@@ -0,0 +1,291 @@
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Add project root (framework root) to sys.path
+framework_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(framework_root))
+
+import scripts.task_utils as task_utils
+
+BASELINE_FILE_NAME = "benchmark_baseline.json"
+# Committed baseline, recorded at the default scale
+DEFAULT_BASELINE_PATH = Path(__file__).resolve().parent / BASELINE_FILE_NAME
+DEFAULT_FILES = 2000
+DEFAULT_TASKS = 50
+DEFAULT_FEATURES = 2000
+DEFAULT_REPEAT = 20
+# A benchmark regresses when its median is this much slower than the baseline's...
+DEFAULT_TOLERANCE = 0.25
+# ...and slower by at least this many milliseconds, so sub-millisecond jitter never fails a run.
+MIN_REGRESSION_MS = 0.2
+# A fixed pure-Python workload is timed alongside the benchmarks, and medians are compared relative to it,
+# so a baseline recorded on one machine holds on another. Many short runs make its fastest run stable.
+CALIBRATION_LOOPS = 500
+CALIBRATION_RUNS = 200
+FEATURES_PER_TASK = 10
+BLOCKER_CHAIN_LENGTH = 10
+READ_FILES_COUNT = 200
+WORDS = (
+    "task feature agent tool graph index cache store search read write patch commit branch worker queue "
+    "token prompt context budget schedule status blocker test result stream event"
+).split()
+
+
+# --- Synthetic project ---
+
+
+def _source_file(rng: random.Random, lines: int) -> str:
+    out = []
+    for i in range(lines):
+        out.append(f"def {rng.choice(WORDS)}_{i}({rng.choice(WORDS)}):")
+        out.append(f"    return {' + '.join(repr(rng.choice(WORDS)) for _ in range(4))}")
+    return "\n".join(out) + "\n"
+
+
+def _feature(task_id: str, index: int, status: str, blockers: List[str]) -> Dict[str, Any]:
+    return {
+        "id": f"f{index}",
+        "status": status,
+        "title": f"Feature {index} of {task_id}",
+        "description": " ".join(WORDS[(index + k) % len(WORDS)] for k in range(12)),
+        "plan": "",
+        "context": [],
+        "acceptance": [f"Criterion {k}" for k in range(3)],
+        "blockers": blockers,
+    }
+
+
+def _task(task_id: str, feature_count: int, done_fraction: float) -> Dict[str, Any]:
+    """Features form blocker chains of BLOCKER_CHAIN_LENGTH; the first `done_fraction` of them are done."""
+    done = int(feature_count * done_fraction)
+    features = []
+    for i in range(feature_count):
+        blockers = [f"f{i - 1}"] if i % BLOCKER_CHAIN_LENGTH else []
+        features.append(_feature(task_id, i, "+" if i < done else "-", blockers))
+    return {
+        "id": task_id,
+        "status": "-",
+        "title": f"Task {task_id}",
+        "description": "Synthetic benchmark task.",
+        "features": features,
+        "featureIdToDisplayIndex": {f"f{i}": i for i in range(feature_count)},
+    }
+
+
+def generate_project(root: Path, files: int, tasks: int, features: int, seed: int = 0):
+    """
+    Writes a synthetic project: `files` source files under src/, `tasks` small tasks plus one large task
+    ('big') with `features` features in blocker chains, half of them done, and tasks/project.json.
+    """
+    rng = random.Random(seed)
+    for i in range(files):
+        path = root / "src" / f"pkg{i // 50}" / f"mod{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(_source_file(rng, 20))
+
+    task_ids = [f"t{i}" for i in range(tasks)] + ["big"]
+    for task_id in task_ids:
+        task = _task(task_id, features if task_id == "big" else FEATURES_PER_TASK, 0.5 if task_id == "big" else 1.0)
+        task_dir = root / "tasks" / task_id
+        task_dir.mkdir(parents=True, exist_ok=True)
+        with open(task_dir / "task.json", "w") as f:
+            json.dump(task, f, indent=4)
+    with open(root / "tasks" / "project.json", "w") as f:
+        json.dump({"id": "bench", "title": "Benchmark", "taskIdToDisplayIndex": {tid: i for i, tid in enumerate(task_ids)}}, f)
+
+
+# --- Measuring ---
+
+
+def measure(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """Runs `fn` once to warm up, then `repeat` times (each after `setup`, which is not timed)."""
+    if setup:
+        setup()
+    fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    median = samples[len(samples) // 2]
+    return {
+        "median_ms": round(median, 4),
+        "p90_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.9))], 4),
+        "min_ms": round(samples[0], 4),
+        "ops_per_s": round(1000 / median, 1) if median > 0 else 0.0,
+        "runs": repeat,
+    }
+
+
+def _calibration_workload():
+    record = {"id": "f1", "title": "calibrate", "status": "-", "blockers": ["a", "b"], "rank": 0}
+    total = 0
+    for i in range(CALIBRATION_LOOPS):
+        record["rank"] = i
+        text = json.dumps(record)
+        total += len(json.loads(text)["blockers"]) + len(text.split(",")) + (i % 7)
+    return total
+
+
+def calibrate() -> float:
+    """Fastest run of the calibration workload on this machine, in milliseconds (the least noisy figure)."""
+    return measure(_calibration_workload, CALIBRATION_RUNS)["min_ms"]
+
+
+def benchmarks(root: Path) -> Dict[str, Dict[str, Any]]:
+    """name -> {fn, setup}: the task_utils hot paths, against the synthetic project at `root`."""
+    source_files = sorted(str(p.relative_to(root)) for p in (root / "src").rglob("*.py"))[:READ_FILES_COUNT]
+    touched = root / source_files[0]
+
+    def reload_tasks():
+        task_utils.get_task_store().invalidate()
+
+    def drop_graph():
+        task_utils._TASK_GRAPHS.clear()
+
+    def touch_source():
+        touched.write_text(touched.read_text() + "\n# touched\n")
+
+    def next_feature():
+        return task_utils.find_next_available_feature(task_utils.get_task("big"), set())
+
+    return {
+        "get_task/cold": {"fn": lambda: task_utils.get_task("big"), "setup": reload_tasks},
+        "get_task/warm": {"fn": lambda: task_utils.get_task("big")},
+        "save_task": {"fn": lambda: task_utils.save_task(task_utils.get_task("big"))},
+        "find_next_available_feature": {"fn": next_feature},
+        "find_next_available_feature/new_graph": {"fn": next_feature, "setup": drop_graph},
+        "get_project_status": {"fn": task_utils.get_project_status},
+        "search_files": {"fn": lambda: task_utils.search_files("return AND cache")},
+        "search_files/after_edit": {"fn": lambda: task_utils.search_files("touched"), "setup": touch_source},
+        f"read_files/{READ_FILES_COUNT}": {"fn": lambda: task_utils.read_files(source_files)},
+        f"read_context_files/{READ_FILES_COUNT}": {"fn": lambda: task_utils.read_context_files(source_files)},
+    }
+
+
+def run_benchmarks(root: Path, repeat: int, only: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    task_utils.set_project_root(root)
+    results = {}
+    for name, bench in benchmarks(root).items():
+        if only and only not in name:
+            continue
+        results[name] = measure(bench["fn"], repeat, bench.get("setup"))
+        r = results[name]
+        print(f"{name:<44} median {r['median_ms']:>10.3f} ms   p90 {r['p90_ms']:>10.3f} ms   {r['ops_per_s']:>10.1f} ops/s")
+    return results
+
+
+# --- Baseline ---
+
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def find_regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerance: float, speed: float = 1.0) -> List[str]:
+    """Benchmarks slower than the baseline allows, after scaling its medians by `speed` (this machine's calibration / the baseline's)."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        expected = base["median_ms"] * speed
+        limit = max(expected * (1 + tolerance), expected + MIN_REGRESSION_MS)
+        if result["median_ms"] > limit:
+            regressions.append(f"{name}: median {result['median_ms']:.3f} ms vs {expected:.3f} ms expected from the baseline "
+                               f"({result['median_ms'] / expected - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the task_utils hot paths on a synthetic project and compare against a baseline.")
+    parser.add_argument("--files", type=int, default=DEFAULT_FILES, help=f"Source files in the synthetic project. (default: {DEFAULT_FILES})")
+    parser.add_argument("--tasks", type=int, default=DEFAULT_TASKS, help=f"Small tasks in the synthetic project. (default: {DEFAULT_TASKS})")
+    parser.add_argument("--features", type=int, default=DEFAULT_FEATURES, help=f"Features of the large task. (default: {DEFAULT_FEATURES})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Timed runs per benchmark. (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--only", type=str, help="Only run benchmarks whose name contains this text.")
+    parser.add_argument("--baseline", type=str, help=f"Baseline JSON to compare against. (default: scripts/{BASELINE_FILE_NAME})")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline instead of comparing.")
+    parser.add_argument("--check", action="store_true", help="For CI: also fail when there is no baseline, it was recorded at another scale, or it lacks a benchmark.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"Allowed slowdown of a median before it counts as a regression. (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--report-json", type=str, help="Write the results to this path.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated project directory.")
+    args = parser.parse_args()
+
+    scale = {"files": args.files, "tasks": args.tasks, "features": args.features}
+    root = Path(tempfile.mkdtemp(prefix="factory-bench-")).resolve()
+    try:
+        print(f"Generating synthetic project in {root} ({args.files} files, {args.tasks} tasks, {args.features} features in the large one) ...")
+        generate_project(root, args.files, args.tasks, args.features)
+        calibration_ms = calibrate()
+        results = run_benchmarks(root, max(1, args.repeat), args.only)
+        # Once more afterwards: the faster of the two is less affected by a busy or throttled machine
+        calibration_ms = min(calibration_ms, calibrate())
+        print(f"{'calibration':<44} min    {calibration_ms:>10.3f} ms")
+    finally:
+        if args.keep:
+            print(f"Kept the synthetic project in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {"scale": scale, "python": sys.version.split()[0], "calibration_ms": calibration_ms, "results": results}
+    if args.report_json:
+        with open(args.report_json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = Path(args.baseline) if args.baseline else DEFAULT_BASELINE_PATH
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {baseline_path}.")
+        sys.exit(0)
+
+    baseline = load_baseline(baseline_path)
+    if baseline is None:
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to record one.")
+        sys.exit(1 if args.check else 0)
+    if baseline.get("scale") != scale:
+        print(f"\nBaseline at {baseline_path} was recorded at scale {baseline.get('scale')}, not {scale}; not comparing.")
+        sys.exit(1 if args.check else 0)
+
+    if baseline.get("calibration_ms"):
+        speed = calibration_ms / baseline["calibration_ms"]
+        print(f"\nThis machine runs the calibration workload at {1 / speed:.2f}x the baseline's speed; medians are compared accordingly.")
+    else:
+        print(f"\nBaseline at {baseline_path} has no calibration run; record a new one with --save-baseline.")
+        if args.check:
+            sys.exit(1)
+        print("Comparing absolute times, which only holds on the machine that recorded the baseline.")
+        speed = 1.0
+
+    regressions = find_regressions(results, baseline, args.tolerance, speed)
+    missing = sorted(name for name in results if name not in baseline.get("results", {}))
+    if missing:
+        print(f"\nNot in the baseline (record a new one with --save-baseline): {', '.join(missing)}")
+        if args.check:
+            regressions += [f"{name}: no baseline" for name in missing]
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%} of the (calibrated) baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} of the (calibrated) baseline.")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Set
+
+# Add project root (framework root) to sys.path
+framework_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(framework_root))
+
+from scripts.events import get_event_emitter
+from scripts.factory_paths import get_data_dir
+import scripts.task_utils as task_utils
+
+RUN_LOCAL_AGENT_PATH = Path(__file__).resolve().parent / "run_local_agent.py"
+DEFAULT_PROJECTS_PATH = "projects"
+DEFAULT_MAX_AGENTS = 4
+RATE_WINDOW_SECONDS = 3600
+POLL_INTERVAL_SECONDS = 1.0
+AGENT_TYPES = ['developer', 'tester', 'planner', 'contexter', 'speccer', 'pipeline']
+_SUBMODULE_PATH = re.compile(r"^\s*path\s*=\s*(.+?)\s*$", re.MULTILINE)
+
+
+def discover_projects(root: Path, projects_dir: str = DEFAULT_PROJECTS_PATH, from_gitmodules: bool = False) -> List[Path]:
+    """
+    The child projects of `root`: every directory under `projects_dir`, or with `from_gitmodules` the submodule
+    paths listed in .gitmodules. Only directories with a tasks/ folder are projects.
+    """
+    if from_gitmodules:
+        try:
+            candidates = [root / path for path in _SUBMODULE_PATH.findall((root / ".gitmodules").read_text())]
+        except OSError as e:
+            print(f"Warning: Could not read {root / '.gitmodules'}. Error: {e}")
+            return []
+    else:
+        base = root / projects_dir
+        candidates = sorted(p for p in base.iterdir() if p.is_dir()) if base.is_dir() else []
+    return [p.resolve() for p in candidates if (p / task_utils.TASKS_DIR_NAME).is_dir()]
+
+
+class _Project:
+    __slots__ = ("root", "name", "attempted", "starts", "running", "finished", "failures")
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.name = root.name
+        self.attempted: Set[str] = set()
+        self.starts: Deque[float] = deque()
+        self.running: Optional["_AgentRun"] = None
+        self.finished = False
+        self.failures = 0
+
+
+class _AgentRun:
+    __slots__ = ("project", "task_id", "log_path", "process", "started")
+
+    def __init__(self, project: _Project, task_id: str, log_path: Path, process: subprocess.Popen):
+        self.project = project
+        self.task_id = task_id
+        self.log_path = log_path
+        self.process = process
+        self.started = time.monotonic()
+
+
+class Fleet:
+    """
+    Runs agents over the pending tasks of many child projects at once.
+
+    - At most `max_agents` agent processes run at a time across the fleet. A project runs one at a time, as
+      its agents share its checkout and each checks out its task's branch.
+    - A project starts at most `runs_per_hour` agent runs in any hour (no limit if None); free slots go to
+      the projects in turn.
+    - Each project's next task comes from its TaskIndex. The indexes and task stores of all projects stay
+      in this process's memory for the whole run, so picking the next task after an agent finishes only
+      re-reads the task files that agent changed.
+    - Agents are run_local_agent.py processes, so each loads its own project's .env (git remote and
+      credentials). A task is run at most once per fleet run; one an agent could not finish does not loop.
+    """
+
+    def __init__(self, model: str, agent_type: str, projects: List[Path], max_agents: int = DEFAULT_MAX_AGENTS,
+                 runs_per_hour: Optional[int] = None, agent_args: Optional[List[str]] = None):
+        self.model = model
+        self.agent_type = agent_type
+        self.max_agents = max(1, max_agents)
+        self.runs_per_hour = runs_per_hour
+        self.agent_args = list(agent_args or [])
+        self._projects = [_Project(root) for root in projects]
+        self._running: Dict[str, _AgentRun] = {}
+        self._turn = 0
+        self._runs = 0
+
+    def run(self):
+        rate = f", at most {self.runs_per_hour} runs per project per hour" if self.runs_per_hour else ""
+        print(f"Fleet: {self.agent_type} agents over {len(self._projects)} project(s), up to {self.max_agents} at a time{rate}.")
+        try:
+            while True:
+                self._collect_finished()
+                self._start_agents()
+                if not self._running and all(p.finished for p in self._projects):
+                    break
+                time.sleep(POLL_INTERVAL_SECONDS)
+        except KeyboardInterrupt:
+            print("\n--- Fleet interrupted. Stopping agents. ---")
+            for agent in self._running.values():
+                agent.process.terminate()
+            raise
+        finally:
+            for agent in self._running.values():
+                agent.process.wait()
+        self._print_summary()
+
+    # --- Scheduling ---
+
+    def _start_agents(self):
+        for _ in range(len(self._projects)):
+            if len(self._running) >= self.max_agents:
+                return
+            project = self._projects[self._turn]
+            self._turn = (self._turn + 1) % len(self._projects)
+            if project.running or project.finished or not self._rate_allows(project):
+                continue
+            task_id = self._next_task(project)
+            if task_id is None:
+                print(f"Fleet: no more available tasks in {project.name}.")
+                project.finished = True
+                continue
+            self._start(project, task_id)
+
+    def _rate_allows(self, project: _Project) -> bool:
+        if not self.runs_per_hour:
+            return True
+        now = time.monotonic()
+        while project.starts and now - project.starts[0] >= RATE_WINDOW_SECONDS:
+            project.starts.popleft()
+        return len(project.starts) < self.runs_per_hour
+
+    def _next_task(self, project: _Project) -> Optional[str]:
+        task_utils.set_project_root(project.root)
+        try:
+            task = task_utils.find_next_pending_task(project.attempted)
+        except Exception as e:
+            print(f"Warning: Could not pick a task in {project.name}. Error: {e}")
+            return None
+        return task.get("id") if task else None
+
+    def _start(self, project: _Project, task_id: str):
+        log_path = get_data_dir(project.root, "logs", task_id) / f"fleet-{self.agent_type}.log"
+        command = [
+            sys.executable, str(RUN_LOCAL_AGENT_PATH),
+            "--model", self.model,
+            "--agent", self.agent_type,
+            "--task", task_id,
+            "--project-dir", str(project.root),
+            *self.agent_args,
+        ]
+        with open(log_path, "w") as log_file:
+            process = subprocess.Popen(command, cwd=framework_root, stdout=log_file, stderr=subprocess.STDOUT)
+        agent = _AgentRun(project, task_id, log_path, process)
+        project.attempted.add(task_id)
+        project.starts.append(agent.started)
+        project.running = agent
+        self._running[f"{project.name}/{task_id}"] = agent
+        self._runs += 1
+        print(f"Fleet: started {self.agent_type} on {project.name} task [{task_id}] (log: {log_path})")
+
+    def _collect_finished(self):
+        for key, agent in list(self._running.items()):
+            code = agent.process.poll()
+            if code is None:
+                continue
+            del self._running[key]
+            agent.project.running = None
+            if code != 0:
+                agent.project.failures += 1
+            print(f"Fleet: {agent.project.name} task [{agent.task_id}] finished with exit code {code} after {time.monotonic() - agent.started:.0f}s.")
+
+    def _print_summary(self):
+        print(f"\nFleet finished: {self._runs} agent run(s).")
+        for project in self._projects:
+            task_utils.set_project_root(project.root)
+            try:
+                features = task_utils.get_project_status()["rollup"]["features"]
+                done = f"{features.get('+', 0)}/{sum(features.values())} features done"
+            except Exception as e:
+                done = f"status unavailable ({e})"
+            failed = f", {project.failures} failed" if project.failures else ""
+            print(f"  {project.name:<32} {len(project.attempted)} task(s) run{failed}; {done}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agents over the pending tasks of all child projects at once.")
+    parser.add_argument("--model", type=str, default="gpt-5", help="LLM model name.")
+    parser.add_argument("--agent", type=str, required=True, choices=AGENT_TYPES, help="Agent persona to run on every task, or 'pipeline'.")
+    parser.add_argument("--projects-dir", type=str, default=DEFAULT_PROJECTS_PATH, help=f"Directory holding the child projects. (default: {DEFAULT_PROJECTS_PATH})")
+    parser.add_argument("--gitmodules", action="store_true", help="Take the child projects from .gitmodules instead of --projects-dir.")
+    parser.add_argument("--project", action="append", help="Only run this child project (by directory name); repeatable.")
+    parser.add_argument("--max-agents", type=int, default=DEFAULT_MAX_AGENTS, help=f"Agents running at once across all projects. (default: {DEFAULT_MAX_AGENTS})")
+    parser.add_argument("--runs-per-hour", type=int, help="Optional: At most this many agent runs started per project per hour.")
+    parser.add_argument("--workers", type=int, help="Optional: Passed on to each agent run (features run concurrently within a task).")
+    parser.add_argument("--stages", type=str, help="Optional: Passed on to each agent run with --agent pipeline.")
+    parser.add_argument("--events", type=str, help="Optional: Append structured JSONL run events of all agents to this file.")
+    args = parser.parse_args()
+
+    if args.events:
+        os.environ["FACTORY_EVENTS_FILE"] = str(Path(args.events).resolve())
+    # Exports FACTORY_RUN_ID, so all agents of the fleet report under one run
+    get_event_emitter()
+
+    projects = discover_projects(framework_root, args.projects_dir, args.gitmodules)
+    if args.project:
+        projects = [p for p in projects if p.name in args.project]
+    if not projects:
+        print("No child projects with a tasks/ directory found.")
+        sys.exit(0)
+
+    agent_args = []
+    if args.workers:
+        agent_args += ["--workers", str(args.workers)]
+    if args.stages:
+        agent_args += ["--stages", args.stages]
+    Fleet(args.model, args.agent, projects, args.max_agents, args.runs_per_hour, agent_args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import argparse
+import asyncio
+import contextvars
 import json
 import os
 import sys
@@ -10,24 +12,31 @@ from typing import Dict, Any, List, Optional, Callable, Tuple
 import tempfile
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 # Add project root (framework root) to sys.path
 framework_root = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(framework_root))
 
-# Lazy-safe import for litellm
-try:
-    from litellm import completion
-except Exception:
-    def completion(*args, **kwargs):
-        raise RuntimeError("litellm is not available in this environment.")
-
 from docs.tasks.task_format import Task, Feature
+from scripts.feature_pipeline import PIPELINE_STAGES, FeaturePipeline
+from scripts.feature_scheduler import FeatureScheduler
 from scripts.git_manager import GitManager
+from scripts.completion_cache import CACHE_MODES, CacheMiss, get_completion_cache
+from scripts.context_budget import ContextBudgeter
+from scripts.events import get_event_emitter
+from scripts.rate_limiter import get_rate_limiter
+import scripts.llm_client as llm_client
 import scripts.task_utils as task_utils
 
 # --- Constants ---
 MAX_TURNS_PER_FEATURE = 100
+# Tools without side effects; calls to these in one response run concurrently.
+READ_ONLY_TOOLS = {"read_files", "search_files", "list_files"}
+CONCLUDING_TOOLS = {"finish_feature", "block_feature", "finish_spec", "block_task"}
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tool")
+# Stream completions so tool calls can start before the whole response has arrived (also --stream).
+STREAM_COMPLETIONS = os.getenv("FACTORY_STREAM_COMPLETIONS", "0") == "1"
 # Framework workspace root (where this orchestrator code runs)
 FRAMEWORK_ROOT = Path.cwd()
 
@@ -50,6 +59,9 @@ Your response will be parsed as JSON. Do not include any text outside of this JS
 
 NEWLINE = "\n"
 
+# Context shared by every prompt; it lives in the cacheable prompt prefix.
+SHARED_CONTEXT_FILES = ["docs/FILE_ORGANISATION.md"]
+
 # --- Tool Mapping ---
 
 def get_available_tools(agent_type: str, git_manager: GitManager) -> Tuple[Dict[str, Callable], List[str]]:
@@ -59,7 +71,7 @@ def get_available_tools(agent_type: str, git_manager: GitManager) -> Tuple[Dict[
     2. A list of formatted tool signature strings for the prompt.
     """
     base_tools = {
-        "read_files": (task_utils.read_files, "read_files(paths: list[str]) -> list[str]"),
+        "read_files": (task_utils.read_files, "read_files(paths: list[str | {path: str, start_line?: int, end_line?: int, offset?: int, length?: int}]) -> dict[str, str]"),
         "search_files": (task_utils.search_files, "search_files(query: str, path: str = '.') -> list[str]"),
         "block_feature": (lambda task_id, feature_id, reason: task_utils.block_feature(task_id, feature_id, reason, agent_type, git_manager), "block_feature(reason: str)"),
         "finish_feature": (lambda task_id, feature_id: task_utils.finish_feature(task_id, feature_id, agent_type, git_manager), "finish_feature()"),
@@ -71,12 +83,16 @@ def get_available_tools(agent_type: str, git_manager: GitManager) -> Tuple[Dict[
     if agent_type == 'speccer':
         agent_tools = {
             "create_feature": (task_utils.create_feature, "create_feature(title: str, description: str)"),
+            "create_features": (task_utils.create_features, "create_features(features: list[{title: str, description: str, acceptance?: list[str], blockers?: list[str]}]) -> list[Feature]"),
+            "update_features": (task_utils.update_features, "update_features(updates: list[{id: str, status?: str, plan?: str, context?: list[str], acceptance?: list[str]}]) -> list[Feature]"),
             "finish_spec": (lambda task_id: task_utils.finish_spec(task_id, agent_type, git_manager), "finish_spec()"),
             "block_task": (lambda task_id: task_utils.block_task(task_id, agent_type, git_manager), "block_task()"),
         }
     elif agent_type == 'developer':
         agent_tools = {
             "write_file": (task_utils.write_file, "write_file(filename: str, content: str)"),
+            "apply_patch": (task_utils.apply_patch, "apply_patch(patch: str) -> str"),
+            "edit_file": (task_utils.edit_file, "edit_file(filename: str, edits: str | list[{search: str, replace: str}]) -> str"),
             "rename_file": (task_utils.rename_file, "rename_file(filename: str, new_filename: str)"),
             "delete_file": (task_utils.delete_file, "delete_file(filename: str)"),
             "run_test": (task_utils.run_test, "run_test() -> str"),
@@ -104,8 +120,26 @@ def get_available_tools(agent_type: str, git_manager: GitManager) -> Tuple[Dict[
     
     return tool_functions, tool_signatures
 
-def construct_system_prompt(agent_type: str, task: Task, feature: Feature, agent_system_prompt: str, context: str, tool_signatures: List[str]) -> str:
-    """Constructs the detailed system prompt, specialized for the agent type."""
+def construct_prompt_prefix(agent_system_prompt: str, tool_signatures: List[str], shared_context: str) -> str:
+    """
+    Constructs the stable part of the prompt: the agent doc, tools, protocol and the project's file organisation.
+    It is identical for every feature (and turn) of an agent type, so providers can serve it from their prompt cache.
+    """
+    tool_signatures_str = "\n".join(f"- {sig}" for sig in tool_signatures)
+
+    return f"""{agent_system_prompt}
+#TOOL SIGNATURES:
+'{tool_signatures_str}'
+
+#RESPONSE FORMAT INSTRUCTIONS:
+{PROTOCOL_INSTRUCTIONS}
+
+#PROJECT FILE ORGANISATION:
+{shared_context}
+"""
+
+def construct_prompt_suffix(agent_type: str, task: Task, feature: Feature, context: str) -> str:
+    """Constructs the task/feature specific part of the prompt, specialized for the agent type."""
 
     plan = ""
     if feature and agent_type in ['developer', 'tester', 'contexter', 'planner']:
@@ -115,10 +149,7 @@ def construct_system_prompt(agent_type: str, task: Task, feature: Feature, agent
     if feature and agent_type in ['developer', 'tester']:
         acceptance_criteria = "\n".join(f"{i}. {criterion}" for i, criterion in enumerate(feature.get('acceptance', []), 1))
 
-    tool_signatures_str = "\n".join(f"- {sig}" for sig in tool_signatures)
-
-    prompt = f"""{agent_system_prompt}
-#CURRENT TASK (ID: {task.get('id')})
+    return f"""#CURRENT TASK (ID: {task.get('id')})
 ##TITLE:
 {task.get('title')}
 ##DESCRIPTION:
@@ -134,29 +165,30 @@ def construct_system_prompt(agent_type: str, task: Task, feature: Feature, agent
 #ACCEPTANCE CRITERIA:
 {acceptance_criteria}
 
-#TOOL SIGNATURES:
-'{tool_signatures_str}'
-
-#RESPONSE FORMAT INSTRUCTIONS:
-{PROTOCOL_INSTRUCTIONS}
-
 #CONTEXT FILES PROVIDED:
 {context}
 
 Begin now.
 """
-    return prompt
+
+def construct_prompt_messages(model: str, agent_type: str, task: Task, feature: Feature | None, agent_system_prompt: str,
+                              tool_signatures: List[str], context_files: List[str]) -> List[Dict[str, Any]]:
+    """Returns the opening messages: the cacheable prefix as the system message, the task/feature suffix as the user message."""
+    shared_context = task_utils.read_context_files(SHARED_CONTEXT_FILES)
+    context = task_utils.read_context_files([path for path in context_files if path not in SHARED_CONTEXT_FILES])
+    prefix = construct_prompt_prefix(agent_system_prompt, tool_signatures, shared_context)
+    suffix = construct_prompt_suffix(agent_type, task, feature, context)
+    return [llm_client.cacheable_system_message(model, prefix), {"role": "user", "content": suffix}]
 
 def run_agent_on_task(model: str, agent_type: str, task: Task, git_manager: GitManager):
     print(f"\n--- Activating Agent {agent_type} for task: [{task.get('id')}] {task.get('title')} ---")
 
-    agent_system_prompt = (FRAMEWORK_ROOT / f"docs/AGENT_{agent_type.upper()}.md").read_text()
-    context_files = ["docs/FILE_ORGANISATION.md"]
+    agent_system_prompt = task_utils.get_context_cache().read_text(FRAMEWORK_ROOT / f"docs/AGENT_{agent_type.upper()}.md")
     available_tools, tool_signatures = get_available_tools(agent_type, git_manager)
-    context = task_utils.read_files(context_files)
-    system_prompt = construct_system_prompt(agent_type, task, None, agent_system_prompt, context, tool_signatures)
+    prompt_messages = construct_prompt_messages(model, agent_type, task, None, agent_system_prompt, tool_signatures, [])
 
-    return _run_agent_conversation(model, available_tools, system_prompt, task, None, agent_type, git_manager)
+    with get_event_emitter().feature(task.get('id')):
+        return _run_agent_conversation(model, available_tools, prompt_messages, task, None, agent_type, git_manager)
 
 def run_agent_on_feature(model: str, agent_type: str, task: Task, feature: Feature, git_manager: GitManager):
     print(f"\n--- Activating Agent {agent_type} for Feature: [{feature.get('id')}] {feature['title']} ---")
@@ -164,65 +196,160 @@ def run_agent_on_feature(model: str, agent_type: str, task: Task, feature: Featu
     if agent_type == 'developer':
         task_utils.update_feature_status(task.get('id'), feature.get('id'), '~')
 
-    agent_system_prompt = (FRAMEWORK_ROOT / f"docs/AGENT_{agent_type.upper()}.md").read_text()
-    feature_context_files = ["docs/FILE_ORGANISATION.md"] + feature.get("context", [])
+    agent_system_prompt = task_utils.get_context_cache().read_text(FRAMEWORK_ROOT / f"docs/AGENT_{agent_type.upper()}.md")
 
     available_tools, tool_signatures = get_available_tools(agent_type, git_manager)
-    context = task_utils.read_files(feature_context_files)
-
-    system_prompt = construct_system_prompt(agent_type, task, feature, agent_system_prompt, context, tool_signatures)
+    prompt_messages = construct_prompt_messages(model, agent_type, task, feature, agent_system_prompt, tool_signatures, feature.get("context", []))
 
     if agent_type == 'developer':
         task_utils.update_feature_status(task.get('id'), feature.get('id'), '~')
 
-    return _run_agent_conversation(model, available_tools, system_prompt, task, feature, agent_type, git_manager)
+    with get_event_emitter().feature(task.get('id'), feature.get('id')):
+        return _run_agent_conversation(model, available_tools, prompt_messages, task, feature, agent_type, git_manager)
+
+def _resolve_tool_call(call: Dict[str, Any], available_tools: Dict[str, Callable], task: Task, feature: Feature | None) -> Tuple[str, Optional[Callable], Dict[str, Any]]:
+    """Returns (tool_name, tool_func or None if unknown, arguments with task/feature ids filled in)."""
+    tool_name = call.get("tool_name", call.get("tool", call.get("name", "unknown_tool")))
+    tool_args = dict(call.get("arguments", call.get("parameters", {})) or {})
+    tool_func = available_tools.get(tool_name)
+    if tool_func:
+        params = inspect.signature(tool_func).parameters
+        if 'task_id' in params:
+            tool_args.setdefault('task_id', task.get('id'))
+        if (not (feature is None)) and ('feature_id' in params):
+            tool_args.setdefault('feature_id', feature.get('id'))
+    return tool_name, tool_func, tool_args
+
 
-def _run_agent_conversation(model: str, available_tools: Dict[str, Callable], system_prompt: str, task: Task, feature: Feature | None, agent_type: str, git_manager: GitManager) -> bool:
-    messages = [{"role": "user", "content": system_prompt}]
+def _call_tool(tool_name: str, tool_func: Callable, tool_args: Dict[str, Any]):
+    with get_event_emitter().span("tool", tool_name):
+        if tool_name in READ_ONLY_TOOLS:
+            return tool_func(**tool_args)
+        # All task.json mutations made by one tool call are flushed as a single write.
+        with task_utils.get_task_store().batch():
+            return tool_func(**tool_args)
+
+
+def _submit_tool(loop: asyncio.AbstractEventLoop, tool_name: str, tool_func: Callable, tool_args: Dict[str, Any]) -> asyncio.Future:
+    """Runs the tool in the tool thread pool, in a copy of the caller's context (so its events keep their feature)."""
+    context = contextvars.copy_context()
+    return loop.run_in_executor(TOOL_EXECUTOR, context.run, _call_tool, tool_name, tool_func, tool_args)
+
+
+def _format_tool_output(tool_name: str, tool_func: Optional[Callable], result: Any) -> str:
+    if tool_func is None:
+        return f"Error: Tool '{tool_name}' not found."
+    return f"Tool {tool_name} returned: {result}"
+
+
+async def _execute_tool_calls(tool_calls: List[Dict[str, Any]], available_tools: Dict[str, Callable], task: Task,
+                              feature: Feature | None, prefetched: Dict[int, asyncio.Future]) -> Tuple[List[Tuple[str, Optional[Callable], Any]], bool]:
+    """
+    Executes a turn's tool calls and returns ([(tool_name, tool_func, result)] in call order, whether a concluding tool was called).
+
+    Consecutive read-only tools run concurrently in the tool thread pool (or were already started while the
+    completion streamed, see `prefetched`); every other tool runs alone, in order.
+    """
+    loop = asyncio.get_running_loop()
+    tool_outputs = []
+    i = 0
+    while i < len(tool_calls):
+        tool_name, tool_func, tool_args = _resolve_tool_call(tool_calls[i], available_tools, task, feature)
+
+        if tool_name in READ_ONLY_TOOLS and tool_func:
+            j = i
+            futures = []
+            while j < len(tool_calls):
+                name, func, args = _resolve_tool_call(tool_calls[j], available_tools, task, feature)
+                if name not in READ_ONLY_TOOLS or not func:
+                    break
+                future = prefetched.get(j)
+                if future is None:
+                    print(f"Executing Tool: {name} with args: {args}")
+                    future = _submit_tool(loop, name, func, args)
+                futures.append((name, func, future))
+                j += 1
+            results = await asyncio.gather(*(future for _, _, future in futures))
+            tool_outputs.extend((name, func, result) for (name, func, _), result in zip(futures, results))
+            i = j
+            continue
+
+        print(f"Executing Tool: {tool_name} with args: {tool_args}")
+        result = None
+        if tool_func:
+            result = await _submit_tool(loop, tool_name, tool_func, tool_args)
+        tool_outputs.append((tool_name, tool_func, result))
+
+        if tool_name in CONCLUDING_TOOLS:
+            print(f"Agent called '{tool_name}'. Concluding work on this.")
+            return tool_outputs, True
+        i += 1
+
+    return tool_outputs, False
+
+
+async def _run_agent_conversation_async(model: str, available_tools: Dict[str, Callable], prompt_messages: List[Dict[str, Any]], task: Task, feature: Feature | None, agent_type: str, git_manager: GitManager) -> bool:
+    messages = list(prompt_messages)
+    budgeter = ContextBudgeter(model, pinned=len(prompt_messages))
+    try:
+        return await _converse(model, available_tools, messages, budgeter, task, feature, agent_type, git_manager)
+    finally:
+        print(budgeter.report())
+
+
+async def _converse(model: str, available_tools: Dict[str, Callable], messages: List[Dict[str, Any]], budgeter: ContextBudgeter,
+                    task: Task, feature: Feature | None, agent_type: str, git_manager: GitManager) -> bool:
+    loop = asyncio.get_running_loop()
 
     for i in range(MAX_TURNS_PER_FEATURE):
         print(f"\n--- Feature Turn {i+1}/{MAX_TURNS_PER_FEATURE} ---")
         
+        prefetched: Dict[int, asyncio.Future] = {}
         try:
-            response = completion(model=model, messages=messages, response_format={"type": "json_object"})
-            assistant_message = response.choices[0].message
-            messages.append(assistant_message)
+            streamed_calls = []
+
+            def on_tool_call(call: Dict[str, Any]):
+                # Start read-only tools while the rest of the response streams in, as long as
+                # no other kind of tool comes before them.
+                index = len(streamed_calls)
+                streamed_calls.append(call)
+                name, func, args = _resolve_tool_call(call, available_tools, task, feature)
+                if len(prefetched) == index and name in READ_ONLY_TOOLS and func:
+                    print(f"Executing Tool: {name} with args: {args}")
+                    prefetched[index] = _submit_tool(loop, name, func, args)
+
+            budgeter.fit(messages)
+            completion = await llm_client.request_completion(model, messages, stream=STREAM_COMPLETIONS, on_tool_call=on_tool_call)
+            content = completion.content
+            messages.append({"role": "assistant", "content": content})
             
-            response_json = json.loads(assistant_message.content)
+            response_json = json.loads(content)
             thoughts = response_json.get("thoughts", "No thoughts provided.")
             tool_calls = response_json.get("tool_calls", [])
             print(f"Agent Thoughts: {thoughts}")
 
             if not tool_calls or len(tool_calls) == 0: continue
 
-            tool_outputs = []
-            for call in tool_calls:
-                tool_name = call.get("tool_name", call.get("tool", call.get("name", "unknown_tool")))
-                tool_args = call.get("arguments", call.get("parameters", {}))
-                
-                print(f"Executing Tool: {tool_name} with args: {tool_args}")
-                
-                if tool_name in available_tools:
-                    tool_func = available_tools[tool_name]
-                    sig = inspect.signature(tool_func)
-                    params = sig.parameters
-                    
-                    if 'task_id' in params:
-                        tool_args.setdefault('task_id', task.get('id'))
-                    if (not (feature is None)) and ('feature_id' in params):
-                        tool_args.setdefault('feature_id', feature.get('id'))
-
-                    result = available_tools[tool_name](**tool_args)
-                    tool_outputs.append(f"Tool {tool_name} returned: {result}")
-                else:
-                    tool_outputs.append(f"Error: Tool '{tool_name}' not found.")
-
-                if tool_name in ['finish_feature', 'block_feature', 'finish_spec', 'block_task']:
-                    print(f"Agent called '{tool_name}'. Concluding work on this.")
-                    return True
-
-            messages.append({"role": "user", "content": "--- TOOL RESULTS ---\n" + "\n".join(tool_outputs)})
+            # Only reuse prefetched results for calls the final response really contains.
+            matching = {idx: future for idx, future in prefetched.items()
+                        if idx < len(tool_calls) and tool_calls[idx] == streamed_calls[idx]}
+            results, concluded = await _execute_tool_calls(tool_calls, available_tools, task, feature, matching)
+            if concluded:
+                return True
 
+            message_index = len(messages)
+            tool_outputs = []
+            original_outputs = []
+            for tool_name, tool_func, result in results:
+                original_outputs.append(_format_tool_output(tool_name, tool_func, result))
+                if tool_name == "read_files" and tool_func:
+                    result = budgeter.dedupe_read_files(result, message_index)
+                tool_outputs.append((tool_name, _format_tool_output(tool_name, tool_func, result)))
+            messages.append(budgeter.tool_results_message(message_index, tool_outputs, "\n".join(original_outputs)))
+
+        except CacheMiss:
+            # A strict replay without a recording is a broken run, not an agent failure to block the feature on.
+            raise
         except Exception as e:
             print(f"An error occurred in agent loop: {e}")
             print("\n--- Full Stack Trace ---")
@@ -234,20 +361,40 @@ def _run_agent_conversation(model: str, available_tools: Dict[str, Callable], sy
                 task_utils.block_task(task.get('id'), f"Agent loop failed: {e}", agent_type, git_manager)
                 
             return True
+        finally:
+            # Never leave prefetched read-only tools running into the next turn.
+            if prefetched:
+                await asyncio.gather(*prefetched.values(), return_exceptions=True)
             
     if (not (feature is None)):
         print(f"Max turns reached for feature {feature.get('id')}. Blocking.")
-        task_utils.block_feature(task.get('id'), feature.get('id'), f"Agent loop failed: {e}", agent_type, git_manager)
+        task_utils.block_feature(task.get('id'), feature.get('id'), "Max turns reached", agent_type, git_manager)
     else:
         print(f"Max turns reached for task {task.get('id')}. Blocking.")
-        task_utils.block_task(task.get('id'), f"Agent loop failed: {e}", agent_type, git_manager)
+        task_utils.block_task(task.get('id'), "Max turns reached", agent_type, git_manager)
     return True
 
 
-def run_orchestrator(model: str, agent_type: str, task_id: Optional[str], project_dir: Optional[str] = None):
+def _run_agent_conversation(model: str, available_tools: Dict[str, Callable], prompt_messages: List[Dict[str, Any]], task: Task, feature: Feature | None, agent_type: str, git_manager: GitManager) -> bool:
+    return asyncio.run(_run_agent_conversation_async(model, available_tools, prompt_messages, task, feature, agent_type, git_manager))
+
+
+def run_orchestrator(model: str, agent_type: str, task_id: Optional[str], project_dir: Optional[str] = None,
+                     feature_id: Optional[str] = None, workers: int = 1, in_worktree: bool = False,
+                     stages: Optional[List[str]] = None):
     """
     Main orchestration loop. It can target a child project directory or the current working directory.
+
+    - agent_type 'pipeline': the `stages` personas (default contexter, planner, tester, developer) run
+      concurrently over the task, each feature moving on as soon as a stage finishes it (see FeaturePipeline).
+    - feature_id: only work on this feature of the task.
+    - workers: with more than one worker, features run concurrently in separate git worktrees (see FeatureScheduler).
+    - in_worktree: the project dir is a worktree created by FeatureScheduler; the branch is already checked out
+      and pushing is left to the scheduler.
     """
+    git_manager = None
+    events = get_event_emitter()
+    events.emit("run/start", taskId=task_id, featureId=feature_id, agent=agent_type, model=model, pid=os.getpid())
     try:
         # Determine the target project root and configure task utils
         target_root = Path(project_dir).resolve() if project_dir else Path.cwd()
@@ -266,23 +413,36 @@ def run_orchestrator(model: str, agent_type: str, task_id: Optional[str], projec
         task_id = current_task.get('id')
         print(f"Selected Task: [{task_id}] {current_task.get('title')}")
         
-        git_manager = GitManager(str(target_root))
+        git_manager = GitManager(str(target_root), push_enabled=not in_worktree)
         
         branch_name = f"features/{task_id}"
-        try:
-            git_manager.checkout_branch(branch_name)
-        except Exception as e:
-            print(f"Could not create or checkout branch '{branch_name}': {e}")
-            git_manager.checkout_branch(branch_name, False)
-        try:
-            git_manager.pull(branch_name)
-        except Exception as e:
-            print(f"Could not pull branch '{branch_name}': {e}")
+        if not in_worktree:
+            try:
+                git_manager.checkout_branch(branch_name)
+            except Exception as e:
+                print(f"Could not create or checkout branch '{branch_name}': {e}")
+                git_manager.checkout_branch(branch_name, False)
+            try:
+                git_manager.pull(branch_name)
+            except Exception as e:
+                print(f"Could not pull branch '{branch_name}': {e}")
 
         processed_feature_ids = set()
         if agent_type == "speccer":
             current_task = task_utils.get_task(task_id)
             run_agent_on_task(model, agent_type, current_task, git_manager)
+        elif agent_type == "pipeline":
+            run_stage = lambda stage, task, feature: run_agent_on_feature(model, stage, task, feature, git_manager)
+            FeaturePipeline(task_id, run_stage, stages or PIPELINE_STAGES, [feature_id] if feature_id else None).run()
+        elif feature_id:
+            current_task = task_utils.get_task(task_id)
+            feature = next((f for f in current_task.get("features", []) if f.get("id") == feature_id), None)
+            if not feature:
+                print(f"Feature {feature_id} not found in task {task_id}.")
+                return
+            run_agent_on_feature(model, agent_type, current_task, feature, git_manager)
+        elif workers > 1:
+            FeatureScheduler(model, agent_type, task_id, target_root, git_manager, workers).run()
         else:
             while True:
                 current_task = task_utils.get_task(task_id)
@@ -296,26 +456,83 @@ def run_orchestrator(model: str, agent_type: str, task_id: Optional[str], projec
                 processed_feature_ids.add(next_feature.get('id'))
 
     except Exception as e:
+        events.emit("run/error", code=type(e).__name__, message=str(e))
         print(f"\n--- A critical error occurred during the orchestrator run: {e} ---")
         print("\n--- Full Stack Trace ---")
         traceback.print_exc()
         print("------------------------\n")
+    finally:
+        if git_manager:
+            try:
+                git_manager.close()
+            except Exception as e:
+                print(f"Could not push': {e}")
+        print(llm_client.PROMPT_CACHE_STATS.report())
+        print(get_rate_limiter().report())
+        completion_cache = get_completion_cache()
+        if completion_cache:
+            print(completion_cache.report())
+        events.emit("run/complete", stats=events.stats())
+        print(events.summary())
 
 def main():
     parser = argparse.ArgumentParser(description="Run an autonomous AI agent.")
     parser.add_argument("--model", type=str, default="gpt-5", help="LLM model name.")
-    parser.add_argument("--agent", type=str, required=True, choices=['developer', 'tester', 'planner', 'contexter', 'speccer'], help="Agent persona.")
+    parser.add_argument("--agent", type=str, required=True, choices=['developer', 'tester', 'planner', 'contexter', 'speccer', 'pipeline'], help="Agent persona, or 'pipeline' to run several personas over the task at once.")
+    parser.add_argument("--stages", type=str, help=f"Optional: Comma-separated personas for --agent pipeline, in order. (default: {','.join(PIPELINE_STAGES)})")
     parser.add_argument("--task", type=str, help="Optional: Specify a task ID to work on.")
     parser.add_argument("--project-dir", type=str, help="Optional: Target child project directory.")
+    parser.add_argument("--feature", type=str, help="Optional: Only work on this feature of the task.")
+    parser.add_argument("--workers", type=int, default=1, help="Optional: Number of features to run concurrently, each in its own git worktree.")
+    parser.add_argument("--worktree", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stream", action="store_true", help="Optional: Stream completions and start read-only tools while the response arrives.")
+    parser.add_argument("--push-every", type=int, help="Optional: Batch pushes, pushing once every N finished features (and at the end of the run).")
+    parser.add_argument("--push-interval", type=float, help="Optional: Batch pushes, pushing queued commits every N seconds in the background.")
+    parser.add_argument("--llm-cache", type=str, choices=CACHE_MODES, help="Optional: Completion cache mode. 'record' reuses and stores completions, 'replay' only serves recorded ones (offline).")
+    parser.add_argument("--llm-cache-dir", type=str, help="Optional: Completion cache directory (default: ~/.cache/thefactory/completions).")
+    parser.add_argument("--events", type=str, help="Optional: Append structured JSONL run events (timings, token usage) to this file.")
+    parser.add_argument("--llm-limits", type=str, help="Optional: Per-provider/model LLM limits, as JSON or a JSON file: {\"openai\": {\"rpm\": 500, \"tpm\": 200000, \"concurrency\": 16}}.")
+    parser.add_argument("--llm-max-retries", type=int, help="Optional: Retries of a rate-limited, overloaded or timed-out LLM call before the agent gives up. (default: 6)")
+    parser.add_argument("--max-context-tokens", type=int, help="Optional: Token ceiling per agent conversation; older tool results are compacted to stay under it.")
     
     args = parser.parse_args()
 
+    if args.stream:
+        # Exported so scheduler-managed worker processes stream as well.
+        os.environ["FACTORY_STREAM_COMPLETIONS"] = "1"
+        global STREAM_COMPLETIONS
+        STREAM_COMPLETIONS = True
+    if args.max_context_tokens:
+        os.environ["FACTORY_MAX_CONTEXT_TOKENS"] = str(args.max_context_tokens)
+    if args.push_every:
+        os.environ["FACTORY_PUSH_EVERY"] = str(args.push_every)
+    if args.push_interval:
+        os.environ["FACTORY_PUSH_INTERVAL"] = str(args.push_interval)
+    if args.llm_cache:
+        os.environ["FACTORY_LLM_CACHE"] = args.llm_cache
+    if args.events:
+        os.environ["FACTORY_EVENTS_FILE"] = str(Path(args.events).resolve())
+    if args.llm_cache_dir:
+        os.environ["FACTORY_LLM_CACHE_DIR"] = str(Path(args.llm_cache_dir).resolve())
+    if args.llm_limits:
+        os.environ["FACTORY_LLM_LIMITS"] = args.llm_limits if args.llm_limits.lstrip().startswith("{") else str(Path(args.llm_limits).resolve())
+    if args.llm_max_retries is not None:
+        os.environ["FACTORY_LLM_MAX_RETRIES"] = str(args.llm_max_retries)
+
+    stages = None
+    if args.stages:
+        stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+        unknown = [stage for stage in stages if stage not in PIPELINE_STAGES]
+        if unknown:
+            parser.error(f"Unknown pipeline stage(s): {', '.join(unknown)}. Choose from {', '.join(PIPELINE_STAGES)}.")
+
     if args.project_dir:
         load_dotenv(args.project_dir + "/.env")
     else:
         load_dotenv()
         
-    run_orchestrator(model=args.model, agent_type=args.agent, task_id=args.task, project_dir=args.project_dir)
+    run_orchestrator(model=args.model, agent_type=args.agent, task_id=args.task, project_dir=args.project_dir,
+                     feature_id=args.feature, workers=args.workers, in_worktree=args.worktree, stages=stages)
 
 if __name__ == "__main__":
     main()
@@ -1,41 +1,195 @@
 import sys
 import os
 import glob
+import json
+import argparse
 import subprocess
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add project root (framework root) to sys.path
+framework_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(framework_root))
+
+from scripts.factory_paths import get_data_dir
+from scripts.outcome_cache import OutcomeCache
+from scripts.worker_pool import WorkerPool
+
+DEFAULT_TIMEOUT_SECONDS = 30
+HISTORY_FILE_NAME = "test_history.json"
 
 
 def find_tests():
     return sorted(glob.glob(os.path.join("tasks", "*", "tests", "*.py")))
 
 
-def run_test(path: str):
-    proc = subprocess.run([sys.executable, path], capture_output=True, text=True)
-    return proc.returncode, proc.stdout, proc.stderr
+def run_test(path: str, cache: OutcomeCache, timeout: Optional[float] = None) -> Tuple[int, str, str, float, bool]:
+    """
+    Runs one test script, or returns its cached outcome if nothing it depends on changed.
+    Returns (exit code, stdout, stderr, duration, cached); a timeout has exit code None.
+    """
+    start = time.monotonic()
+    try:
+        result = cache.run(path, timeout=timeout)
+        return result.returncode, result.stdout, result.stderr, result.duration, result.cached
+    except subprocess.TimeoutExpired as e:
+        out = e.stdout.decode(errors="replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+        err = e.stderr.decode(errors="replace") if isinstance(e.stderr, bytes) else (e.stderr or "")
+        return None, out, err, time.monotonic() - start, False
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parses `i/n` (1-based) into (i, n)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}'. Expected i/n, e.g. 1/4.")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}'. Expected 1 <= i <= n.")
+    return index, count
+
+
+def select_shard(tests: List[str], shard: Optional[Tuple[int, int]]) -> List[str]:
+    """Deterministic round-robin over the sorted test paths, so every shard agrees on the split."""
+    if not shard:
+        return tests
+    index, count = shard
+    return [t for i, t in enumerate(sorted(tests)) if i % count == index - 1]
+
+
+def load_history(path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        return history if isinstance(history, dict) else {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_history(path: Path, history: Dict[str, Dict[str, Any]], results: List[Dict[str, Any]]):
+    for result in results:
+        if result["cached"]:
+            # Keep the duration of the last real run for ordering
+            history.setdefault(result["path"], {})["status"] = result["status"]
+            continue
+        history[result["path"]] = {"status": result["status"], "duration": round(result["duration"], 3)}
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2, sort_keys=True)
+    except OSError as e:
+        print(f"Warning: Could not save test history to {path}. Error: {e}")
+
+
+def order_tests(tests: List[str], history: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Previously failing tests first, then the slowest ones, so failures and the long tail show up early."""
+    def key(test: str):
+        entry = history.get(test, {})
+        failed = entry.get("status") in ("fail", "timeout")
+        return (not failed, -float(entry.get("duration", 0)), test)
+    return sorted(tests, key=key)
+
+
+def write_json_report(path: str, results: List[Dict[str, Any]], duration: float):
+    summary = {
+        "total": len(results),
+        "passed": sum(1 for r in results if r["status"] == "pass"),
+        "failed": sum(1 for r in results if r["status"] == "fail"),
+        "timed_out": sum(1 for r in results if r["status"] == "timeout"),
+        "duration": round(duration, 3),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "tests": results}, f, indent=2)
+
+
+def write_junit_report(path: str, results: List[Dict[str, Any]], duration: float):
+    suite = ET.Element("testsuite", {
+        "name": "tasks",
+        "tests": str(len(results)),
+        "failures": str(sum(1 for r in results if r["status"] == "fail")),
+        "errors": str(sum(1 for r in results if r["status"] == "timeout")),
+        "time": f"{duration:.3f}",
+    })
+    for result in results:
+        case = ET.SubElement(suite, "testcase", {
+            "classname": os.path.dirname(result["path"]).replace(os.sep, "."),
+            "name": os.path.basename(result["path"]),
+            "time": f"{result['duration']:.3f}",
+        })
+        if result["status"] == "fail":
+            ET.SubElement(case, "failure", {"message": f"exited with code {result['returncode']}"}).text = result["stderr"]
+        elif result["status"] == "timeout":
+            ET.SubElement(case, "error", {"message": "timed out"}).text = result["stderr"]
+        ET.SubElement(case, "system-out").text = result["stdout"]
+        ET.SubElement(case, "system-err").text = result["stderr"]
+    ET.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Run the feature tests under tasks/*/tests/*.py.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Number of tests to run in parallel. (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_SECONDS, help=f"Per-test timeout in seconds; 0 disables it. (default: {DEFAULT_TIMEOUT_SECONDS})")
+    parser.add_argument("--shard", type=parse_shard, help="Only run shard i of n, e.g. 2/4.")
+    parser.add_argument("--no-cache", action="store_true", help="Re-run every test, even if none of its dependencies changed since its last run.")
+    parser.add_argument("--no-warm-workers", action="store_true", help="Start a fresh interpreter per test instead of forking warm workers.")
+    parser.add_argument("--report-json", type=str, help="Write a JSON report with per-test status and duration to this path.")
+    parser.add_argument("--junit", type=str, help="Write a JUnit XML report to this path.")
+    args = parser.parse_args()
+
     tests = find_tests()
     if not tests:
         print("No tests found under tasks/*/tests/*.py")
         sys.exit(1)
 
+    history_path = get_data_dir(Path.cwd()) / HISTORY_FILE_NAME
+    history = load_history(history_path)
+    tests = order_tests(select_shard(tests, args.shard), history)
+    if not tests:
+        print(f"No tests in shard {args.shard[0]}/{args.shard[1]}.")
+        sys.exit(0)
+
     total = len(tests)
-    failed = 0
-
-    for t in tests:
-        print(f"Running {t} ...")
-        code, out, err = run_test(t)
-        if out:
-            print(out.strip())
-        if err:
-            print(err.strip())
-        if code != 0:
-            print(f"FAIL: {t} exited with code {code}")
-            failed += 1
-        else:
-            print(f"PASS: {t}")
-
-    print(f"\nSummary: {total - failed}/{total} tests passed.")
+    timeout = args.timeout if args.timeout > 0 else None
+    jobs = max(1, args.jobs)
+    pool = None if args.no_warm_workers or not hasattr(os, "fork") else WorkerPool(min(jobs, total))
+    cache = OutcomeCache(Path.cwd(), enabled=False if args.no_cache else None, pool=pool)
+    results = []
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_test, t, cache, timeout): t for t in tests}
+        for future in as_completed(futures):
+            t = futures[future]
+            code, out, err, duration, cached = future.result()
+            status = "pass" if code == 0 else ("timeout" if code is None else "fail")
+            results.append({"path": t, "status": status, "returncode": code, "duration": duration, "cached": cached, "stdout": out, "stderr": err})
+            # Each test's output is printed in one piece as soon as it finishes
+            print(f"Running {t} ...")
+            if out:
+                print(out.strip())
+            if err:
+                print(err.strip())
+            if status == "timeout":
+                print(f"FAIL: {t} timed out after {args.timeout:g}s")
+            elif status == "fail":
+                print(f"FAIL: {t} exited with code {code}{' (cached)' if cached else ''}")
+            else:
+                print(f"PASS: {t} ({'cached' if cached else f'{duration:.2f}s'})")
+
+    duration = time.monotonic() - start
+    if pool:
+        pool.close()
+    results.sort(key=lambda r: r["path"])
+    save_history(history_path, history, results)
+    if args.report_json:
+        write_json_report(args.report_json, results, duration)
+    if args.junit:
+        write_junit_report(args.junit, results, duration)
+
+    failed = sum(1 for r in results if r["status"] != "pass")
+    print(f"\nSummary: {total - failed}/{total} tests passed in {duration:.2f}s.")
     sys.exit(0 if failed == 0 else 1)
 
 
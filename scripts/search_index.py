@@ -0,0 +1,369 @@
+import os
+import re
+import sqlite3
+import stat
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from scripts.factory_paths import DATA_DIR_NAME, get_data_dir
+
+INDEX_FILE_NAME = "search_index.sqlite"
+
+IGNORE_DIRS = {".git", "node_modules", ".venv", "venv", "dist", "build", "out", ".next", ".cache", DATA_DIR_NAME}
+MAX_CONTENT_BYTES = 2 * 1024 * 1024  # 2 MB
+MAX_RESULTS = 500
+# Longest time a file rewritten in place by another process (same directory mtime) can go unnoticed
+FULL_REFRESH_SECONDS = 30.0
+# Lowercased file contents kept in memory for ranking repeated candidates
+TEXT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Scoring weights used to rank matches.
+FILENAME_MATCH_SCORE = 10
+MAX_OCCURRENCE_SCORE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_indexed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trigrams (
+    tri TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    PRIMARY KEY (tri, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS trigrams_by_file ON trigrams (file_id);
+"""
+
+_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """
+    Parses a search query into OR-ed groups of AND-ed, lowercased terms.
+
+    - Whitespace-separated terms are alternatives (OR), as before: `foo bar` matches either.
+    - `AND` binds the terms on either side: `foo AND bar` only matches files containing both.
+    - `OR` may be written explicitly; `"quoted text"` searches for a phrase containing spaces.
+    """
+    groups: List[List[str]] = []
+    join_next = False
+    for quoted, bare in _TOKEN_RE.findall(query or ""):
+        if not quoted and bare in ("AND", "OR"):
+            join_next = bare == "AND" and bool(groups)
+            continue
+        term = (quoted if quoted else bare).lower()
+        if not term:
+            continue
+        if join_next:
+            groups[-1].append(term)
+        else:
+            groups.append([term])
+        join_next = False
+    return groups
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _read_text(full_path: Path) -> str:
+    with open(full_path, "rb") as f:
+        data = f.read(MAX_CONTENT_BYTES)
+    return data.decode("utf-8", errors="ignore").lower()
+
+
+class SearchIndex:
+    """
+    Persistent trigram index over the files of one project root, stored in SQLite under .thefactory/.
+
+    Keeping it current does not stat the whole tree on every search:
+    - Paths reported through invalidate() (the file tools' writes) are re-checked on the next search.
+    - Every directory's mtime is remembered, and only directories whose mtime changed (files added,
+      removed or replaced by rename, as git and most editors do) are listed again.
+    - A full walk comparing every file's mtime/size runs on the first search and then at most once per
+      FULL_REFRESH_SECONDS. That catches files rewritten in place by other processes.
+
+    A query is answered in a single pass. Trigram postings narrow every term down to candidate files, and
+    each candidate is read at most once to confirm the matches and rank it, from an in-memory cache of
+    recently read files. A term shorter than a trigram has no postings: it is checked against the candidates
+    of the other terms in its AND group, or against every file when its group has no longer term.
+
+    Several instances (processes) may share one database; each keeps its own view of the files table.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root).resolve()
+        self._lock = threading.Lock()
+        # rel_path -> (file_id, mtime_ns, size, content_indexed); loaded from the database on first use
+        self._files: Optional[Dict[str, Tuple[int, int, int, bool]]] = None
+        # rel_dir ("" for the root) -> mtime_ns, as of the last listing of that directory
+        self._dirs: Dict[str, int] = {}
+        self._dirty: Set[str] = set()
+        self._full_refresh_at: Optional[float] = None
+        self._texts: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+        self._text_bytes = 0
+        try:
+            db_path = str(get_data_dir(self.root) / INDEX_FILE_NAME)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not open persistent search index, using an in-memory one. Error: {e}")
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def invalidate(self, paths: Iterable[str | Path]):
+        """Marks files (relative to the root) as changed, so the next search re-checks them."""
+        with self._lock:
+            for path in paths:
+                try:
+                    self._dirty.add(str((self.root / path).resolve().relative_to(self.root)))
+                except ValueError:
+                    continue
+
+    def search(self, query: str, path: str = ".") -> List[str]:
+        """Returns paths (relative to the root) under `path` matching `query`, best matches first."""
+        groups = parse_query(query)
+        start_path = (self.root / path).resolve()
+        try:
+            start_path.relative_to(self.root)
+        except ValueError:
+            return []
+        if not groups:
+            return []
+
+        prefix = "" if start_path == self.root else str(start_path.relative_to(self.root)) + os.sep
+        with self._lock:
+            self._refresh()
+            files = {p: e for p, e in self._files.items() if p.startswith(prefix)}
+            candidates = self._candidates(groups, files)
+            ranked: List[Tuple[int, int, str]] = []
+            for rel_path in candidates:
+                matched, score = self._score(rel_path, groups, files[rel_path])
+                if matched:
+                    ranked.append((-matched, -score, rel_path))
+        ranked.sort()
+        return [rel_path for _, _, rel_path in ranked[:MAX_RESULTS]]
+
+    # --- Index maintenance ---
+
+    def _abs(self, rel_path: str) -> Path:
+        return self.root / rel_path if rel_path else self.root
+
+    def _list_dir(self, rel_dir: str) -> Tuple[Dict[str, os.stat_result], List[str]]:
+        """The files (rel_path -> stat) and the subdirectories (not ignored, not symlinks) directly in rel_dir."""
+        files: Dict[str, os.stat_result] = {}
+        subdirs: List[str] = []
+        try:
+            with os.scandir(self._abs(rel_dir)) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in IGNORE_DIRS:
+                                subdirs.append(rel_path)
+                        elif entry.is_file():
+                            files[rel_path] = os.stat(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, subdirs
+
+    def _scan_tree(self, rel_dir: str, updates: Dict[str, Optional[os.stat_result]]):
+        """Lists rel_dir and everything below it, recording directory mtimes and file stats."""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                # Taken before listing: a change made meanwhile shows up as a changed mtime next time
+                self._dirs[current] = os.stat(self._abs(current)).st_mtime_ns
+            except OSError:
+                continue
+            files, subdirs = self._list_dir(current)
+            updates.update(files)
+            stack.extend(subdirs)
+
+    def _drop_tree(self, rel_dir: str, updates: Dict[str, Optional[os.stat_result]]):
+        prefix = rel_dir + os.sep
+        for d in [d for d in self._dirs if d == rel_dir or d.startswith(prefix)]:
+            del self._dirs[d]
+        for rel_path in self._files:
+            if rel_path.startswith(prefix):
+                updates[rel_path] = None
+
+    def _refresh(self):
+        if self._files is None:
+            self._files = {
+                rel_path: (file_id, mtime_ns, size, bool(indexed))
+                for file_id, rel_path, mtime_ns, size, indexed in self._conn.execute(
+                    "SELECT id, path, mtime_ns, size, content_indexed FROM files")
+            }
+        now = time.monotonic()
+        updates: Dict[str, Optional[os.stat_result]] = {}
+        if self._full_refresh_at is None or now - self._full_refresh_at >= FULL_REFRESH_SECONDS:
+            self._dirs.clear()
+            updates = {rel_path: None for rel_path in self._files}
+            self._scan_tree("", updates)
+            self._full_refresh_at = now
+        else:
+            self._refresh_changed_dirs(updates)
+        for rel_path in self._dirty:
+            if rel_path in updates:
+                continue
+            try:
+                st = os.stat(self._abs(rel_path))
+                updates[rel_path] = st if stat.S_ISREG(st.st_mode) else None
+            except OSError:
+                updates[rel_path] = None
+        self._dirty.clear()
+        self._apply(updates)
+
+    def _refresh_changed_dirs(self, updates: Dict[str, Optional[os.stat_result]]):
+        changed = []
+        for rel_dir, mtime_ns in self._dirs.items():
+            try:
+                if os.stat(self._abs(rel_dir)).st_mtime_ns == mtime_ns:
+                    continue
+            except OSError:
+                pass
+            changed.append(rel_dir)
+        for rel_dir in sorted(changed):
+            if rel_dir not in self._dirs:
+                continue  # dropped with its parent
+            try:
+                self._dirs[rel_dir] = os.stat(self._abs(rel_dir)).st_mtime_ns
+            except OSError:
+                self._drop_tree(rel_dir, updates)
+                continue
+            files, subdirs = self._list_dir(rel_dir)
+            for rel_path in self._files:
+                if os.path.dirname(rel_path) == rel_dir and rel_path not in files:
+                    updates[rel_path] = None
+            updates.update(files)
+            known_subdirs = {d for d in self._dirs if d and os.path.dirname(d) == rel_dir}
+            for sub in subdirs:
+                if sub not in self._dirs:
+                    self._scan_tree(sub, updates)
+            for sub in known_subdirs - set(subdirs):
+                self._drop_tree(sub, updates)
+
+    def _apply(self, updates: Dict[str, Optional[os.stat_result]]):
+        """Brings the database and the in-memory file table in line with new stats (None: the file is gone)."""
+        with self._conn:
+            for rel_path, st in updates.items():
+                entry = self._files.get(rel_path)
+                if st is None:
+                    if entry is not None:
+                        # By path: another instance may have re-added the file under a new id
+                        self._conn.execute("DELETE FROM trigrams WHERE file_id IN (SELECT id FROM files WHERE path = ?)", (rel_path,))
+                        self._conn.execute("DELETE FROM files WHERE path = ?", (rel_path,))
+                        del self._files[rel_path]
+                    continue
+                if entry is not None and entry[1] == st.st_mtime_ns and entry[2] == st.st_size:
+                    continue
+                file_id, indexed = self._index_file(rel_path, st)
+                self._files[rel_path] = (file_id, st.st_mtime_ns, st.st_size, indexed)
+
+    def _index_file(self, rel_path: str, st: os.stat_result) -> Tuple[int, bool]:
+        """(Re)indexes one file. An upsert, as another instance sharing the database may have indexed it already."""
+        grams: Set[str] = set()
+        indexed = False
+        if st.st_size <= MAX_CONTENT_BYTES:
+            try:
+                grams = _trigrams(_read_text(self.root / rel_path))
+                indexed = True
+            except OSError:
+                # Non-readable/permission issues -> filename-only
+                pass
+
+        self._conn.execute(
+            "INSERT INTO files (path, mtime_ns, size, content_indexed) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size, "
+            "content_indexed = excluded.content_indexed",
+            (rel_path, st.st_mtime_ns, st.st_size, int(indexed)),
+        )
+        (file_id,) = self._conn.execute("SELECT id FROM files WHERE path = ?", (rel_path,)).fetchone()
+        self._conn.execute("DELETE FROM trigrams WHERE file_id = ?", (file_id,))
+        self._conn.executemany("INSERT INTO trigrams (tri, file_id) VALUES (?, ?)", ((g, file_id) for g in grams))
+        return file_id, indexed
+
+    # --- Query evaluation ---
+
+    def _term_candidates(self, term: str, files: Dict[str, Tuple[int, int, int, bool]], by_id: Dict[int, str]) -> Optional[Set[str]]:
+        """The files that may contain `term`; None if the index cannot narrow it down (too short for a trigram)."""
+        grams = _trigrams(term)
+        if not grams:
+            return None
+        name_hits = {p for p in files if term in os.path.basename(p).lower()}
+        placeholders = ",".join("?" * len(grams))
+        rows = self._conn.execute(
+            f"SELECT file_id FROM trigrams WHERE tri IN ({placeholders}) GROUP BY file_id HAVING COUNT(*) = ?",
+            (*grams, len(grams)),
+        )
+        return name_hits | {by_id[file_id] for (file_id,) in rows if file_id in by_id}
+
+    def _candidates(self, groups: List[List[str]], files: Dict[str, Tuple[int, int, int, bool]]) -> Set[str]:
+        by_id = {entry[0]: p for p, entry in files.items()}
+        term_cache: Dict[str, Set[str]] = {}
+        result: Set[str] = set()
+        for group in groups:
+            group_candidates = None
+            for term in group:
+                if term not in term_cache:
+                    term_cache[term] = self._term_candidates(term, files, by_id)
+                hits = term_cache[term]
+                if hits is None:
+                    continue
+                group_candidates = hits if group_candidates is None else group_candidates & hits
+                if not group_candidates:
+                    break
+            # Only short terms: every file is a candidate, and _score scans its text
+            result |= set(files) if group_candidates is None else group_candidates
+        return result
+
+    def _score(self, rel_path: str, groups: List[List[str]], entry: Tuple[int, int, int, bool]) -> Tuple[int, int]:
+        """Returns (number of matched terms, score); (0, 0) if no group matches."""
+        name = os.path.basename(rel_path).lower()
+        text = None
+        term_scores: Dict[str, int] = {}
+        for term in {t for group in groups for t in group}:
+            score = FILENAME_MATCH_SCORE if term in name else 0
+            if entry[3]:
+                if text is None:
+                    text = self._text(rel_path, (entry[1], entry[2]))
+                score += min(text.count(term), MAX_OCCURRENCE_SCORE)
+            if score:
+                term_scores[term] = score
+
+        if not any(all(t in term_scores for t in group) for group in groups):
+            return 0, 0
+        return len(term_scores), sum(term_scores.values())
+
+    def _text(self, rel_path: str, stamp: Tuple[int, int]) -> str:
+        """The lowercased content of an indexed file, from the cache while its mtime/size is unchanged."""
+        cached = self._texts.get(rel_path)
+        if cached is not None and cached[0] == stamp:
+            self._texts.move_to_end(rel_path)
+            return cached[1]
+        try:
+            text = _read_text(self.root / rel_path)
+        except OSError:
+            text = ""
+        if cached is not None:
+            self._text_bytes -= len(cached[1])
+        self._texts[rel_path] = (stamp, text)
+        self._text_bytes += len(text)
+        while self._text_bytes > TEXT_CACHE_BYTES and len(self._texts) > 1:
+            _, (_, evicted) = self._texts.popitem(last=False)
+            self._text_bytes -= len(evicted)
+        return text
@@ -0,0 +1,283 @@
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from docs.tasks.task_format import Task
+
+DONE = "+"
+PENDING = "-"
+UNORDERED = 10**9
+
+# (task display index, feature display index, position in task["features"])
+OrderKey = Tuple[int, int, int]
+
+
+def node_key(task_id: str, feature_id: Optional[str] = None) -> str:
+    """Graph node id: '{task_id}' for a task, '{task_id}.{feature_id}' for a feature (the blocker syntax)."""
+    return task_id if feature_id is None else f"{task_id}.{feature_id}"
+
+
+def _display_index(value) -> int:
+    return value if isinstance(value, int) else UNORDERED
+
+
+class TaskGraph:
+    """
+    Dependency graph over all tasks of a project and their features, built from their blockers.
+
+    - Blockers are resolved like TaskIndex does: 'fid' is a feature of the same task (or, failing that, a
+      task id), 'tid.fid' a feature of any task and 'tid' a whole task. Unknown ids stay unmet.
+    - Every node keeps a count of its unmet blockers. When update_task() sees a status change, only the
+      dependents of the changed nodes are adjusted, and the ready set (pending features with nothing
+      unmet) is maintained from those counts instead of re-scanning every feature.
+    - Features on a blocker cycle are never ready; cycles() lists them.
+    - critical_path() and width() describe the remaining work, for the scheduler.
+    """
+
+    def __init__(self, task_display_order: Optional[Dict[str, int]] = None):
+        self.task_display_order = task_display_order or {}
+        self._status: Dict[str, str] = {}
+        self._order: Dict[str, OrderKey] = {}
+        self._blockers: Dict[str, Set[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self._unmet: Dict[str, int] = {}
+        self._features: Dict[str, List[str]] = {}
+        self._ready: Set[str] = set()
+        self._cyclic: Set[str] = set()
+
+    @classmethod
+    def from_tasks(cls, tasks: Iterable[Task], task_display_order: Optional[Dict[str, int]] = None) -> "TaskGraph":
+        graph = cls(task_display_order)
+        for task in tasks:
+            graph._add_task(task)
+        graph._recount(set(graph._status))
+        graph._detect_cycles()
+        return graph
+
+    # --- Maintenance ---
+
+    def update_task(self, task: Task):
+        """Applies a (re)loaded or saved task: status changes propagate to dependents, edges are rebuilt."""
+        task_id = task.get("id")
+        old_keys = set(self._features.get(task_id, [])) | ({task_id} if task_id in self._status else set())
+        old_status = {key: self._status.get(key) for key in old_keys}
+        old_edges = {key: set(self._blockers.get(key, ())) for key in old_keys}
+
+        self._remove_task(task_id)
+        self._add_task(task)
+        new_keys = set(self._features.get(task_id, [])) | {task_id}
+
+        # Nodes whose unmet count may have changed: this task's nodes, plus dependents of nodes that
+        # appeared, disappeared or changed status.
+        affected = set(new_keys)
+        for key in old_keys | new_keys:
+            if old_status.get(key) != self._status.get(key):
+                affected |= self._dependents.get(key, set())
+        self._recount(affected)
+        if any(old_edges.get(key) != self._blockers.get(key) for key in old_keys | new_keys):
+            self._detect_cycles()
+
+    def _add_task(self, task: Task):
+        task_id = task.get("id")
+        task_order = _display_index(self.task_display_order.get(task_id))
+        self._status[task_id] = task.get("status", PENDING)
+        self._order[task_id] = (task_order, -1, -1)
+
+        features = task.get("features", []) or []
+        feature_ids = {f.get("id") for f in features}
+        display = task.get("featureIdToDisplayIndex", {}) or {}
+        keys = []
+        for position, feature in enumerate(features):
+            key = node_key(task_id, feature.get("id"))
+            keys.append(key)
+            self._status[key] = feature.get("status", PENDING)
+            self._order[key] = (task_order, _display_index(display.get(feature.get("id"))), position)
+            self._set_blockers(key, self._resolve(task_id, feature_ids, feature.get("blockers")))
+        self._features[task_id] = keys
+        self._set_blockers(task_id, self._resolve(task_id, feature_ids, task.get("blockers")))
+
+    def _remove_task(self, task_id: str):
+        for key in self._features.pop(task_id, []) + [task_id]:
+            self._set_blockers(key, set())
+            self._status.pop(key, None)
+            self._order.pop(key, None)
+            self._unmet.pop(key, None)
+            self._ready.discard(key)
+
+    def _resolve(self, task_id: str, feature_ids: Set[str], blockers) -> Set[str]:
+        resolved = set()
+        for blocker in blockers or []:
+            if not isinstance(blocker, str):
+                continue
+            if "." in blocker:
+                resolved.add(blocker)
+            elif blocker in feature_ids:
+                resolved.add(node_key(task_id, blocker))
+            else:
+                resolved.add(blocker)
+        return resolved
+
+    def _set_blockers(self, key: str, blockers: Set[str]):
+        for blocker in self._blockers.pop(key, set()):
+            dependents = self._dependents.get(blocker)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[blocker]
+        if blockers:
+            self._blockers[key] = blockers
+            for blocker in blockers:
+                self._dependents.setdefault(blocker, set()).add(key)
+
+    def _recount(self, keys: Set[str]):
+        for key in keys:
+            if key not in self._status:
+                continue
+            self._unmet[key] = sum(1 for b in self._blockers.get(key, ()) if self._status.get(b) != DONE)
+            self._update_ready(key)
+
+    def _update_ready(self, key: str):
+        is_feature = self._order.get(key, (0, -1, -1))[2] >= 0
+        if is_feature and self._status.get(key) == PENDING and self._unmet.get(key) == 0 and key not in self._cyclic:
+            self._ready.add(key)
+        else:
+            self._ready.discard(key)
+
+    def _detect_cycles(self):
+        """Tarjan's SCC over the blocker edges; members of any cycle are excluded from the ready set."""
+        index_of: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        cyclic: Set[str] = set()
+        counter = 0
+
+        for root in self._status:
+            if root in index_of:
+                continue
+            work = [(root, iter(sorted(self._blockers.get(root, ()))))]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in self._status:
+                        continue
+                    if child not in index_of:
+                        index_of[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(sorted(self._blockers.get(child, ())))))
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index_of[child])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index_of[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in self._blockers.get(node, ()):
+                        cyclic.update(component)
+
+        if cyclic != self._cyclic:
+            if cyclic - self._cyclic:
+                print(f"Warning: Blocker cycle between {sorted(cyclic - self._cyclic)}; these features will never become ready.")
+            changed = cyclic ^ self._cyclic
+            self._cyclic = cyclic
+            for key in changed:
+                self._update_ready(key)
+
+    # --- Queries ---
+
+    def status(self, key: str) -> Optional[str]:
+        return self._status.get(key)
+
+    def is_ready(self, key: str) -> bool:
+        return key in self._ready
+
+    def cycles(self) -> Set[str]:
+        """Nodes that are part of a blocker cycle."""
+        return set(self._cyclic)
+
+    def unmet_blockers(self, key: str) -> List[str]:
+        return sorted(b for b in self._blockers.get(key, ()) if self._status.get(b) != DONE)
+
+    def ready(self, task_id: Optional[str] = None, exclude_ids: Iterable[str] = ()) -> List[str]:
+        """Ready feature nodes (optionally of one task, minus the given feature ids), in display order."""
+        exclude = set(exclude_ids)
+        keys = self._ready if task_id is None else (k for k in self._features.get(task_id, []) if k in self._ready)
+        return sorted(
+            (k for k in keys if k.split(".", 1)[1] not in exclude),
+            key=lambda k: self._order[k],
+        )
+
+    def critical_path(self, task_id: Optional[str] = None, weight: Callable[[str], float] = lambda key: 1.0) -> List[str]:
+        """
+        The longest chain of unfinished features (of one task, or all), following blockers to dependents.
+        Features on cycles are left out. `weight` gives each feature's expected cost (default 1).
+        """
+        depth = self._remaining_depths(task_id, weight)
+        if not depth:
+            return []
+        node = max(depth, key=lambda k: (depth[k], [-x for x in self._order[k]]))
+        path = [node]
+        while True:
+            nxt = [d for d in self._dependents.get(node, ()) if d in depth]
+            if not nxt:
+                return path
+            node = max(nxt, key=lambda k: (depth[k], [-x for x in self._order[k]]))
+            path.append(node)
+
+    def priorities(self, task_id: Optional[str] = None, weight: Callable[[str], float] = lambda key: 1.0) -> Dict[str, float]:
+        """
+        For every unfinished feature (of one task, or all), the length of the longest chain of unfinished work
+        starting at it; larger should start sooner. Compute it once per scheduling decision.
+        """
+        return self._remaining_depths(task_id, weight)
+
+    def levels(self, task_id: Optional[str] = None) -> List[List[str]]:
+        """Unfinished features grouped by how many unfinished blockers deep they are; level 0 can start now."""
+        nodes = self._unfinished(task_id)
+        level: Dict[str, int] = {}
+        for key in self._topological_order(nodes):
+            level[key] = max((level[b] + 1 for b in self._blockers.get(key, ()) if b in level), default=0)
+        grouped: List[List[str]] = [[] for _ in range(max(level.values(), default=-1) + 1)]
+        for key in sorted(nodes, key=lambda k: self._order[k]):
+            grouped[level[key]].append(key)
+        return grouped
+
+    def width(self, task_id: Optional[str] = None) -> int:
+        """The most unfinished features that can run side by side at any dependency level."""
+        return max((len(group) for group in self.levels(task_id)), default=0)
+
+    def _unfinished(self, task_id: Optional[str]) -> Set[str]:
+        keys = self._features.get(task_id, []) if task_id is not None else [k for ks in self._features.values() for k in ks]
+        return {k for k in keys if self._status.get(k) != DONE and k not in self._cyclic}
+
+    def _topological_order(self, nodes: Set[str]) -> List[str]:
+        """`nodes`, every one after its blockers among them (Kahn's algorithm; iterative, so any chain length works)."""
+        unmet = {key: sum(1 for b in self._blockers.get(key, ()) if b in nodes) for key in nodes}
+        queue = [key for key, count in unmet.items() if count == 0]
+        for key in queue:
+            for dependent in self._dependents.get(key, ()):
+                if dependent in unmet:
+                    unmet[dependent] -= 1
+                    if unmet[dependent] == 0:
+                        queue.append(dependent)
+        return queue
+
+    def _remaining_depths(self, task_id: Optional[str], weight: Callable[[str], float]) -> Dict[str, float]:
+        nodes = self._unfinished(task_id)
+        depth: Dict[str, float] = {}
+        for key in reversed(self._topological_order(nodes)):
+            depth[key] = weight(key) + max((depth[d] for d in self._dependents.get(key, ()) if d in depth), default=0.0)
+        return depth
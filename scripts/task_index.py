@@ -0,0 +1,471 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from docs.tasks.task_format import Feature, Task
+from scripts.factory_paths import get_data_dir
+
+INDEX_FILE_NAME = "task_index.sqlite"
+PROJECT_FILE_NAME = "project.json"
+TASK_FILE_NAME = "task.json"
+DONE = "+"
+BLOCKED = "?"
+PENDING_TASK_STATUSES = ("-", "~")
+# Bump when the tables change; an index with another version is dropped and rebuilt from the task files.
+SCHEMA_VERSION = "2"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    display_index INTEGER,
+    blockers TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, display_index);
+CREATE TABLE IF NOT EXISTS features (
+    task_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    display_index INTEGER,
+    blockers TEXT NOT NULL DEFAULT '[]',
+    byte_offset INTEGER,
+    byte_length INTEGER,
+    PRIMARY KEY (task_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS features_by_status ON features (status);
+CREATE TABLE IF NOT EXISTS requirements (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    description TEXT NOT NULL,
+    tasks TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+_TABLES = ("tasks", "features", "requirements", "meta")
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# (byte offset, byte length) of a feature's JSON object within its task.json
+Span = Tuple[int, int]
+
+
+def split_blocker(blocker: str) -> Tuple[Optional[str], str]:
+    """'{task_id}.{feature_id}' -> (task_id, feature_id); a plain id -> (None, id)."""
+    if "." in blocker:
+        task_id, feature_id = blocker.split(".", 1)
+        return task_id, feature_id
+    return None, blocker
+
+
+def parse_task(text: str) -> Tuple[Task, Dict[str, Span]]:
+    """
+    json.loads() of a task file, plus where each feature's object sits in it, in bytes of the UTF-8 file.
+    Files not shaped like a task (no top-level object) parse normally, without spans.
+    """
+    try:
+        task, char_spans = _scan_task(text)
+    except (ValueError, IndexError):
+        return json.loads(text), {}
+
+    spans = {}
+    ascii_only = text.isascii()
+    char_pos = byte_pos = 0
+    for feature, (start, end) in zip(task.get("features", []), char_spans):
+        if ascii_only:
+            span = (start, end - start)
+        else:
+            byte_pos += len(text[char_pos:start].encode("utf-8", errors="surrogatepass"))
+            length = len(text[start:end].encode("utf-8", errors="surrogatepass"))
+            span, byte_pos, char_pos = (byte_pos, length), byte_pos + length, end
+        if isinstance(feature, dict) and isinstance(feature.get("id"), str):
+            spans[feature["id"]] = span
+    return task, spans
+
+
+def _scan_task(text: str) -> Tuple[Task, List[Tuple[int, int]]]:
+    """Decodes the top-level object member by member, so the features array's elements get (start, end) offsets."""
+    def skip(i: int) -> int:
+        return _WHITESPACE.match(text, i).end()
+
+    def opened(i: int, close: str) -> Tuple[int, bool]:
+        """Steps past an opening bracket; returns the next position and whether the container is empty."""
+        i = skip(i + 1)
+        return (i + 1, True) if text[i] == close else (i, False)
+
+    def next_member(i: int, close: str) -> Tuple[int, bool]:
+        """Steps past the ',' after a member; returns the next position and whether the container closed."""
+        i = skip(i)
+        if text[i] == close:
+            return i + 1, True
+        if text[i] != ",":
+            raise ValueError(f"Expected ',' or {close!r} at {i}")
+        return skip(i + 1), False
+
+    task: Dict[str, Any] = {}
+    spans: List[Tuple[int, int]] = []
+    i = skip(0)
+    if text[i] != "{":
+        raise ValueError("Not a JSON object")
+    i, closed = opened(i, "}")
+    while not closed:
+        key, i = _DECODER.raw_decode(text, i)
+        i = skip(i)
+        if not isinstance(key, str) or text[i] != ":":
+            raise ValueError(f"Expected a key and ':' at {i}")
+        i = skip(i + 1)
+        if key == "features" and text[i] == "[":
+            value, spans = [], []
+            i, done = opened(i, "]")
+            while not done:
+                feature, end = _DECODER.raw_decode(text, i)
+                value.append(feature)
+                spans.append((i, end))
+                i, done = next_member(end, "]")
+        else:
+            value, i = _DECODER.raw_decode(text, i)
+        task[key] = value
+        i, closed = next_member(i, "}")
+    if skip(i) != len(text):
+        raise ValueError("Extra data after the task object")
+    return task, spans
+
+
+class TaskIndex:
+    """
+    Persistent index of task and feature statuses for one tasks/ directory, stored in SQLite under .thefactory/.
+
+    The TaskStore reports every task it writes through update(); refresh() catches edits made outside the
+    store by comparing each task.json's mtime/size with the index, so only changed files are parsed.
+    Display order comes from project.json's taskIdToDisplayIndex. Picking the next task, and checking
+    blockers that point at other tasks or at features of other tasks, are then single indexed lookups.
+
+    It doubles as a compact snapshot of the project: one row per feature (status, title, blockers, display
+    index and its byte span in task.json) and project.json's requirements, so status_rollup(),
+    blocked_features() and requirement_coverage() never load task bodies, and feature_source() reads just
+    one feature's bytes.
+    """
+
+    def __init__(self, tasks_dir: str | Path):
+        self.tasks_dir = Path(tasks_dir)
+        self._lock = threading.RLock()
+        try:
+            db_path = str(get_data_dir(self.tasks_dir.parent) / INDEX_FILE_NAME)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._init_schema()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not open persistent task index, using an in-memory one. Error: {e}")
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._init_schema()
+
+    def _init_schema(self):
+        try:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is None or row[0] != SCHEMA_VERSION:
+            with self._conn:
+                for table in _TABLES:
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self._conn.executescript(_SCHEMA)
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Maintenance ---
+
+    def update(self, task: Task, stamp: Optional[Tuple[int, int]] = None):
+        """
+        Records a task as written to disk (`stamp` is its task.json's (mtime_ns, size)). Feature spans are
+        left unknown; feature_source() finds them when it first needs them.
+        """
+        with self._lock, self._conn:
+            self._upsert(task, stamp or (0, 0), self._display_order().get(task.get("id")))
+
+    def refresh(self) -> List[str]:
+        """
+        Brings the index up to date with tasks/ and project.json, re-parsing only changed task files.
+        Returns the ids of tasks that changed, appeared or disappeared.
+        """
+        changed = []
+        with self._lock, self._conn:
+            display_order, order_changed = self._refresh_project()
+            known = {task_id: (mtime_ns, size) for task_id, mtime_ns, size in self._conn.execute("SELECT id, mtime_ns, size FROM tasks")}
+            for task_id, st in self._walk():
+                stamp = (st.st_mtime_ns, st.st_size)
+                if known.pop(task_id, None) == stamp:
+                    continue
+                try:
+                    with open(self.tasks_dir / task_id / TASK_FILE_NAME, "r", encoding="utf-8") as f:
+                        task, spans = parse_task(f.read())
+                except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+                    print(f"Warning: Could not index task {task_id}. Error: {e}")
+                    continue
+                self._upsert(task, stamp, display_order.get(task_id), spans)
+                changed.append(task_id)
+            for task_id in known:
+                self._conn.execute("DELETE FROM features WHERE task_id = ?", (task_id,))
+                self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                changed.append(task_id)
+            if order_changed:
+                self._conn.execute("UPDATE tasks SET display_index = NULL")
+                self._conn.executemany(
+                    "UPDATE tasks SET display_index = ? WHERE id = ?",
+                    ((index, task_id) for task_id, index in display_order.items()),
+                )
+        return changed
+
+    def _walk(self) -> Iterable[Tuple[str, os.stat_result]]:
+        if not self.tasks_dir.is_dir():
+            return
+        with os.scandir(self.tasks_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                try:
+                    yield entry.name, os.stat(os.path.join(entry.path, TASK_FILE_NAME))
+                except OSError:
+                    continue
+
+    def _upsert(self, task: Task, stamp: Tuple[int, int], display_index: Optional[int], spans: Optional[Dict[str, Span]] = None):
+        task_id = task.get("id")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO tasks (id, status, title, display_index, blockers, mtime_ns, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task_id, task.get("status", "-"), str(task.get("title", "")), display_index,
+             json.dumps(task.get("blockers") or []), stamp[0], stamp[1]),
+        )
+        self._conn.execute("DELETE FROM features WHERE task_id = ?", (task_id,))
+        feature_display = task.get("featureIdToDisplayIndex") or {}
+        spans = spans or {}
+        rows = []
+        for f in task.get("features", []):
+            feature_id = f.get("id")
+            if not feature_id:
+                continue
+            index = feature_display.get(feature_id)
+            offset, length = spans.get(feature_id, (None, None))
+            rows.append((task_id, feature_id, f.get("status", "-"), str(f.get("title", "")), index if isinstance(index, int) else None,
+                         json.dumps(f.get("blockers") or []), offset, length))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO features (task_id, id, status, title, display_index, blockers, byte_offset, byte_length) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def task_ids(self) -> List[str]:
+        with self._lock:
+            return [task_id for (task_id,) in self._conn.execute("SELECT id FROM tasks")]
+
+    def display_order(self) -> Dict[str, int]:
+        """project.json's taskIdToDisplayIndex as of the last refresh()."""
+        with self._lock:
+            return self._display_order()
+
+    def _display_order(self) -> Dict[str, int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'display_order'").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _refresh_project(self) -> Tuple[Dict[str, int], bool]:
+        """
+        Returns project.json's taskIdToDisplayIndex and whether project.json changed since the last refresh,
+        re-reading its requirements when it did.
+        """
+        project_file = self.tasks_dir / PROJECT_FILE_NAME
+        try:
+            st = project_file.stat()
+            stamp = f"{st.st_mtime_ns}:{st.st_size}"
+        except OSError:
+            stamp = ""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'project_stamp'").fetchone()
+        if row and row[0] == stamp:
+            return self._display_order(), False
+
+        display_order = {}
+        requirements = []
+        if stamp:
+            try:
+                with open(project_file, "r") as f:
+                    project = json.load(f)
+                raw = project.get("taskIdToDisplayIndex") or {}
+                display_order = {task_id: index for task_id, index in raw.items() if isinstance(index, int)}
+                requirements = [r for r in project.get("requirements") or [] if isinstance(r, dict)]
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                print(f"Warning: Could not read task display order from {project_file}. Error: {e}")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (("project_stamp", stamp), ("display_order", json.dumps(display_order))),
+        )
+        self._conn.execute("DELETE FROM requirements")
+        self._conn.executemany(
+            "INSERT INTO requirements (position, id, status, description, tasks) VALUES (?, ?, ?, ?, ?)",
+            ((position, json.dumps(r.get("id")), str(r.get("status", "-")), str(r.get("description", "")),
+              json.dumps(r.get("tasks") or [])) for position, r in enumerate(requirements)),
+        )
+        return display_order, True
+
+    # --- Queries ---
+
+    def next_pending_task_id(self, exclude_ids: Iterable[str] = ()) -> Optional[str]:
+        """
+        The first pending or in-progress task, in project.json display order (tasks without a display index
+        last, by id), whose own blockers are all done and that is not in `exclude_ids`.
+        """
+        exclude_ids = set(exclude_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, blockers FROM tasks WHERE status IN ({','.join('?' * len(PENDING_TASK_STATUSES))}) "
+                "ORDER BY display_index IS NULL, display_index, id",
+                PENDING_TASK_STATUSES,
+            ).fetchall()
+        for task_id, blockers in rows:
+            if task_id in exclude_ids:
+                continue
+            blockers = [b for b in json.loads(blockers) if isinstance(b, str)]
+            if not blockers:
+                return task_id
+            local = self.feature_statuses(task_id)
+            if all(self.is_blocker_met(b, task_id, local) for b in blockers):
+                return task_id
+        return None
+
+    def is_blocker_met(self, blocker: str, task_id: str, local: Dict[str, str]) -> bool:
+        """
+        Resolves a blocker of task `task_id` (or of one of its features; `local` maps its feature ids to
+        statuses): 'fid' is a feature of the same task (or, failing that, a task id), 'tid.fid' a feature of
+        any task and 'tid' a whole task. Unknown ids are unmet.
+        """
+        blocker_task_id, feature_id = split_blocker(blocker)
+        if blocker_task_id is None or blocker_task_id == task_id:
+            if feature_id in local:
+                return local[feature_id] == DONE
+            if blocker_task_id is not None:
+                return False
+            return self.task_status(feature_id) == DONE
+        return self.feature_status(blocker_task_id, feature_id) == DONE
+
+    def task_status(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def feature_status(self, task_id: str, feature_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM features WHERE task_id = ? AND id = ?", (task_id, feature_id)).fetchone()
+        return row[0] if row else None
+
+    def feature_statuses(self, task_id: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT id, status FROM features WHERE task_id = ?", (task_id,)))
+
+    # --- Snapshot queries ---
+
+    def status_rollup(self) -> Dict[str, Any]:
+        """Counts of tasks and features per status, and of features per status within each task."""
+        with self._lock:
+            tasks = dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
+            features = dict(self._conn.execute("SELECT status, COUNT(*) FROM features GROUP BY status"))
+            by_task: Dict[str, Dict[str, int]] = {}
+            for task_id, status, count in self._conn.execute("SELECT task_id, status, COUNT(*) FROM features GROUP BY task_id, status"):
+                by_task.setdefault(task_id, {})[status] = count
+        return {"tasks": tasks, "features": features, "featuresByTask": by_task}
+
+    def blocked_features(self) -> List[Dict[str, Any]]:
+        """
+        Features marked blocked ('?'), and pending or in-progress ones with unmet blockers, in task then
+        feature display order, each with the blockers that are not done yet.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT f.task_id, f.id, f.status, f.title, f.blockers FROM features f JOIN tasks t ON t.id = f.task_id "
+                f"WHERE f.status = ? OR (f.status IN ({','.join('?' * len(PENDING_TASK_STATUSES))}) AND f.blockers != '[]') "
+                "ORDER BY t.display_index IS NULL, t.display_index, t.id, f.display_index IS NULL, f.display_index, f.id",
+                (BLOCKED, *PENDING_TASK_STATUSES),
+            ).fetchall()
+        blocked = []
+        local_statuses: Dict[str, Dict[str, str]] = {}
+        for task_id, feature_id, status, title, blockers in rows:
+            if task_id not in local_statuses:
+                local_statuses[task_id] = self.feature_statuses(task_id)
+            unmet = [b for b in json.loads(blockers) if isinstance(b, str) and not self.is_blocker_met(b, task_id, local_statuses[task_id])]
+            if status == BLOCKED or unmet:
+                blocked.append({"taskId": task_id, "featureId": feature_id, "status": status, "title": title, "unmetBlockers": unmet})
+        return blocked
+
+    def requirement_coverage(self) -> List[Dict[str, Any]]:
+        """
+        project.json's requirements with the tasks they list (by task id, or by display index), how many of
+        those are done, their feature counts, and which listed tasks do not exist.
+        """
+        with self._lock:
+            requirements = self._conn.execute("SELECT id, status, description, tasks FROM requirements ORDER BY position").fetchall()
+            task_statuses = dict(self._conn.execute("SELECT id, status FROM tasks"))
+            feature_counts = {task_id: (total, done or 0) for task_id, total, done in self._conn.execute(
+                "SELECT task_id, COUNT(*), SUM(status = ?) FROM features GROUP BY task_id", (DONE,))}
+            by_display_index = {index: task_id for task_id, index in self._display_order().items()}
+
+        coverage = []
+        for requirement_id, status, description, refs in requirements:
+            task_ids, missing = [], []
+            for ref in json.loads(refs):
+                if isinstance(ref, str) and ref in task_statuses:
+                    task_ids.append(ref)
+                elif isinstance(ref, int) and by_display_index.get(ref) in task_statuses:
+                    task_ids.append(by_display_index[ref])
+                else:
+                    missing.append(ref)
+            counts = [feature_counts.get(task_id, (0, 0)) for task_id in task_ids]
+            tasks_done = sum(task_statuses[task_id] == DONE for task_id in task_ids)
+            coverage.append({
+                "id": json.loads(requirement_id),
+                "status": status,
+                "description": description,
+                "tasks": task_ids,
+                "missingTasks": missing,
+                "tasksDone": tasks_done,
+                "featuresTotal": sum(total for total, _ in counts),
+                "featuresDone": sum(done for _, done in counts),
+                "complete": bool(task_ids) and not missing and tasks_done == len(task_ids),
+            })
+        return coverage
+
+    def feature_source(self, task_id: str, feature_id: str) -> Optional[Feature]:
+        """
+        One feature as stored in its task.json, read through its byte span instead of parsing the whole file.
+        The file is re-indexed first if it changed since it was indexed or its spans are not known yet.
+        """
+        try:
+            f = open(self.tasks_dir / task_id / TASK_FILE_NAME, "rb")
+        except OSError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT f.byte_offset, f.byte_length, t.mtime_ns, t.size FROM features f JOIN tasks t ON t.id = f.task_id "
+                    "WHERE f.task_id = ? AND f.id = ?", (task_id, feature_id)).fetchone()
+            if row and row[0] is not None and (row[2], row[3]) == (st.st_mtime_ns, st.st_size):
+                f.seek(row[0])
+                return json.loads(f.read(row[1]))
+
+            try:
+                task, spans = parse_task(f.read().decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                print(f"Warning: Could not index task {task_id}. Error: {e}")
+                return None
+        with self._lock, self._conn:
+            self._upsert(task, (st.st_mtime_ns, st.st_size), self._display_order().get(task_id), spans)
+        return next((feature for feature in task.get("features", []) if feature.get("id") == feature_id), None)
@@ -0,0 +1,381 @@
+import copy
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from docs.tasks.task_format import Task
+from scripts.factory_paths import get_data_dir
+
+TASK_FILE_NAME = "task.json"
+
+# (st_mtime_ns, st_size) of a task file as last seen by the store.
+FileStamp = Tuple[int, int]
+# Bumped by every write of a task; a save whose task was read at an older revision is merged first.
+REVISION_FIELD = "revision"
+# Task dicts handed out per task that are remembered with the file text they were read from, so saving one
+# that has since been superseded merges it instead of reverting newer changes.
+MAX_TRACKED_COPIES = 16
+# Task fields merged specially (or not at all) by merge_tasks().
+_STRUCTURAL_FIELDS = ("features", "featureIdToDisplayIndex", REVISION_FIELD)
+_MISSING = object()
+
+
+def _stat_stamp(path: Path) -> Optional[FileStamp]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _default_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# mkstemp creates 0600 files; rewritten task files should keep the permissions a plain open() would give.
+_DEFAULT_FILE_MODE = _default_file_mode()
+
+
+def _file_mode(path: Path) -> int:
+    try:
+        return path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        return _DEFAULT_FILE_MODE
+
+
+@contextmanager
+def _locked(lock_path: Path):
+    """Exclusive advisory lock on `lock_path`, shared between processes."""
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _revision(task: Optional[Task]) -> int:
+    value = task.get(REVISION_FIELD) if isinstance(task, dict) else None
+    return value if isinstance(value, int) else 0
+
+
+def _pick(base: Any, ours: Any, theirs: Any, label: str, conflicts: List[str]) -> Any:
+    """Three-way choice for one field: a side's change wins over the base; when both changed it, ours does."""
+    if ours == base or ours == theirs:
+        return theirs
+    if theirs != base:
+        conflicts.append(label)
+    return ours
+
+
+def _merge_dicts(base: Dict, ours: Dict, theirs: Dict, label: str, conflicts: List[str], skip: Sequence[str] = ()) -> Dict:
+    merged = {}
+    for key in list(theirs) + [k for k in ours if k not in theirs]:
+        if key in skip:
+            continue
+        value = _pick(base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING), f"{label}{key}", conflicts)
+        if value is not _MISSING:
+            merged[key] = value
+    return merged
+
+
+def merge_tasks(base: Task, ours: Task, theirs: Task) -> List[str]:
+    """
+    Merges the changes another writer made (`base` -> `theirs`) into `ours` (our edit of `base`), in place.
+
+    Top-level fields and the fields of each feature (matched by id) are merged one by one: whichever side
+    changed a field wins, and ours does when both did. Features either side added are kept, ones a side
+    removed (and the other did not edit) are dropped, and features added concurrently get display indexes
+    after the existing ones. Returns the fields both sides changed, for reporting.
+    """
+    conflicts: List[str] = []
+    merged = _merge_dicts(base, ours, theirs, "", conflicts, skip=_STRUCTURAL_FIELDS)
+
+    def by_id(task: Task) -> Dict[str, Dict]:
+        return {f.get("id"): f for f in task.get("features", []) or []}
+
+    base_features, our_features, their_features = by_id(base), by_id(ours), by_id(theirs)
+    features = []
+    for feature_id in list(their_features) + [fid for fid in our_features if fid not in their_features]:
+        b = base_features.get(feature_id, _MISSING)
+        o = our_features.get(feature_id, _MISSING)
+        t = their_features.get(feature_id, _MISSING)
+        if o is _MISSING or t is _MISSING:
+            # Added by one side, or removed by one side: removal wins unless the other side edited it
+            present = t if o is _MISSING else o
+            if b is _MISSING:
+                features.append(present)
+            elif present != b:
+                conflicts.append(f"features.{feature_id}")
+                features.append(present)
+            continue
+        fields = _merge_dicts(b if b is not _MISSING else {}, o, t, f"features.{feature_id}.", conflicts)
+        # Keep our dict, so callers holding the feature see the merged record
+        o.clear()
+        o.update(fields)
+        features.append(o)
+    merged["features"] = features
+
+    display = _merge_dicts(base.get("featureIdToDisplayIndex") or {}, ours.get("featureIdToDisplayIndex") or {},
+                           theirs.get("featureIdToDisplayIndex") or {}, "featureIdToDisplayIndex.", [])
+    taken = set()
+    next_index = max([i for i in display.values() if isinstance(i, int)] + [0]) + 1
+    fixed = {}
+    for feature in features:
+        index = display.get(feature.get("id"))
+        if not isinstance(index, int) or index in taken:
+            index, next_index = next_index, next_index + 1
+        taken.add(index)
+        fixed[feature.get("id")] = index
+    if fixed or "featureIdToDisplayIndex" in ours or "featureIdToDisplayIndex" in theirs:
+        merged["featureIdToDisplayIndex"] = fixed
+
+    ours.clear()
+    ours.update(merged)
+    return conflicts
+
+
+class _CachedTask:
+    __slots__ = ("task", "stamp", "dirty", "base", "revision")
+
+    def __init__(self, task: Task, stamp: Optional[FileStamp], dirty: bool = False,
+                 base: Optional[str] = None):
+        self.task = task
+        self.stamp = stamp
+        self.dirty = dirty
+        # The file's text as read or written at `stamp` (None for a task never read), for merges
+        self.base = base
+        self.revision = _revision(task) if base is not None else 0
+
+
+class TaskStore:
+    """
+    In-process write-back cache of parsed task.json files for a single tasks/ directory.
+
+    - Parsed tasks are kept in memory and handed out as the same dict instance on every get(),
+      so callers must save() after mutating a task, exactly as they did with the plain file I/O.
+    - Before returning a clean cached task, the file's mtime/size is checked; if the file was
+      edited outside of this store it is re-read.
+    - save() marks a task dirty. Outside of a batch() it is written immediately; inside a batch()
+      the tasks the thread saved are written once, atomically (temp file + rename), when its outermost batch
+      exits. Batches are per thread, so one agent's batch never holds back another's saves.
+    - `on_write(task, stamp)` is called after each task is written, e.g. to keep the TaskIndex current.
+    - Every write bumps the task's `revision` under an exclusive lock file in .thefactory/locks/. If the file on
+      disk changed since the version a save() started from (another orchestrator wrote it, or git checked out
+      another version), the two versions are merged field by field (merge_tasks) instead of one overwriting
+      the other. Saving a dict handed out before the task was re-read or rewritten merges it the same way.
+    - transaction() is a read-modify-write of one task that other threads and orchestrator processes cannot
+      interleave with: it holds the task's lock file throughout, starts from the file on disk, and commits with one atomic write, or changes nothing if the block raises.
+    """
+
+    def __init__(self, tasks_dir: str | Path, on_write: Optional[Callable[[Task, Optional[FileStamp]], None]] = None):
+        self.tasks_dir = Path(tasks_dir)
+        self.on_write = on_write
+        self._entries: Dict[str, _CachedTask] = {}
+        self._lock = threading.RLock()
+        # Per thread: batch() nesting depth and the ids saved inside the outermost batch
+        self._batches = threading.local()
+        # task_id -> {id(dict): (dict, file text it was last read or written as)}, for every dict handed out
+        self._copies: Dict[str, Dict[int, Tuple[Task, str]]] = {}
+
+    def task_path(self, task_id: str) -> Path:
+        return self.tasks_dir / task_id / TASK_FILE_NAME
+
+    def get(self, task_id: str) -> Task:
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None and entry.dirty:
+                return entry.task
+
+            task_file = self.task_path(task_id)
+            stamp = _stat_stamp(task_file)
+            if stamp is None:
+                self._entries.pop(task_id, None)
+                raise FileNotFoundError(f"Task file not found for task_id: {task_id}")
+            if entry is not None and entry.stamp == stamp:
+                return entry.task
+
+            task, text, stamp = self._read(task_file)
+            self._entries[task_id] = _CachedTask(task, stamp, base=text)
+            self._track(task_id, task, text)
+            return task
+
+    def save(self, task: Task):
+        """Records a task as modified. Written straight away unless inside a batch()."""
+        task_id = task.get("id")
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None and task_id in self._copies:
+                # Dropped by invalidate() since: start from the file again
+                try:
+                    self.get(task_id)
+                except FileNotFoundError:
+                    pass
+                entry = self._entries.get(task_id)
+            if entry is None:
+                self._entries[task_id] = _CachedTask(task, None, dirty=True)
+            elif task is entry.task:
+                entry.dirty = True
+            else:
+                self._merge_into_entry(task_id, entry, task)
+            if getattr(self._batches, "depth", 0):
+                self._batches.saved.add(task_id)
+            else:
+                self._flush_ids([task_id])
+
+    def flush(self):
+        """Writes every dirty task to disk."""
+        with self._lock:
+            self._flush_ids(list(self._entries))
+
+    def _flush_ids(self, task_ids: Iterable[str]):
+        with self._lock:
+            for task_id in task_ids:
+                entry = self._entries.get(task_id)
+                if entry is not None and entry.dirty:
+                    with _locked(self._lock_path(task_id)):
+                        self._commit(task_id, entry)
+
+    @contextmanager
+    def batch(self):
+        """
+        Defers writes of the tasks this thread saves until its outermost batch exits, then writes them once.
+        Batches are per thread: saves of other threads are not held back.
+        """
+        if not getattr(self._batches, "depth", 0):
+            self._batches.depth = 0
+            self._batches.saved = set()
+        self._batches.depth += 1
+        try:
+            yield self
+        finally:
+            self._batches.depth -= 1
+            if self._batches.depth == 0:
+                saved, self._batches.saved = self._batches.saved, set()
+                self._flush_ids(saved)
+
+    @contextmanager
+    def transaction(self, task_id: str):
+        """
+        Yields a working copy of the task; when the block exits normally it is written at once (atomically)
+        and becomes the cached task. The cached dict is updated in place, so earlier get() results see it.
+        """
+        with self._lock, _locked(self._lock_path(task_id)):
+            # get() re-reads the file if another process wrote it since it was cached
+            current = self.get(task_id)
+            working = copy.deepcopy(current)
+            yield working
+
+            current.clear()
+            current.update(working)
+            entry = self._entries[task_id]
+            entry.dirty = True
+            self._commit(task_id, entry)
+
+    def _merge_into_entry(self, task_id: str, entry: _CachedTask, task: Task):
+        """
+        save() of a dict other than the cached one, e.g. one handed out before the file was re-read: its
+        changes since the revision it was read at are merged into the cached task (updated in place), so it
+        cannot revert what was written or saved since.
+        """
+        tracked = self._copies.get(task_id, {}).get(id(task))
+        if tracked is None or tracked[0] is not task:
+            # Not a dict this store handed out (e.g. a caller-built copy): it replaces the cached task
+            entry.task.clear()
+            entry.task.update(task)
+        else:
+            ours = copy.deepcopy(task)
+            conflicts = merge_tasks(json.loads(tracked[1]), ours, entry.task)
+            if conflicts:
+                print(f"Warning: A stale copy of task {task_id} changed {', '.join(conflicts)}, which changed since; kept the copy's values.")
+            entry.task.clear()
+            entry.task.update(ours)
+            entry.task[REVISION_FIELD] = entry.revision
+            # The caller's copy now holds the merged task too, so saving it again merges from here
+            task.clear()
+            task.update(copy.deepcopy(entry.task))
+            if entry.base is not None:
+                self._track(task_id, task, entry.base)
+        entry.task[REVISION_FIELD] = entry.revision
+        entry.dirty = True
+
+    def _track(self, task_id: str, task: Task, text: str):
+        copies = self._copies.setdefault(task_id, {})
+        copies.pop(id(task), None)
+        copies[id(task)] = (task, text)
+        while len(copies) > MAX_TRACKED_COPIES:
+            del copies[next(iter(copies))]
+
+    def _lock_path(self, task_id: str) -> Path:
+        return get_data_dir(self.tasks_dir.parent, "locks") / f"task-{task_id}.lock"
+
+    def _commit(self, task_id: str, entry: _CachedTask):
+        """
+        Writes a dirty entry; the caller holds the task's lock file. If the file changed since it was read
+        (another process wrote it, or git checked out another version, which keeps the revision), the
+        changes are merged in field by field first.
+        """
+        task_file = self.task_path(task_id)
+        revision = entry.revision
+        stamp = _stat_stamp(task_file)
+        if stamp is not None and stamp != entry.stamp:
+            theirs, text, _ = self._read(task_file)
+            if entry.base is not None and text != entry.base:
+                conflicts = merge_tasks(json.loads(entry.base), entry.task, theirs)
+                print(f"Task {task_id} was changed elsewhere (revision {entry.revision} -> {_revision(theirs)}); merged the changes.")
+                if conflicts:
+                    print(f"Warning: Both writers changed {', '.join(conflicts)} in task {task_id}; kept this process's values.")
+            revision = max(revision, _revision(theirs))
+
+        entry.task[REVISION_FIELD] = revision + 1
+        entry.stamp, entry.base = self._write(task_id, entry.task)
+        entry.revision = revision + 1
+        self._track(task_id, entry.task, entry.base)
+        entry.dirty = False
+        if self.on_write:
+            try:
+                self.on_write(entry.task, entry.stamp)
+            except Exception as e:
+                print(f"Warning: Task {task_id} was saved, but a save listener failed. Error: {e}")
+
+    def invalidate(self, task_id: str | None = None):
+        """Drops clean cached entries so the next get() re-reads from disk."""
+        with self._lock:
+            ids = [task_id] if task_id is not None else list(self._entries)
+            for tid in ids:
+                entry = self._entries.get(tid)
+                if entry is not None and not entry.dirty:
+                    del self._entries[tid]
+
+    @staticmethod
+    def _read(task_file: Path) -> Tuple[Task, str, FileStamp]:
+        with open(task_file, "r") as f:
+            # Stamp of the file actually read, even if it is replaced meanwhile
+            st = os.fstat(f.fileno())
+            text = f.read()
+        return json.loads(text), text, (st.st_mtime_ns, st.st_size)
+
+    def _write(self, task_id: str, task: Task) -> Tuple[Optional[FileStamp], str]:
+        task_file = self.task_path(task_id)
+        task_file.parent.mkdir(parents=True, exist_ok=True)
+        text = json.dumps(task, indent=2)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{TASK_FILE_NAME}.", suffix=".tmp", dir=task_file.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(text)
+            os.chmod(tmp_path, _file_mode(task_file))
+            os.replace(tmp_path, task_file)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return _stat_stamp(task_file), text
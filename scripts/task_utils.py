@@ -2,11 +2,23 @@ import json
 import os
 import subprocess
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from docs.tasks.task_format import Task, Feature, Status
+from scripts.context_cache import ContextCache
+from scripts.events import get_event_emitter
+from scripts.file_patcher import PatchRejected, apply_search_replace, parse_search_replace, plan_unified_diff, write_files_atomically
+from scripts.file_reader import read_text_slice
 from scripts.git_manager import GitManager
+from scripts.search_index import SearchIndex
+from scripts.task_graph import TaskGraph
+from scripts.task_index import TaskIndex
+from scripts.task_store import TaskStore
+from scripts.outcome_cache import OutcomeCache
+from scripts.worker_pool import WorkerPool, get_test_workers
 
 # Project root can be dynamically set by the orchestrator to target a child project.
 _PROJECT_ROOT = Path.cwd()
@@ -40,20 +52,76 @@ def _get_test_path(task_id: str, feature_id: str) -> Path:
 
 # --- Core Task I/O ---
 
+# One store and index per tasks/ directory, so switching project roots never mixes cached tasks.
+_TASK_STORES: Dict[Path, TaskStore] = {}
+_TASK_INDEXES: Dict[Path, TaskIndex] = {}
+_TASK_GRAPHS: Dict[Path, TaskGraph] = {}
+
+
+def get_task_index() -> TaskIndex:
+    """Returns the TaskIndex of statuses and display order for the active project root."""
+    tasks_dir = _get_tasks_dir()
+    index = _TASK_INDEXES.get(tasks_dir)
+    if index is None:
+        index = TaskIndex(tasks_dir)
+        _TASK_INDEXES[tasks_dir] = index
+    return index
+
+
+def get_task_graph() -> TaskGraph:
+    """
+    Returns the blocker graph over all tasks of the active project root. It is built once, then kept current
+    by task saves and by the task files the TaskIndex sees changing on disk.
+    """
+    tasks_dir = _get_tasks_dir()
+    index = get_task_index()
+    changed = index.refresh()
+    graph = _TASK_GRAPHS.get(tasks_dir)
+    if graph is None:
+        tasks = []
+        for task_id in index.task_ids():
+            try:
+                tasks.append(get_task(task_id))
+            except (FileNotFoundError, json.JSONDecodeError) as e:
+                print(f"Warning: Could not load task {task_id} into the task graph. Error: {e}")
+        graph = TaskGraph.from_tasks(tasks, index.display_order())
+        _TASK_GRAPHS[tasks_dir] = graph
+        return graph
+
+    graph.task_display_order = index.display_order()
+    for task_id in changed:
+        try:
+            graph.update_task(get_task(task_id))
+        except FileNotFoundError:
+            graph.update_task({"id": task_id, "status": "=", "features": []})
+    return graph
+
+
+def _on_task_written(tasks_dir: Path, task: Task, stamp):
+    get_task_index().update(task, stamp)
+    graph = _TASK_GRAPHS.get(tasks_dir)
+    if graph is not None:
+        graph.update_task(task)
+
+
+def get_task_store() -> TaskStore:
+    """Returns the TaskStore caching tasks for the active project root."""
+    tasks_dir = _get_tasks_dir()
+    store = _TASK_STORES.get(tasks_dir)
+    if store is None:
+        store = TaskStore(tasks_dir, on_write=lambda task, stamp: _on_task_written(tasks_dir, task, stamp))
+        _TASK_STORES[tasks_dir] = store
+    return store
+
+
 def get_task(task_id: str) -> Task:
-    task_file = _get_task_path(task_id)
-    if not task_file.exists():
-        raise FileNotFoundError(f"Task file not found for task_id: {task_id}")
-    with open(task_file, "r") as f:
-        return json.load(f)
+    """Returns the (cached) task. Mutations must be followed by save_task."""
+    return get_task_store().get(task_id)
 
 
 def save_task(task: Task):
-    """Saves a task to its JSON file."""
-    task_file = _get_task_path(task.get('id'))
-    task_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(task_file, "w") as f:
-        json.dump(task, f, indent=2)
+    """Saves a task to its JSON file (deferred to the end of the enclosing TaskStore.batch(), if any)."""
+    get_task_store().save(task)
 
 
 def update_task_status(task_id: str, status: Status) -> Task:
@@ -65,34 +133,141 @@ def update_task_status(task_id: str, status: Status) -> Task:
 
 # --- Developer Agent Tools ---
 
-def read_files(paths: List[str]) -> str:
+_SEARCH_INDEXES: Dict[Path, SearchIndex] = {}
+# Paths written by the file tools in the current agent run, when it records them (see record_changed_paths)
+_CHANGED_PATHS: ContextVar[Optional[Set[str]]] = ContextVar("changed_paths", default=None)
+
+# Caps for agent read_files calls; a single read of a lockfile or bundle must not flood the context.
+READ_MAX_FILE_BYTES = 100 * 1024
+READ_MAX_CALL_BYTES = 400 * 1024
+
+
+def _read_path_spec(spec) -> Tuple[str, str, Dict[str, int]]:
+    """A read_files entry -> (path, result key, range arguments). Entries are paths or {"path", range...} objects."""
+    if isinstance(spec, dict):
+        path = str(spec.get("path", ""))
+        ranges = {k: int(spec[k]) for k in ("start_line", "end_line", "offset", "length") if spec.get(k) is not None}
+        if any(v < 0 for v in ranges.values()):
+            raise ValueError("start_line, end_line, offset and length must not be negative")
+        if ranges.get("end_line", ranges.get("start_line", 0)) < ranges.get("start_line", 0):
+            raise ValueError(f"end_line {ranges['end_line']} is before start_line {ranges['start_line']}")
+        if "start_line" in ranges or "end_line" in ranges:
+            key = f"{path}#L{ranges.get('start_line', 1)}-{ranges.get('end_line', '')}"
+        elif ranges:
+            key = f"{path}#bytes={ranges.get('offset', 0)}-{'' if 'length' not in ranges else ranges.get('offset', 0) + ranges['length']}"
+        else:
+            key = path
+        return path, key, ranges
+    return str(spec), str(spec), {}
+
+
+def _read_path(file_path_str: str, ranges: Optional[Dict[str, int]] = None, max_bytes: Optional[int] = None) -> Tuple[Any, int]:
+    """One read_files entry -> (file text, directory listing or error message; file bytes read)."""
+    target_path = (get_project_root() / file_path_str).resolve()
+    try:
+        # Ensure access stays within project root
+        target_path.relative_to(get_project_root())
+
+        if target_path.is_dir():
+            return [f.name for f in target_path.iterdir()], 0
+        elif target_path.is_file():
+            if max_bytes is not None and max_bytes <= 0:
+                return "[Not read: this call reached its size limit. Read this file in a separate call.]", 0
+            return read_text_slice(target_path, max_bytes=max_bytes, **(ranges or {}))
+        else:
+            return "Path not found or is not a regular file/directory.", 0
+
+    except (ValueError, PermissionError):
+        return "SECURITY ERROR: Cannot access path outside project directory.\n", 0
+    except FileNotFoundError:
+        return "Path not found or is not a regular file/directory.", 0
+
+
+def _read_paths(paths: List, max_file_bytes: Optional[int], max_call_bytes: Optional[int]) -> str:
+    content = {}
+    remaining = max_call_bytes
+    for spec in paths:
+        try:
+            file_path_str, key, ranges = _read_path_spec(spec)
+        except (TypeError, ValueError) as e:
+            content[str(spec)] = f"Invalid read request: {e}"
+            continue
+        caps = [cap for cap in (max_file_bytes, remaining) if cap is not None]
+        content[key], read_bytes = _read_path(file_path_str, ranges, min(caps) if caps else None)
+        if remaining is not None:
+            remaining -= read_bytes
+    return json.dumps(content, indent=0)
+
+
+def read_files(paths: List) -> str:
     """
     Retrieves the content of specified paths relative to the current PROJECT ROOT.
     - If a path is a file, its content is returned.
     - If a path is a directory, the names of the files within it are returned as a JSON array string.
     - Paths outside of the project root are blocked for safety.
+    - An entry may also be {"path", "start_line", "end_line"} (1-based, inclusive) or {"path", "offset", "length"}
+      (bytes) to read part of a file; its result key then carries the range, e.g. "a.py#L10-40".
+    - Each file is capped at READ_MAX_FILE_BYTES and the whole call at READ_MAX_CALL_BYTES; cut files end in a
+      marker saying how to read on. Binary files are described instead of returned.
     """
-    content = {}
-    for file_path_str in paths:
-        target_path = (get_project_root() / file_path_str).resolve()
-        try:
-            # Ensure access stays within project root
-            target_path.relative_to(get_project_root())
-
-            if target_path.is_dir():
-                dir_files = [f.name for f in target_path.iterdir()]
-                content[file_path_str] = dir_files
-            elif target_path.is_file():
-                content[file_path_str] = target_path.read_text()
-            else:
-                content[file_path_str] = "Path not found or is not a regular file/directory."
-
-        except (ValueError, PermissionError):
-            content[file_path_str] = "SECURITY ERROR: Cannot access path outside project directory.\n"
-        except FileNotFoundError:
-            content[file_path_str] = "Path not found or is not a regular file/directory."
-        
-    return json.dumps(content, indent=0)
+    return _read_paths(paths, READ_MAX_FILE_BYTES, READ_MAX_CALL_BYTES)
+
+
+_CONTEXT_CACHES: Dict[Path, ContextCache] = {}
+
+
+def get_context_cache() -> ContextCache:
+    """Returns the cache of rendered prompt context for the active project root."""
+    root = get_project_root()
+    cache = _CONTEXT_CACHES.get(root)
+    if cache is None:
+        cache = ContextCache(root, _read_path)
+        _CONTEXT_CACHES[root] = cache
+    return cache
+
+
+@contextmanager
+def record_changed_paths() -> Iterator[Set[str]]:
+    """
+    Records the paths the file tools write, rename or delete within the block (in this thread and the tool
+    calls it starts). finish_feature/block_feature then commit only those paths and the task file instead of
+    the whole working tree, so agents sharing a working tree do not commit each other's half-written files.
+    """
+    changed: Set[str] = set()
+    token = _CHANGED_PATHS.set(changed)
+    try:
+        yield changed
+    finally:
+        _CHANGED_PATHS.reset(token)
+
+
+def _paths_to_stage(task_id: str) -> List[str]:
+    changed = _CHANGED_PATHS.get()
+    if changed is None:
+        return ['.']
+    task_path = str(get_task_store().task_path(task_id).resolve().relative_to(get_project_root()))
+    return sorted(changed | {task_path})
+
+
+def _on_files_changed(*paths: str):
+    changed = _CHANGED_PATHS.get()
+    if changed is not None:
+        changed.update(str(path) for path in paths)
+    root = get_project_root()
+    cache = _CONTEXT_CACHES.get(root)
+    if cache is not None:
+        cache.invalidate(paths)
+    index = _SEARCH_INDEXES.get(root)
+    if index is not None:
+        index.invalidate(paths)
+
+
+def read_context_files(paths: List[str]) -> str:
+    """
+    Like read_files, but without size caps: for the context files the orchestrator puts into the prompt.
+    Served from the ContextCache, so files shared by many features are read and encoded once.
+    """
+    return get_context_cache().render(paths)
 
 def list_files(path: str):
     target_path = (get_project_root() / path).resolve()
@@ -114,6 +289,7 @@ def write_file(filename: str, content: str):
     
     target_file_path.parent.mkdir(exist_ok=True, parents=True)
     target_file_path.write_text(content)
+    _on_files_changed(filename)
     print(f"File securely written to: {filename}")
 
 def rename_file(filename: str, new_filename: str):
@@ -131,6 +307,7 @@ def rename_file(filename: str, new_filename: str):
         raise PermissionError(f"Security violation: Attempted to read outside of project root: {filename}")
     
     src_file_path.rename(target_file_path)
+    _on_files_changed(filename, new_filename)
     print(f"File {filename} securely renamed to: {new_filename}")
 
 def delete_file(filename: str):
@@ -145,81 +322,97 @@ def delete_file(filename: str):
         target_file_path.rmdir()
     else:
         target_file_path.unlink(True)
+    _on_files_changed(filename)
     print(f"File securely deleted: {filename}")
 
 
+def _patch_target(filename: str) -> Path:
+    target_file_path = (get_project_root() / filename).resolve()
+    try:
+        target_file_path.relative_to(get_project_root())
+    except ValueError:
+        raise PermissionError(f"Security violation: Attempted to patch outside of project root: {filename}")
+    return target_file_path
+
+def _read_for_patch(filename: str) -> Optional[str]:
+    target_file_path = _patch_target(filename)
+    if not target_file_path.is_file():
+        return None
+    try:
+        # newline="": patches keep the file's own line endings
+        with open(target_file_path, "r", encoding="utf-8", newline="") as f:
+            return f.read()
+    except UnicodeDecodeError:
+        raise PatchRejected(f"{filename}: not a UTF-8 text file; use write_file instead.")
+
+def _write_patched(changes: Dict[str, Optional[str]], notes: List[str]) -> str:
+    write_files_atomically({_patch_target(filename): text for filename, text in changes.items()})
+    _on_files_changed(*changes)
+    written = [filename for filename, text in changes.items() if text is not None]
+    deleted = [filename for filename, text in changes.items() if text is None]
+    summary = "; ".join(part for part in (written and f"Patched {', '.join(written)}", deleted and f"deleted {', '.join(deleted)}") if part)
+    print(f"Files securely patched: {summary}")
+    return "\n".join([f"{summary}."] + notes)
+
+def apply_patch(patch: str) -> str:
+    """
+    Applies a unified diff (one or more files; a/ and b/ prefixes are fine, /dev/null creates or deletes a file).
+    Hunks are placed near their stated line even if it drifted, tolerating whitespace differences and up to
+    two mismatched context lines. All files are written or none: if any hunk does not match, nothing changes
+    and the result lists each rejected hunk with the closest line found, so it can be fixed and resent.
+    """
+    try:
+        changes, notes = plan_unified_diff(patch, _read_for_patch)
+    except PatchRejected as e:
+        return f"REJECTED, no file was changed:\n{e}"
+    return _write_patched(changes, notes)
+
+def edit_file(filename: str, edits) -> str:
+    """
+    Replaces text in one file. `edits` is either search/replace blocks
+    ('<<<<<<< SEARCH' / '=======' / '>>>>>>> REPLACE') or a list of {"search": str, "replace": str}. Every
+    search text must occur exactly once; an empty search writes a new file. All edits apply or none do.
+    """
+    try:
+        if isinstance(edits, str):
+            pairs = parse_search_replace(edits)
+        else:
+            pairs = [(str(e.get("search", "")), str(e.get("replace", ""))) for e in edits]
+        original = _read_for_patch(filename)
+        updated, notes = apply_search_replace(original or "", pairs, filename)
+    except PatchRejected as e:
+        return f"REJECTED, no file was changed:\n{e}"
+    except (AttributeError, TypeError):
+        return 'REJECTED, no file was changed:\nedits must be search/replace blocks or a list of {"search": ..., "replace": ...}.'
+    return _write_patched({filename: updated}, notes)
+
+
+def get_search_index() -> SearchIndex:
+    """Returns the persistent search index for the active project root."""
+    root = get_project_root()
+    index = _SEARCH_INDEXES.get(root)
+    if index is None:
+        index = SearchIndex(root)
+        _SEARCH_INDEXES[root] = index
+    return index
+
+
 def search_files(query: str, path: str = ".") -> List[str]:
     """
     Search for files under the given path (relative to the project root) whose filename OR textual content
-    contains the query (case-insensitive). Returns a list of matching file paths relative to the project root.
+    contains the query (case-insensitive). Returns a list of matching file paths relative to the project root,
+    best matches first.
 
     Notes:
+    - Space-separated terms are alternatives; `a AND b` requires both, `"some phrase"` matches a phrase.
     - Stays sandboxed within the project root. Paths outside are rejected.
     - Skips common large or vendor directories (e.g., .git, node_modules, .venv, dist, build).
     - Skips very large files (>2MB) for content scanning. Filename checks still apply.
-    - Attempts to read files as UTF-8 with errors ignored; binary files may be skipped.
+    - Backed by a trigram index under .thefactory/. Files written with the file tools, and files added, removed
+      or renamed, are picked up by the next search; a file rewritten in place by another process may take up
+      to 30 seconds to be re-indexed.
     """
-    root = get_project_root()
-    start_path = (root / path).resolve()
-
-    try:
-        start_path.relative_to(root)
-    except ValueError:
-        # Access outside project root is not allowed
-        return []
-
-    ignore_dirs = {".git", "node_modules", ".venv", "venv", "dist", "build", "out", ".next", ".cache"}
-    max_content_bytes = 2 * 1024 * 1024  # 2 MB
-
-    queries = (query or "").lower().split(" ")
-    if len(queries) < 1:
-        return []
-
-    matches: List[str] = []
-    seen = set()
-
-    for q in queries:
-        for dirpath, dirnames, filenames in os.walk(start_path):
-            # Prune ignored directories in-place
-            dirnames[:] = [d for d in dirnames if d not in ignore_dirs]
-
-            for fname in filenames:
-                full_path = Path(dirpath) / fname
-                try:
-                    rel_path = str(full_path.relative_to(root))
-                except Exception:
-                    continue
-
-                added = False
-                # Filename match (case-insensitive substring)
-                if q in fname.lower():
-                    if rel_path not in seen:
-                        matches.append(rel_path)
-                        seen.add(rel_path)
-                    added = True
-
-                # Content match (if not already added)
-                if not added:
-                    try:
-                        size = full_path.stat().st_size
-                        if size <= max_content_bytes:
-                            # Best-effort text read
-                            with open(full_path, "rb") as f:
-                                data = f.read(max_content_bytes)
-                            text = data.decode("utf-8", errors="ignore").lower()
-                            if q in text:
-                                if rel_path not in seen:
-                                    matches.append(rel_path)
-                                    seen.add(rel_path)
-                    except Exception:
-                        # Non-readable/binary/permission issues -> skip
-                        pass
-
-            # Optional: cap results to avoid huge outputs
-            if len(matches) >= 500:
-                break
-
-    return matches
+    return get_search_index().search(query, path)
 
 
 def update_feature_status(task_id: str, feature_id: str, status: Status) -> Optional[Feature]:
@@ -236,8 +429,8 @@ def update_feature_status(task_id: str, feature_id: str, status: Status) -> Opti
     return updated_feature
 
 
-def block_feature(task_id: str, feature_id: str, reason: str, agent_type: str, git_manager: GitManager) -> Optional[Feature]:
-    """Sets a feature's status to '?' Blocked when it's blocked."""
+def block_feature(task_id: str, feature_id: str, reason: str, agent_type: str, git_manager: GitManager, push: bool = True) -> Optional[Feature]:
+    """Sets a feature's status to '?' Blocked when it's blocked. With push=False the commit is left for the caller to push."""
     task = get_task(task_id)
     deferred_feature = None
     for feature in task.get("features"):
@@ -250,6 +443,7 @@ def block_feature(task_id: str, feature_id: str, reason: str, agent_type: str, g
     feature_title = ""
     if deferred_feature:
         save_task(task)
+    get_task_store().flush()
 
     if agent_type == 'developer':
         commit_message = f"BLOCKED feat: Complete feature {feature_id} - {feature_title}"
@@ -261,19 +455,21 @@ def block_feature(task_id: str, feature_id: str, reason: str, agent_type: str, g
         commit_message = f"BLOCKED context: Set context for feature {feature_id} - {feature_title}"
     else:
         raise ValueError(f"Unknown agent_type '{agent_type}' called block_feature.")
-    try:
-        git_manager.stage_files(['.'])
-    except Exception as e:
-        print(f"Warning: Could not stage files. Git error: {e}")
-    try:
-        git_manager.commit(commit_message)
-        print(f"Committed changes with message: '{commit_message}'")
-    except Exception as e:
-        print(f"Warning: Git commit failed. Error: {e}")
-    try:
-        git_manager.push()
-    except Exception as e:
-        print(f"Could not push': {e}")
+    with git_manager.lock:
+        try:
+            git_manager.stage_files(_paths_to_stage(task_id))
+        except Exception as e:
+            print(f"Warning: Could not stage files. Git error: {e}")
+        try:
+            git_manager.commit(commit_message)
+            print(f"Committed changes with message: '{commit_message}'")
+        except Exception as e:
+            print(f"Warning: Git commit failed. Error: {e}")
+        if push:
+            try:
+                git_manager.push()
+            except Exception as e:
+                print(f"Could not push': {e}")
 
     print(f"Feature {feature_id} blocked. Reason: {reason}")
     return deferred_feature
@@ -286,21 +482,23 @@ def block_task(task_id: int, reason: str, agent_type: str, git_manager: GitManag
     task["status"] = "?"
     task["rejection"] = f"Blocked: {reason}"
     save_task(task)
+    get_task_store().flush()
 
     commit_message = f"BLOCKED task: {task_id} - {task.get('title')}"
-    try:
-        git_manager.stage_files(['.'])
-    except Exception as e:
-        print(f"Warning: Could not stage files. Git error: {e}")
-    try:
-        git_manager.commit(commit_message)
-        print(f"Committed changes with message: '{commit_message}'")
-    except Exception as e:
-        print(f"Warning: Git commit failed. Error: {e}")
-    try:
-        git_manager.push()
-    except Exception as e:
-        print(f"Could not push': {e}")
+    with git_manager.lock:
+        try:
+            git_manager.stage_files(_paths_to_stage(task_id))
+        except Exception as e:
+            print(f"Warning: Could not stage files. Git error: {e}")
+        try:
+            git_manager.commit(commit_message)
+            print(f"Committed changes with message: '{commit_message}'")
+        except Exception as e:
+            print(f"Warning: Git commit failed. Error: {e}")
+        try:
+            git_manager.push()
+        except Exception as e:
+            print(f"Could not push': {e}")
 
     print(f"Task {task_id} blocked. Reason: {reason}")
     return task
@@ -316,10 +514,27 @@ def _check_and_update_task_completion(task_id: str):
         update_task_status(task_id, "+")
 
 
+def merge_feature_record(task_id: str, feature: Feature) -> Optional[Feature]:
+    """
+    Replaces the stored record of `feature` (matched by id) with the given one, e.g. the copy a
+    scheduler-managed worktree ended up with, and re-checks whether the task is complete.
+    """
+    with get_task_store().batch():
+        task = get_task(task_id)
+        features = task.get("features", [])
+        for idx, existing in enumerate(features):
+            if existing.get("id") == feature.get("id"):
+                features[idx] = feature
+                save_task(task)
+                _check_and_update_task_completion(task_id)
+                return feature
+    return None
+
+
 def finish_feature(task_id: str, feature_id: str, agent_type: str, git_manager: GitManager):
     """
-    Handles the finishing logic for any agent. It stages all current changes,
-    commits them, and updates the feature status according to the agent's role.
+    Handles the finishing logic for any agent. It stages all current changes (only the paths this agent
+    wrote inside record_changed_paths()), commits them, and updates the feature status according to the agent's role.
     """
     task = get_task(task_id)
     feature_title = ""
@@ -328,35 +543,39 @@ def finish_feature(task_id: str, feature_id: str, agent_type: str, git_manager:
             feature_title = f.get('title')
             break
 
-    if agent_type == 'developer':
-        commit_message = f"feat: Complete feature {feature_id} - {feature_title}"
-        update_feature_status(task_id, feature_id, "+")
-        _check_and_update_task_completion(task_id)
-    elif agent_type == 'planner':
-        commit_message = f"plan: Add plan for feature {feature_id} - {feature_title}"
-        update_feature_status(task_id, feature_id, "-")
-    elif agent_type == 'tester':
-        commit_message = f"test: Add tests for feature {feature_id} - {feature_title}"
-        update_feature_status(task_id, feature_id, "-")
-    elif agent_type == 'contexter': 
-        commit_message = f"context: Set context for feature {feature_id} - {feature_title}"
-        update_feature_status(task_id, feature_id, "-")
-    else:
-        raise ValueError(f"Unknown agent_type '{agent_type}' called finish_feature.")
+    with get_task_store().batch():
+        if agent_type == 'developer':
+            commit_message = f"feat: Complete feature {feature_id} - {feature_title}"
+            update_feature_status(task_id, feature_id, "+")
+            _check_and_update_task_completion(task_id)
+        elif agent_type == 'planner':
+            commit_message = f"plan: Add plan for feature {feature_id} - {feature_title}"
+            update_feature_status(task_id, feature_id, "-")
+        elif agent_type == 'tester':
+            commit_message = f"test: Add tests for feature {feature_id} - {feature_title}"
+            update_feature_status(task_id, feature_id, "-")
+        elif agent_type == 'contexter': 
+            commit_message = f"context: Set context for feature {feature_id} - {feature_title}"
+            update_feature_status(task_id, feature_id, "-")
+        else:
+            raise ValueError(f"Unknown agent_type '{agent_type}' called finish_feature.")
+    # The task must be on disk before it is staged, even if the caller holds an outer batch.
+    get_task_store().flush()
 
-    try:
-        git_manager.stage_files(['.'])
-    except Exception as e:
-        print(f"Warning: Could not stage files. Git error: {e}")
-    try:
-        git_manager.commit(commit_message)
-        print(f"Committed changes with message: '{commit_message}'")
-    except Exception as e:
-        print(f"Warning: Git commit failed. Error: {e}")
-    try:
-        git_manager.push()
-    except Exception as e:
-        print(f"Could not push': {e}")
+    with git_manager.lock:
+        try:
+            git_manager.stage_files(_paths_to_stage(task_id))
+        except Exception as e:
+            print(f"Warning: Could not stage files. Git error: {e}")
+        try:
+            git_manager.commit(commit_message)
+            print(f"Committed changes with message: '{commit_message}'")
+        except Exception as e:
+            print(f"Warning: Git commit failed. Error: {e}")
+        try:
+            git_manager.push()
+        except Exception as e:
+            print(f"Could not push': {e}")
         
     return f"Feature {feature_id} finished by {agent_type} and changes committed."
 
@@ -365,6 +584,7 @@ def finish_spec(task_id: str, agent_type: str, git_manager: GitManager):
     """
     Handles the finishing logic for any agent. It stages all current changes.
     """
+    get_task_store().flush()
     try:
         git_manager.stage_files(['.'])
     except Exception as e:
@@ -430,25 +650,47 @@ def delete_test(task_id: str, feature_id: str):
     return f"Test file {test_path} not found."
 
 
+_TEST_CACHES: Dict[Path, OutcomeCache] = {}
+_TEST_WORKER_POOL: Optional[WorkerPool] = None
+
+
+def get_test_worker_pool() -> Optional[WorkerPool]:
+    """The warm worker pool shared by run_test calls, or None if disabled (FACTORY_TEST_WORKERS=0) or fork is unavailable."""
+    global _TEST_WORKER_POOL
+    if _TEST_WORKER_POOL is None and get_test_workers() > 0 and hasattr(os, "fork"):
+        _TEST_WORKER_POOL = WorkerPool(get_test_workers(), python="python3")
+    return _TEST_WORKER_POOL
+
+
+def get_test_cache() -> OutcomeCache:
+    """Returns the dependency-aware test result cache for the active project root."""
+    root = get_project_root()
+    cache = _TEST_CACHES.get(root)
+    if cache is None:
+        cache = OutcomeCache(root, pool=get_test_worker_pool())
+        _TEST_CACHES[root] = cache
+    return cache
+
+
 def run_test(task_id: str, feature_id: str) -> str:
-    """Executes a feature's test script and returns the result."""
+    """
+    Executes a feature's test script and returns the result. If none of the files the test used
+    changed since its last run, the previous result is returned without re-running it.
+    """
     test_path = _get_test_path(task_id, feature_id)
     if not test_path.exists():
         return "FAIL: Test file not found."
     
     try:
         print(f"Running test at {test_path}")
-        result = subprocess.run(
-            ["python3", str(test_path)],
-            capture_output=True,
-            text=True,
-            timeout=30, # 30-second timeout
-            check=False # Do not raise exception on non-zero exit code
-        )
+        with get_event_emitter().span("test", f"{task_id}.{feature_id}") as span:
+            result = get_test_cache().run(test_path, timeout=30, python="python3") # 30-second timeout
+            span.update(cached=result.cached, ok=result.returncode == 0)
+        cached = " (cached: nothing the test depends on changed since its last run)" if result.cached else ""
         if result.returncode == 0:
-            return f"PASS: Test executed successfully.\nOutput:\n{result.stdout}"
+            return f"PASS: Test executed successfully{cached}.\nOutput:\n{result.stdout}"
         else:
-            return f"FAIL: Test failed with exit code {result.returncode}.\nStderr:\n{result.stderr}\nStdout:\n{result.stdout}"
+            return f"FAIL: Test failed with exit code {result.returncode}{cached}.\nStderr:\n{result.stderr}\nStdout:\n{result.stdout}"
     except subprocess.TimeoutExpired:
         return "FAIL: Test execution timed out."
     except Exception as e:
@@ -456,17 +698,36 @@ def run_test(task_id: str, feature_id: str) -> str:
 
 # --- Orchestrator Helpers ---
 
-def find_next_pending_task() -> Optional[Task]: # TODO needs to be updated to take into account project.json ordering
-    """Scans task directories and returns the first task that is pending or in progress."""
+def find_next_pending_task(exclude_ids: set = set()) -> Optional[Task]:
+    """
+    Returns the first pending or in-progress task whose blockers are done, in project.json's
+    taskIdToDisplayIndex order, EXCLUDING any task IDs in `exclude_ids`. Uses the TaskIndex, so only task
+    files changed since the last call are parsed.
+    """
     if not _get_tasks_dir().exists(): return None
-    for task_dir in sorted(_get_tasks_dir().iterdir(), key=lambda x: int(x.name)):
-        if task_dir.is_dir():
-            try:
-                task_id = task_dir.name
-                task = get_task(task_id)
-                if task.get("status") in ["-", "~"]: return task
-            except (ValueError, FileNotFoundError): continue
-    return None
+    index = get_task_index()
+    index.refresh()
+    task_id = index.next_pending_task_id(exclude_ids)
+    if task_id is None:
+        return None
+    try:
+        return get_task(task_id)
+    except FileNotFoundError:
+        return None
+
+
+def get_project_status() -> Dict[str, Any]:
+    """
+    Status rollup, blocked features and requirement coverage of the active project, from the TaskIndex
+    snapshot (only task files changed since the last call are parsed, and task bodies are never loaded).
+    """
+    index = get_task_index()
+    index.refresh()
+    return {
+        "rollup": index.status_rollup(),
+        "blocked": index.blocked_features(),
+        "requirements": index.requirement_coverage(),
+    }
 
 
 def find_next_available_feature(task: Task, exclude_ids: set = set(), ignore_depedencies: bool = False) -> Optional[Feature]:
@@ -476,71 +737,119 @@ def find_next_available_feature(task: Task, exclude_ids: set = set(), ignore_dep
 
     Selection order is determined by Task.featureIdToDisplayIndex. Features with
     missing indices fall back to their original order in task["features"].
+    Blockers may be feature ids of this task, "{task_id}.{feature_id}" or "{task_id}";
+    they are resolved by the project's TaskGraph.
     """
-    # Build quick lookup for completion status
-    completed_feature_ids = {f.get("id") for f in task.get("features") if f.get("status") == "+"}
-
-    # Prepare ordering maps
-    feature_id_to_display_index = task.get("featureIdToDisplayIndex", {}) or {}
-    fallback_order = {f.get("id"): idx for idx, f in enumerate(task.get("features", []))}
-
-    def sort_key(f: Feature):
-        fid = f.get("id")
-        display_idx = feature_id_to_display_index.get(fid)
-        # Use a tuple to ensure stable ordering: first by display index (or large), then by fallback index
-        return (
-            display_idx if isinstance(display_idx, int) else 10**9,
-            fallback_order.get(fid, 10**9)
-        )
-
-    # Filter to candidate features (pending and not excluded)
-    candidates = [
-        f for f in task.get("features", [])
-        if f.get("id") not in exclude_ids and f.get("status") == "-"
-    ]
-
-    for feature in sorted(candidates, key=sort_key):
-        if ignore_depedencies:
-            return feature
-        blockers = feature.get("blockers", [])
-        # Only consider blockers that are plain feature IDs within this task
-        required_ids = [dep_id for dep_id in blockers if isinstance(dep_id, str) and "." not in dep_id]
-        if all(dep_id in completed_feature_ids for dep_id in required_ids):
-            return feature
-
-    return None
-
+    features_by_id = {f.get("id"): f for f in task.get("features", [])}
+    if ignore_depedencies:
+        feature_id_to_display_index = task.get("featureIdToDisplayIndex", {}) or {}
+        fallback_order = {fid: idx for idx, fid in enumerate(features_by_id)}
+
+        def sort_key(f: Feature):
+            fid = f.get("id")
+            display_idx = feature_id_to_display_index.get(fid)
+            # Use a tuple to ensure stable ordering: first by display index (or large), then by fallback index
+            return (
+                display_idx if isinstance(display_idx, int) else 10**9,
+                fallback_order.get(fid, 10**9)
+            )
+
+        candidates = [f for f in features_by_id.values() if f.get("id") not in exclude_ids and f.get("status") == "-"]
+        return min(candidates, key=sort_key, default=None)
+
+    graph = get_task_graph()
+    # The caller's copy may hold changes that are not saved yet
+    graph.update_task(task)
+    ready = graph.ready(task.get("id"), exclude_ids)
+    return features_by_id.get(ready[0].split(".", 1)[1]) if ready else None
 
 def create_feature(task_id: str, title: str, description: str) -> Feature:
     """
     Creates a new feature with a given title, description, and adds it to the specified task.
     This tool automatically generates a new feature ID.
     """
-    task = get_task(task_id)
+    return create_features(task_id, [{"title": title, "description": description}])[0]
 
-    features = task.get("features", [])
 
-    id = str(uuid.uuid4())
+FEATURE_STATUSES = ("+", "~", "-", "?", "=")
+# Fields update_features may set, and how a value is normalized (None rejects it)
+_FEATURE_UPDATE_FIELDS = {
+    "status": lambda v: v if v in FEATURE_STATUSES else None,
+    "plan": lambda v: "\n".join(map(str, v)) if isinstance(v, list) else str(v),
+    "context": lambda v: [str(p) for p in v] if isinstance(v, list) else None,
+    "acceptance": lambda v: [str(c) for c in v] if isinstance(v, list) else None,
+}
 
-    new_feature: Feature = {
-        "id": id,
-        "status": "-",
-        "title": title,
-        "description": description,
-        "plan": "",
-        "context": [],
-        "acceptance": [],
-    }
-    features.append(new_feature)
-    task["features"] = features
 
-    featureIdToDisplayIndex = task.get("featureIdToDisplayIndex", {})
-    featureIdToDisplayIndex[id] = len(features)
-    task["featureIdToDisplayIndex"] = featureIdToDisplayIndex
-    save_task(task)
-    
-    print(f"New feature '{id}' created in task {task_id}.")
-    return new_feature
+def create_features(task_id: str, features: List[Dict[str, Any]]) -> List[Feature]:
+    """
+    Creates several features at once, in order: each entry has a title and description, and optionally
+    plan, context, acceptance and blockers. The task is updated in one transaction and written once.
+    """
+    created = []
+    with get_task_store().transaction(task_id) as task:
+        task_features = task.setdefault("features", [])
+        display = task.get("featureIdToDisplayIndex") or {}
+        for spec in features:
+            new_feature: Feature = {
+                "id": str(uuid.uuid4()),
+                "status": "-",
+                "title": str(spec.get("title", "")),
+                "description": str(spec.get("description", "")),
+                "plan": _FEATURE_UPDATE_FIELDS["plan"](spec.get("plan", "")),
+                "context": list(spec.get("context") or []),
+                "acceptance": list(spec.get("acceptance") or []),
+            }
+            if spec.get("blockers"):
+                new_feature["blockers"] = list(spec["blockers"])
+            task_features.append(new_feature)
+            display[new_feature["id"]] = len(task_features)
+            created.append(new_feature)
+        task["featureIdToDisplayIndex"] = display
+
+    print(f"{len(created)} new feature(s) created in task {task_id}: {', '.join(f['id'] for f in created)}.")
+    return created
+
+
+class _UpdateRejected(Exception):
+    pass
+
+
+def update_features(task_id: str, updates: List[Dict[str, Any]]):
+    """
+    Updates several features at once: each entry is {"id", and any of "status", "plan", "context",
+    "acceptance"}. Either every update applies, in one transaction and one write, or none does and the
+    problems are returned.
+    """
+    errors = []
+    updated = []
+    try:
+        with get_task_store().transaction(task_id) as task:
+            features_by_id = {f.get("id"): f for f in task.get("features", [])}
+            for i, update in enumerate(updates):
+                feature = features_by_id.get(update.get("id")) if isinstance(update, dict) else None
+                if feature is None:
+                    errors.append(f"Update {i + 1}: no feature with id {update.get('id') if isinstance(update, dict) else update!r} in task {task_id}.")
+                    continue
+                for field, value in update.items():
+                    if field == "id":
+                        continue
+                    normalize = _FEATURE_UPDATE_FIELDS.get(field)
+                    normalized = normalize(value) if normalize else None
+                    if normalized is None:
+                        errors.append(f"Update {i + 1}: cannot set {field!r} to {value!r}.")
+                        continue
+                    feature[field] = normalized
+                updated.append(feature)
+            if errors:
+                # Leaving the transaction with an exception discards every change
+                raise _UpdateRejected()
+            if task.get("features") and all(f.get("status") == "+" for f in task["features"]):
+                print(f"All features for task {task_id} are complete. Updating task status to '+'.")
+                task["status"] = "+"
+    except _UpdateRejected:
+        return "REJECTED, nothing was updated:\n" + "\n".join(errors)
+    return updated
 
 
 def update_feature_plan(task_id: str, feature_id: str, plan: any) -> Optional[Feature]:
@@ -0,0 +1,226 @@
+"""
+Warm worker pool for running test scripts without paying interpreter startup and import cost on every run.
+
+Each worker is a long-lived "zygote" interpreter (this file run as a script) that has the common modules
+imported already. For every request it forks a child, which runs the test through dep_tracer.run_traced()
+in its own session with stdin closed and its output captured, so every test still starts from the
+zygote's pristine state. The zygote reports the exit code and output back, and kills the child's process
+group when it exceeds its timeout.
+"""
+import atexit
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+WORKER_SCRIPT_PATH = Path(__file__).resolve()
+# Imported once by every zygote; project modules are never preloaded, so tests always see their current code.
+WARM_IMPORTS = [
+    "json", "re", "subprocess", "pathlib", "typing", "unittest", "tempfile", "shutil", "glob",
+    "datetime", "collections", "itertools", "functools", "dataclasses", "pytest",
+]
+DEFAULT_WORKERS = 1
+
+
+def get_test_workers() -> int:
+    """Number of warm workers (FACTORY_TEST_WORKERS); 0 runs every test in a fresh interpreter."""
+    try:
+        return max(0, int(os.getenv("FACTORY_TEST_WORKERS", DEFAULT_WORKERS)))
+    except ValueError:
+        return DEFAULT_WORKERS
+
+
+class _Worker:
+    def __init__(self, python: str):
+        self.process = subprocess.Popen(
+            [python, str(WORKER_SCRIPT_PATH)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+        )
+
+    def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            self.process.stdin.write(json.dumps(payload) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Test worker {self.process.pid} is gone: {e}") from e
+        if not line:
+            raise RuntimeError(f"Test worker {self.process.pid} exited unexpectedly.")
+        return json.loads(line)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class WorkerPool:
+    """
+    A pool of `size` warm zygote workers; run() takes an idle one, so up to `size` tests run at once.
+    Workers are started on first use and replaced if they die.
+    """
+
+    def __init__(self, size: int = DEFAULT_WORKERS, python: str = sys.executable):
+        self.size = max(1, size)
+        self.python = python
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = []
+        atexit.register(self.close)
+
+    def run(self, root: str | Path, deps_path: str, test_path: str | Path, timeout: Optional[float] = None,
+            cwd: str | Path | None = None) -> Tuple[int, str, str]:
+        """
+        Runs the test traced by dep_tracer in a forked worker child. Returns (exit code, stdout, stderr);
+        raises subprocess.TimeoutExpired on timeout, like subprocess.run.
+        """
+        worker = self._acquire()
+        payload = {
+            "root": str(root), "deps_path": deps_path, "test_path": str(test_path),
+            "cwd": str(cwd or os.getcwd()), "timeout": timeout,
+        }
+        try:
+            response = worker.request(payload)
+        except Exception:
+            self._discard(worker)
+            raise
+        self._idle.put(worker)
+        if response.get("timed_out"):
+            raise subprocess.TimeoutExpired([str(test_path)], timeout, output=response["stdout"], stderr=response["stderr"])
+        return response["returncode"], response["stdout"], response["stderr"]
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._started = 0
+        for worker in workers:
+            worker.close()
+
+    def _acquire(self) -> _Worker:
+        with self._lock:
+            if self._idle.empty() and self._started < self.size:
+                worker = _Worker(self.python)
+                self._workers.append(worker)
+                self._started += 1
+                return worker
+        return self._idle.get()
+
+    def _discard(self, worker: _Worker):
+        worker.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+                self._started -= 1
+
+
+# --- Zygote side (this file run as a script) ---
+
+
+def _wait_child(pid: int, timeout: Optional[float]) -> Optional[int]:
+    """Waits for the child; returns its exit code, or None if it had to be killed after `timeout` seconds."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    pidfd = os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+    try:
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return os.waitstatus_to_exitcode(status)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                try:
+                    os.killpg(pid, 9)
+                except OSError:
+                    pass
+                os.waitpid(pid, 0)
+                return None
+            if pidfd is not None:
+                select.select([pidfd], [], [], remaining)
+            else:
+                time.sleep(0.005 if remaining is None else min(0.005, remaining))
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def _run_child(request: Dict[str, Any], out_fd: int, err_fd: int, base_sys_path: List[str]):
+    """In the forked child: isolate, run the traced test and exit with its code. Never returns."""
+    code = 1
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        os.chdir(request["cwd"])
+        sys.path[:] = base_sys_path
+        from scripts.dep_tracer import run_traced
+        try:
+            run_traced(request["root"], request["deps_path"], request["test_path"])
+            code = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                code = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        atexit._run_exitfuncs()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _read_output(f) -> str:
+    f.seek(0)
+    return f.read().decode("utf-8", errors="replace")
+
+
+def serve():
+    base_sys_path = list(sys.path)
+    sys.path.insert(0, str(WORKER_SCRIPT_PATH.parent.parent))
+    import scripts.dep_tracer  # noqa: F401  (warm for the children)
+    for module in WARM_IMPORTS:
+        try:
+            __import__(module)
+        except Exception:
+            pass
+    # Children only inherit registered exit handlers of the test, not the zygote's
+    atexit._clear()
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+            sys.stdout.flush()
+            pid = os.fork()
+            if pid == 0:
+                _run_child(request, out.fileno(), err.fileno(), base_sys_path)
+            code = _wait_child(pid, request.get("timeout"))
+            response = {
+                "returncode": code if code is not None else -9,
+                "timed_out": code is None,
+                "stdout": _read_output(out),
+                "stderr": _read_output(err),
+            }
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    serve()
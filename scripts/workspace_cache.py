@@ -0,0 +1,119 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: workspaces are not shared between concurrent launches there
+    fcntl = None
+
+DEFAULT_WORKSPACE_CACHE_DIR = Path.home() / ".cache" / "thefactory" / "workspaces"
+# Concurrent launches of the same repository each get their own cached workspace slot.
+MAX_WORKSPACE_SLOTS = 8
+# Untracked files the agent needs that a git checkout does not bring along.
+EXTRA_FILES = [".env"]
+
+
+def _git(repo: Path, *args: str) -> str:
+    result = subprocess.run(["git", "-C", str(repo), *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed in {repo}: {result.stderr.strip()}")
+    return result.stdout
+
+
+def is_git_repo(path: Path) -> bool:
+    return (path / ".git").exists()
+
+
+def _workspace_root(source: Path) -> Path:
+    cache_dir = Path(os.getenv("FACTORY_WORKSPACE_CACHE_DIR", str(DEFAULT_WORKSPACE_CACHE_DIR)))
+    digest = hashlib.sha1(str(source).encode("utf-8")).hexdigest()[:12]
+    return cache_dir / f"{source.name}-{digest}"
+
+
+@contextmanager
+def cached_workspace(source: str | Path) -> Iterator[Path]:
+    """
+    Yields a git worktree of `source` that mirrors its current working tree, reusing a cached one between runs.
+
+    The first launch creates the worktree; later launches reset it to the source's HEAD and only copy over
+    the files that differ from HEAD (modified, added and untracked files; deletions are mirrored too).
+    Ignored files such as node_modules/ or .thefactory/ survive in the workspace, so caches stay warm.
+    As a worktree shares the source repository's refs, branches the agent creates show up in `source`.
+    """
+    source = Path(source).resolve()
+    root = _workspace_root(source)
+    root.mkdir(parents=True, exist_ok=True)
+
+    for slot in range(MAX_WORKSPACE_SLOTS):
+        lock_file = open(root / f"slot-{slot}.lock", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+        try:
+            workspace = root / f"slot-{slot}"
+            sync_worktree(source, workspace)
+            yield workspace
+        finally:
+            lock_file.close()
+        return
+    raise RuntimeError(f"All {MAX_WORKSPACE_SLOTS} cached workspaces of '{source}' are in use.")
+
+
+def sync_worktree(source: Path, workspace: Path):
+    """Creates or resets the worktree at `workspace` so it matches the working tree of `source`."""
+    head = _git(source, "rev-parse", "HEAD").strip()
+    if is_git_repo(workspace):
+        print(f"Reusing cached workspace '{workspace}'")
+        _git(workspace, "checkout", "--force", "--detach", head)
+        _git(workspace, "reset", "--hard", head)
+        _git(workspace, "clean", "-fd")
+    else:
+        print(f"Creating cached workspace '{workspace}'")
+        if workspace.exists():
+            shutil.rmtree(workspace)
+        _git(source, "worktree", "prune")
+        _git(source, "worktree", "add", "--detach", str(workspace), head)
+
+    changed = 0
+    for rel_path in _changed_paths(source):
+        src = source / rel_path
+        dst = workspace / rel_path
+        if src.is_file():
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dst)
+            changed += 1
+        elif not src.exists() and (dst.is_file() or dst.is_symlink()):
+            dst.unlink()
+            changed += 1
+    for name in EXTRA_FILES:
+        if (source / name).is_file():
+            shutil.copy2(source / name, workspace / name)
+    print(f"Workspace is at {head[:10]} with {changed} local change(s) applied.")
+
+
+def _changed_paths(source: Path) -> List[str]:
+    """Paths that differ between HEAD and the working tree, including untracked (not ignored) files."""
+    output = _git(source, "status", "--porcelain", "-z", "--untracked-files=all", "--ignore-submodules=all")
+    paths = []
+    entries = output.split("\0")
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        status, path = entry[:2], entry[3:]
+        if "R" in status or "C" in status:
+            # Renames/copies are followed by their source path, which has gone from the working tree
+            paths.append(entries[i])
+            i += 1
+        paths.append(path)
+    return paths